@@ -0,0 +1,62 @@
+import argparse
+import json
+import sys
+
+# Diffs two result files written by benchmarks.load. Exits with status 1 when a
+# scenario lost more than --threshold percent of its throughput or gained that
+# much p95/p99 latency, so it can gate a commit.
+
+METRICS = (
+    ('throughput_rps', lambda result: result['throughput_rps'], True),
+    ('p50_ms', lambda result: result['latency_ms']['p50'], False),
+    ('p95_ms', lambda result: result['latency_ms']['p95'], False),
+    ('p99_ms', lambda result: result['latency_ms']['p99'], False)
+)
+GATED = ('throughput_rps', 'p95_ms', 'p99_ms')
+
+def change(before, after):
+    if not before:
+        return 0.0
+    return (after - before) / before * 100
+
+def compare(baseline, candidate, threshold):
+    regressions = []
+    print(f"baseline  {baseline['meta'].get('revision')}  {baseline['meta'].get('timestamp')}")
+    print(f"candidate {candidate['meta'].get('revision')}  {candidate['meta'].get('timestamp')}")
+    for key in ('engine', 'transport', 'concurrency', 'seed'):
+        if baseline['meta'].get(key) != candidate['meta'].get(key):
+            print(f"warning: {key} differs ({baseline['meta'].get(key)} vs {candidate['meta'].get(key)})")
+
+    print(f"\n{'scenario':<16}{'metric':<16}{'baseline':>12}{'candidate':>12}{'change':>10}")
+    for name, before in baseline['scenarios'].items():
+        after = candidate['scenarios'].get(name)
+        if after is None:
+            print(f"{name:<16}missing from candidate")
+            continue
+        for metric, value, higher_is_better in METRICS:
+            delta = change(value(before), value(after))
+            worse = -delta if higher_is_better else delta
+            flag = ''
+            if metric in GATED and worse > threshold:
+                flag = '  REGRESSION'
+                regressions.append((name, metric, delta))
+            print(f"{name:<16}{metric:<16}{value(before):>12.1f}{value(after):>12.1f}{delta:>+9.1f}%{flag}")
+        if after.get('errors', 0) > before.get('errors', 0):
+            print(f"{name:<16}{'errors':<16}{before.get('errors', 0):>12}{after['errors']:>12}")
+        if after.get('checks', {}).get('overlapping_bookings'):
+            regressions.append((name, 'overlapping_bookings', after['checks']['overlapping_bookings']))
+            print(f"{name:<16}{'overlaps':<16}{'':>12}{after['checks']['overlapping_bookings']:>12}  DOUBLE BOOKED")
+    return regressions
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Compare two benchmark result files')
+    parser.add_argument('baseline')
+    parser.add_argument('candidate')
+    parser.add_argument('--threshold', type=float, default=10, help='Percent change that counts as a regression')
+    args = parser.parse_args()
+
+    with open(args.baseline) as baseline_file, open(args.candidate) as candidate_file:
+        regressions = compare(json.load(baseline_file), json.load(candidate_file), args.threshold)
+    if regressions:
+        print(f"\n{len(regressions)} regression(s) beyond {args.threshold}%")
+        sys.exit(1)
@@ -0,0 +1,156 @@
+import argparse
+import random
+import time
+import uuid
+from datetime import date, datetime, timedelta
+from decimal import Decimal
+
+# Deterministic dataset for the load tests: the same seed, size and anchor date
+# always produce the same users, vehicles and bookings. Past bookings are
+# completed or cancelled; about half the vehicles also have one confirmed
+# booking in the bookable window after the anchor date.
+
+MODELS = {
+    'small_car': ['Toyota Corolla', 'Honda Civic', 'Nissan Sentra', 'Hyundai Elantra', 'Mazda 3', 'Kia Forte'],
+    'suv': ['Toyota RAV4', 'Honda CR-V', 'Ford Explorer', 'Mazda CX-5', 'Subaru Forester'],
+    'van': ['Honda Odyssey', 'Toyota Sienna', 'Chrysler Pacifica', 'Kia Carnival']
+}
+COLORS = ['White', 'Black', 'Silver', 'Blue', 'Red', 'Gray']
+CHUNK_SIZE = 10000
+
+USER_QUERY = "INSERT INTO users (name, email, phone, created_at) VALUES (%s, %s, %s, %s)"
+
+VEHICLE_QUERY = "INSERT INTO vehicles (type_id, model, year, license_plate, color) VALUES (%s, %s, %s, %s, %s)"
+
+BOOKING_QUERY = """
+INSERT INTO bookings (id, user_id, vehicle_id, pickup_date, return_date, total_amount, status, created_at)
+VALUES (%s, %s, %s, %s, %s, %s, %s, %s)
+"""
+
+def dataset_size(bookings):
+    # About 400 bookings per vehicle and 10 per user
+    return {
+        'bookings': bookings,
+        'vehicles': max(50, bookings // 400),
+        'users': max(100, bookings // 10)
+    }
+
+def generate_users(rng, count, anchor):
+    started = datetime.combine(anchor, datetime.min.time()) - timedelta(days=3 * 365)
+    for i in range(count):
+        created_at = started + timedelta(seconds=rng.randrange(3 * 365 * 86400))
+        yield (f'Customer {i:07d}', f'customer{i}@bench.example.com', f'555{i:07d}', created_at)
+
+def generate_vehicles(rng, count, types):
+    names = sorted(types)
+    for i in range(count):
+        name = names[i % len(names)]
+        yield (types[name]['id'], rng.choice(MODELS[name]), rng.randint(2018, 2024), f'BEN{i:06d}', rng.choice(COLORS))
+
+def generate_bookings(rng, count, vehicles, users, anchor):
+    # Bookings of one vehicle never overlap: each vehicle's history is walked
+    # back from the anchor date with a random gap before every booking
+    per_vehicle, extra = divmod(count, len(vehicles))
+    for index, (vehicle_id, daily_rate) in enumerate(vehicles):
+        if rng.random() < 0.5:
+            pickup = anchor + timedelta(days=rng.randint(0, 5))
+            return_date = pickup + timedelta(days=rng.randint(1, 2))
+            yield (str(uuid.UUID(int=rng.getrandbits(128), version=4)), rng.randint(1, users), vehicle_id,
+                   pickup, return_date, daily_rate * (return_date - pickup).days, 'confirmed',
+                   datetime.combine(anchor, datetime.min.time()))
+
+        return_date = anchor - timedelta(days=1)
+        for _ in range(per_vehicle + (1 if index < extra else 0)):
+            return_date -= timedelta(days=rng.randint(0, 3))
+            pickup = return_date - timedelta(days=rng.randint(1, 7))
+            status = 'cancelled' if rng.random() < 0.1 else 'completed'
+            created_at = datetime.combine(pickup, datetime.min.time()) - timedelta(hours=rng.randint(1, 7 * 24))
+            yield (str(uuid.UUID(int=rng.getrandbits(128), version=4)), rng.randint(1, users), vehicle_id,
+                   pickup, return_date, daily_rate * (return_date - pickup).days, status, created_at)
+            return_date = pickup - timedelta(days=1)
+
+def insert_chunk(db, query, chunk, skip_booking_rules=False):
+    with db.transaction() as tx:
+        if not skip_booking_rules:
+            tx.executemany(query, chunk)
+            return
+        # The before_booking_insert trigger rejects past dates, which is most of the
+        # history; it skips its checks while this session variable is set. Cleared
+        # before the connection goes back to the pool.
+        tx.execute("SET @skip_booking_rules = 1", prepare=False)
+        try:
+            tx.executemany(query, chunk)
+        finally:
+            tx.execute("SET @skip_booking_rules = NULL", prepare=False)
+
+def insert_chunks(db, query, rows, skip_booking_rules=False):
+    inserted = 0
+    chunk = []
+    for row in rows:
+        chunk.append(row)
+        if len(chunk) == CHUNK_SIZE:
+            insert_chunk(db, query, chunk, skip_booking_rules)
+            inserted += len(chunk)
+            chunk = []
+    if chunk:
+        insert_chunk(db, query, chunk, skip_booking_rules)
+        inserted += len(chunk)
+    return inserted
+
+def seed(bookings, seed=42, anchor=None, log=print):
+    # Imported here so callers can configure the database through the environment first
+    from src.catalog import fleet_catalog
+    from src.database import DatabaseManager
+    from src.rollups import daily_rollups
+    from src.versions import table_versions
+
+    anchor = anchor or date.today()
+    size = dataset_size(bookings)
+    rng = random.Random(seed)
+    db = DatabaseManager()
+
+    started = time.perf_counter()
+    insert_chunks(db, USER_QUERY, generate_users(rng, size['users'], anchor))
+    user_count = db.execute_query("SELECT COUNT(*) as count FROM users", fetch=True)[0]['count']
+    log(f"users: {user_count} ({time.perf_counter() - started:.1f}s)")
+
+    types = {row['name']: row for row in db.execute_query("SELECT id, name, daily_rate FROM vehicle_types", fetch=True)}
+    insert_chunks(db, VEHICLE_QUERY, generate_vehicles(rng, size['vehicles'], types))
+    vehicles = [(row['id'], Decimal(str(row['daily_rate']))) for row in db.execute_query(
+        "SELECT v.id, vt.daily_rate FROM vehicles v JOIN vehicle_types vt ON v.type_id = vt.id ORDER BY v.id", fetch=True)]
+    log(f"vehicles: {len(vehicles)} ({time.perf_counter() - started:.1f}s)")
+
+    # SQLite loads no triggers, so only MySQL needs the bypass
+    inserted = insert_chunks(db, BOOKING_QUERY, generate_bookings(rng, bookings, vehicles, user_count, anchor),
+                             skip_booking_rules=db.backend.name == 'mysql')
+    log(f"bookings: {inserted} ({time.perf_counter() - started:.1f}s)")
+
+    # Rollups and change counters, as if the bookings had gone through the API
+    earliest = db.execute_query("SELECT MIN(pickup_date) as earliest FROM bookings", fetch=True)[0]['earliest']
+    if isinstance(earliest, str):
+        earliest = date.fromisoformat(earliest)
+    daily_rollups.rebuild(earliest or anchor, anchor + timedelta(days=14))
+    table_versions.bump('users')
+    table_versions.bump('vehicles')
+    fleet_catalog.invalidate()
+    log(f"rollups rebuilt ({time.perf_counter() - started:.1f}s)")
+
+    return {
+        'seed': seed,
+        'anchor': anchor.isoformat(),
+        'users': user_count,
+        'vehicles': len(vehicles),
+        'bookings': inserted,
+        'first_pickup': (earliest or anchor).isoformat(),
+        'seconds': round(time.perf_counter() - started, 1)
+    }
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Seed the configured database with a deterministic benchmark dataset')
+    parser.add_argument('--bookings', type=int, default=100000, help='Number of bookings, e.g. 100000 to 1000000')
+    parser.add_argument('--seed', type=int, default=42)
+    parser.add_argument('--anchor', help='Date the history ends at (YYYY-MM-DD), defaults to today')
+    args = parser.parse_args()
+
+    anchor = datetime.strptime(args.anchor, '%Y-%m-%d').date() if args.anchor else None
+    print(seed(args.bookings, args.seed, anchor))
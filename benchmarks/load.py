@@ -0,0 +1,373 @@
+import argparse
+import http.client
+import json
+import os
+import platform
+import random
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from datetime import date, datetime, timedelta
+
+# Load tests against the app built by create_app(), driven in-process through
+# Flask's test client or over a local socket through werkzeug's threaded server.
+# Each scenario runs a fixed request mix from several threads; latencies are
+# recorded per request and summarized as throughput and p50/p95/p99.
+
+SCENARIOS = ('availability', 'booking_storm', 'reports', 'users')
+VEHICLE_TYPES = ('small_car', 'suv', 'van')
+
+# Clients
+
+class InProcessClient:
+    def __init__(self, app):
+        self.client = app.test_client()
+
+    def request(self, method, path, body=None, headers=None):
+        response = self.client.open(path, method=method, json=body, headers=headers or {})
+        try:
+            data = response.get_data()
+            return response.status_code, response.headers, data
+        finally:
+            response.close()
+
+    def close(self):
+        pass
+
+class SocketClient:
+    def __init__(self, port):
+        self.port = port
+        self.connection = http.client.HTTPConnection('127.0.0.1', port, timeout=60)
+
+    def request(self, method, path, body=None, headers=None):
+        headers = dict(headers or {})
+        payload = None
+        if body is not None:
+            payload = json.dumps(body)
+            headers['Content-Type'] = 'application/json'
+        try:
+            self.connection.request(method, path, payload, headers)
+            response = self.connection.getresponse()
+        except (http.client.HTTPException, OSError):
+            # The server closed a kept-alive connection; reconnect once
+            self.connection.close()
+            self.connection = http.client.HTTPConnection('127.0.0.1', self.port, timeout=60)
+            self.connection.request(method, path, payload, headers)
+            response = self.connection.getresponse()
+        data = response.read()
+        return response.status, response.headers, data
+
+    def close(self):
+        self.connection.close()
+
+def start_server(app):
+    from werkzeug.serving import WSGIRequestHandler, make_server
+
+    class KeepAliveHandler(WSGIRequestHandler):
+        protocol_version = 'HTTP/1.1'
+
+        def log_request(self, *args, **kwargs):
+            pass
+
+    server = make_server('127.0.0.1', 0, app, threaded=True, request_handler=KeepAliveHandler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+# Request mixes: each returns (label, method, path, body, headers)
+
+def availability_request(rng, state, context):
+    today = date.today()
+    pickup = today + timedelta(days=rng.randint(0, 7))
+    path = f'/vehicles/availability?pickup_date={pickup}&return_date={pickup + timedelta(days=rng.randint(1, 7))}'
+    roll = rng.random()
+    if roll < 0.55:
+        return 'availability', 'GET', path, None, None
+    if roll < 0.75:
+        return 'availability_type', 'GET', f'{path}&type={rng.choice(VEHICLE_TYPES)}', None, None
+    if roll < 0.85:
+        return 'availability_vehicle', 'GET', f'{path}&vehicle_id={rng.choice(context["vehicle_ids"])}', None, None
+    # A client polling the same search with the ETag it was given
+    path = f'/vehicles/availability?pickup_date={today}&return_date={today + timedelta(days=3)}'
+    etag = state.get(path)
+    return 'availability_revalidate', 'GET', path, None, {'If-None-Match': etag} if etag else None
+
+def booking_request(rng, state, context):
+    pickup = date.today() + timedelta(days=rng.randint(0, 6))
+    body = {
+        'user_id': rng.randint(1, context['users']),
+        'vehicle_id': rng.choice(context['storm_vehicle_ids']),
+        'pickup_date': pickup.isoformat(),
+        'return_date': (pickup + timedelta(days=rng.randint(1, 3))).isoformat()
+    }
+    return 'create_booking', 'POST', '/bookings', body, None
+
+def report_request(rng, state, context):
+    first, last = context['history']
+    day = first + timedelta(days=rng.randrange((last - first).days + 1))
+    roll = rng.random()
+    if roll < 0.5:
+        return 'daily_report', 'GET', f'/reports/daily?date={day}', None, None
+    if roll < 0.65:
+        return 'daily_report_type', 'GET', f'/reports/daily?date={day}&vehicle_type={rng.choice(VEHICLE_TYPES)}', None, None
+    if roll < 0.8:
+        return 'daily_report_csv', 'GET', f'/reports/daily?date={day}&stream=csv', None, None
+    date_from = min(day, last - timedelta(days=29))
+    return 'summary_report', 'GET', f'/reports/summary?from={date_from}&to={date_from + timedelta(days=29)}', None, None
+
+def users_request(rng, state, context):
+    # Walk the listing page by page, restarting now and then
+    cursor = state.get('cursor')
+    if cursor and rng.random() < 0.8:
+        return 'users_next_page', 'GET', f'/users?limit=500&cursor={cursor}', None, None
+    if rng.random() < 0.3:
+        return 'users_by_name', 'GET', f'/users?limit=100&name=Customer%20{rng.randint(0, 99):02d}', None, None
+    return 'users_first_page', 'GET', '/users?limit=500', None, None
+
+MIXES = {
+    'availability': availability_request,
+    'booking_storm': booking_request,
+    'reports': report_request,
+    'users': users_request
+}
+
+# Runner
+
+def percentile(sorted_values, fraction):
+    if not sorted_values:
+        return 0.0
+    index = min(int(round(fraction * (len(sorted_values) - 1))), len(sorted_values) - 1)
+    return sorted_values[index]
+
+def latency_summary(latencies):
+    latencies = sorted(latencies)
+    return {
+        'p50': round(percentile(latencies, 0.5), 3),
+        'p95': round(percentile(latencies, 0.95), 3),
+        'p99': round(percentile(latencies, 0.99), 3),
+        'max': round(latencies[-1], 3) if latencies else 0.0,
+        'mean': round(sum(latencies) / len(latencies), 3) if latencies else 0.0
+    }
+
+def run_worker(make_client, mix, context, seed, deadline, warmup_until, request_budget, samples, lock):
+    rng = random.Random(seed)
+    client = make_client()
+    state = {}
+    local = []
+    try:
+        while time.perf_counter() < deadline:
+            if request_budget is not None:
+                with lock:
+                    if request_budget[0] <= 0:
+                        break
+                    request_budget[0] -= 1
+            label, method, path, body, headers = mix(rng, state, context)
+            started = time.perf_counter()
+            try:
+                status, response_headers, data = client.request(method, path, body, headers)
+            except Exception:
+                status, response_headers = 'exception', {}
+            elapsed_ms = (time.perf_counter() - started) * 1000
+            if started >= warmup_until:
+                local.append((label, status, elapsed_ms))
+            if label == 'availability_revalidate' and response_headers.get('ETag'):
+                state[path] = response_headers.get('ETag')
+            elif label in ('users_first_page', 'users_next_page'):
+                state['cursor'] = response_headers.get('X-Next-Cursor')
+    finally:
+        client.close()
+        with lock:
+            samples.extend(local)
+
+def run_scenario(name, make_client, context, args):
+    samples = []
+    lock = threading.Lock()
+    started = time.perf_counter()
+    warmup_until = started + args.warmup
+    deadline = warmup_until + args.duration
+    request_budget = [args.requests] if args.requests else None
+    if request_budget:
+        deadline = float('inf')
+        warmup_until = started
+    workers = [
+        threading.Thread(target=run_worker, args=(
+            make_client, MIXES[name], context, args.seed * 1000 + index,
+            deadline, warmup_until, request_budget, samples, lock))
+        for index in range(args.concurrency)
+    ]
+    for worker in workers:
+        worker.start()
+    for worker in workers:
+        worker.join()
+    elapsed = time.perf_counter() - max(warmup_until, started)
+
+    statuses = {}
+    endpoints = {}
+    for label, status, elapsed_ms in samples:
+        statuses[str(status)] = statuses.get(str(status), 0) + 1
+        endpoints.setdefault(label, []).append(elapsed_ms)
+    errors = sum(count for status, count in statuses.items() if status == 'exception' or int(status) >= 500)
+
+    return {
+        'requests': len(samples),
+        'errors': errors,
+        'seconds': round(elapsed, 3),
+        'throughput_rps': round(len(samples) / elapsed, 1) if elapsed else 0.0,
+        'latency_ms': latency_summary([sample[2] for sample in samples]),
+        'status': dict(sorted(statuses.items())),
+        'endpoints': {label: dict(requests=len(latencies), **latency_summary(latencies))
+                      for label, latencies in sorted(endpoints.items())}
+    }
+
+def confirmed_bookings(db, vehicle_ids):
+    from src.database import in_list
+    placeholders, params = in_list(vehicle_ids)
+    query = f"SELECT COUNT(*) as count FROM bookings WHERE vehicle_id IN ({placeholders}) AND status = 'confirmed'"
+    return db.execute_query(query, params, fetch=True)[0]['count']
+
+def overlapping_bookings(db, vehicle_ids):
+    # Integrity check after the storm: confirmed bookings of one vehicle must never overlap
+    from src.database import in_list
+    placeholders, params = in_list(vehicle_ids)
+    query = f"""
+    SELECT COUNT(*) as overlaps
+    FROM bookings a
+    JOIN bookings b ON a.vehicle_id = b.vehicle_id AND a.id < b.id
+    WHERE a.vehicle_id IN ({placeholders})
+    AND a.status = 'confirmed' AND b.status = 'confirmed'
+    AND a.pickup_date < b.return_date AND b.pickup_date < a.return_date
+    """
+    return db.execute_query(query, params, fetch=True)[0]['overlaps']
+
+def git_revision():
+    try:
+        revision = subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], capture_output=True, text=True, check=True).stdout.strip()
+        dirty = subprocess.run(['git', 'status', '--porcelain', '--untracked-files=no'], capture_output=True, text=True).stdout.strip()
+        return revision + ('-dirty' if dirty else '')
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+def configure_environment(args):
+    # Config reads the environment when src is first imported
+    if args.sqlite_path:
+        os.environ['DB_ENGINE'] = 'sqlite'
+        os.environ['SQLITE_PATH'] = args.sqlite_path
+    elif os.environ.get('DB_ENGINE', 'sqlite') == 'sqlite' and os.environ.get('SQLITE_PATH', ':memory:') == ':memory:':
+        # A file, so the pool can hold more than one connection
+        os.environ['DB_ENGINE'] = 'sqlite'
+        os.environ['SQLITE_PATH'] = os.path.join(tempfile.mkdtemp(prefix='vehicle_rental_bench_'), 'bench.db')
+    # Emails stay queued in the outbox and bookings uninvoiced; neither is part of the measurement
+    os.environ.setdefault('OUTBOX_WORKERS', '0')
+    os.environ.setdefault('INVOICE_WORKER_ENABLED', 'False')
+    # Every simulated client shares one address, so per-client rate limits would shed the load itself
+    os.environ.setdefault('RATE_LIMIT_ENABLED', 'False')
+
+def main():
+    parser = argparse.ArgumentParser(description='Load test the API with realistic request mixes')
+    parser.add_argument('--scenario', action='append', choices=SCENARIOS,
+                        help='Scenario to run, may be repeated (default: all)')
+    parser.add_argument('--bookings', type=int, default=100000, help='Bookings to seed')
+    parser.add_argument('--seed', type=int, default=42, help='Seed of the dataset and the request mixes')
+    parser.add_argument('--no-seed', action='store_true', help='Use the data already in the database')
+    parser.add_argument('--sqlite-path', help='SQLite file to use (default: a new temporary file, unless DB_ENGINE=mysql)')
+    parser.add_argument('--transport', choices=('inprocess', 'socket'), default='inprocess')
+    parser.add_argument('--concurrency', type=int, default=8, help='Client threads')
+    parser.add_argument('--duration', type=float, default=10, help='Seconds measured per scenario')
+    parser.add_argument('--warmup', type=float, default=1, help='Seconds run before measuring')
+    parser.add_argument('--requests', type=int, help='Run this many requests per scenario instead of a fixed duration')
+    parser.add_argument('--storm-vehicles', type=int, default=4, help='Vehicles the booking storm competes for')
+    parser.add_argument('--output', help='Write the results as JSON to this file')
+    args = parser.parse_args()
+
+    configure_environment(args)
+    from benchmarks.datagen import seed
+    from src.app import create_app
+    from src.config import Config
+    from src.database import DatabaseManager
+
+    db = DatabaseManager()
+    dataset = None
+    if not args.no_seed:
+        print(f"Seeding {args.bookings} bookings (seed {args.seed}) into {Config.DB_ENGINE}")
+        dataset = seed(args.bookings, args.seed, log=lambda line: print(f'  {line}'))
+
+    app = create_app()
+
+    # What the request mixes pick from
+    users = db.execute_query("SELECT COUNT(*) as count FROM users", fetch=True)[0]['count']
+    vehicle_ids = [row['id'] for row in db.execute_query("SELECT id FROM vehicles ORDER BY id", fetch=True)]
+    bounds = db.execute_query(
+        "SELECT MIN(pickup_date) as first_day, MAX(return_date) as last_day FROM bookings WHERE status <> 'confirmed'", fetch=True)[0]
+    first_day, last_day = bounds['first_day'], bounds['last_day']
+    first_day = date.fromisoformat(first_day) if isinstance(first_day, str) else first_day or date.today()
+    last_day = date.fromisoformat(last_day) if isinstance(last_day, str) else last_day or date.today()
+    # The storm competes for vehicles that are free in the bookable window
+    busy = {row['vehicle_id'] for row in db.execute_query(
+        "SELECT DISTINCT vehicle_id FROM bookings WHERE status = 'confirmed' AND return_date >= %s", (date.today(),), fetch=True)}
+    storm_vehicle_ids = [vehicle_id for vehicle_id in vehicle_ids if vehicle_id not in busy][:args.storm_vehicles] or vehicle_ids[:args.storm_vehicles]
+
+    server = None
+    if args.transport == 'socket':
+        server = start_server(app)
+        make_client = lambda: SocketClient(server.server_port)
+    else:
+        make_client = lambda: InProcessClient(app)
+
+    context = {
+        'users': users,
+        'vehicle_ids': vehicle_ids,
+        'storm_vehicle_ids': storm_vehicle_ids,
+        'history': (max(first_day, last_day - timedelta(days=365)), last_day)
+    }
+
+    results = {
+        'meta': {
+            'revision': git_revision(),
+            'timestamp': datetime.now().isoformat(timespec='seconds'),
+            'python': platform.python_version(),
+            'platform': platform.platform(),
+            'engine': Config.DB_ENGINE,
+            'transport': args.transport,
+            'concurrency': args.concurrency,
+            'duration': args.duration,
+            'warmup': args.warmup,
+            'requests': args.requests,
+            'seed': args.seed,
+            'dataset': dataset
+        },
+        'scenarios': {}
+    }
+
+    for name in args.scenario or SCENARIOS:
+        print(f"Running {name}...")
+        # Counted in the database: warmup requests book too, and the free dates run out quickly
+        confirmed_before = confirmed_bookings(db, storm_vehicle_ids) if name == 'booking_storm' else 0
+        result = run_scenario(name, make_client, context, args)
+        if name == 'booking_storm':
+            result['checks'] = {
+                'vehicles': storm_vehicle_ids,
+                'created': confirmed_bookings(db, storm_vehicle_ids) - confirmed_before,
+                'overlapping_bookings': overlapping_bookings(db, storm_vehicle_ids)
+            }
+        results['scenarios'][name] = result
+        latency = result['latency_ms']
+        print(f"  {result['requests']} requests, {result['errors']} errors, {result['throughput_rps']} req/s, "
+              f"p50 {latency['p50']} ms, p95 {latency['p95']} ms, p99 {latency['p99']} ms")
+        if name == 'booking_storm':
+            print(f"  {result['checks']['created']} bookings created, "
+                  f"{result['checks']['overlapping_bookings']} overlapping")
+
+    if server is not None:
+        server.shutdown()
+
+    if args.output:
+        with open(args.output, 'w') as output:
+            json.dump(results, output, indent=2, sort_keys=True)
+        print(f"Results written to {args.output}")
+    else:
+        json.dump(results, sys.stdout, indent=2, sort_keys=True)
+        print()
+
+if __name__ == '__main__':
+    main()
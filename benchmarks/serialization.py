@@ -0,0 +1,88 @@
+import argparse
+import time
+import uuid
+from datetime import date, datetime, timedelta
+from decimal import Decimal
+from flask import Flask
+from flask.json.provider import DefaultJSONProvider
+from src.schemas import DailyReportResponse, UserResponse
+from src.serialization import OrjsonProvider, RowSerializer, orjson
+
+# Rows shaped like the database returns them for GET /users and /reports/daily
+
+def user_rows(count):
+    created_at = datetime(2024, 1, 1, 9, 30)
+    return [{
+        'id': i + 1,
+        'name': f'Customer {i}',
+        'email': f'customer{i}@example.com',
+        'phone': '5550100000',
+        'created_at': created_at + timedelta(minutes=i),
+        'updated_at': created_at + timedelta(minutes=i)
+    } for i in range(count)]
+
+def report_rows(count):
+    pickup_date = date(2024, 6, 1)
+    return [{
+        'booking_id': str(uuid.uuid4()),
+        'pickup_date': pickup_date,
+        'return_date': pickup_date + timedelta(days=3),
+        'total_amount': Decimal('240.00'),
+        'status': 'confirmed',
+        'customer_name': f'Customer {i}',
+        'customer_email': f'customer{i}@example.com',
+        'vehicle_model': 'Toyota RAV4',
+        'license_plate': f'PLT{i:05d}',
+        'vehicle_type': 'suv',
+        'capacity': 7
+    } for i in range(count)]
+
+def measure(fn, rows, repeat):
+    """Best of repeat runs, in rows per second"""
+    best = None
+    for _ in range(repeat):
+        started = time.perf_counter()
+        fn(rows)
+        elapsed = time.perf_counter() - started
+        best = elapsed if best is None else min(best, elapsed)
+    return len(rows) / best
+
+def main():
+    parser = argparse.ArgumentParser(description='Rows/sec of response serialization, before and after the fast path')
+    parser.add_argument('--rows', type=int, default=10000)
+    parser.add_argument('--repeat', type=int, default=5)
+    args = parser.parse_args()
+
+    app = Flask(__name__)
+    default_provider = DefaultJSONProvider(app)
+    fast_provider = OrjsonProvider(app) if orjson is not None else default_provider
+    if orjson is None:
+        print('orjson is not installed; the fast path uses the default JSON provider')
+
+    # Same serializers as the routes: user rows are trusted, report rows are validated
+    cases = [
+        ('users', RowSerializer(UserResponse, validate=False), user_rows(args.rows)),
+        ('daily report', RowSerializer(DailyReportResponse), report_rows(args.rows))
+    ]
+    print(f"{'payload':<14} {'path':<8} {'validate':>12} {'encode':>12} {'total':>12}  (rows/sec)")
+    for name, serializer, rows in cases:
+        model = serializer.model
+        validated = serializer.dump(rows)
+
+        before_validate = lambda rows: [model(**row).model_dump() for row in rows]
+        before_encode = lambda rows: default_provider.dumps(rows, separators=(',', ':'))
+        after_validate = serializer.dump
+        after_encode = fast_provider.dumps
+
+        results = {
+            'before': (measure(before_validate, rows, args.repeat), measure(before_encode, validated, args.repeat),
+                       measure(lambda rows: before_encode(before_validate(rows)), rows, args.repeat)),
+            'after': (measure(after_validate, rows, args.repeat), measure(after_encode, validated, args.repeat),
+                      measure(lambda rows: after_encode(after_validate(rows)), rows, args.repeat))
+        }
+        for path, (validate, encode, total) in results.items():
+            print(f'{name:<14} {path:<8} {validate:>12,.0f} {encode:>12,.0f} {total:>12,.0f}')
+        print(f"{name:<14} {'speedup':<8} {results['after'][2] / results['before'][2]:>38.1f}x")
+
+if __name__ == '__main__':
+    main()
@@ -96,6 +96,59 @@ CREATE TABLE IF NOT EXISTS invoices (
     CONSTRAINT chk_invoice_total CHECK (total_amount >= amount)
 );
 
+-- Daily Booking Rollups Table (totals per day and vehicle type, kept up to date by the API)
+CREATE TABLE IF NOT EXISTS daily_booking_rollups (
+    rollup_date DATE NOT NULL,
+    vehicle_type VARCHAR(50) NOT NULL,
+    booking_count INT NOT NULL DEFAULT 0,
+    pickup_count INT NOT NULL DEFAULT 0,
+    return_count INT NOT NULL DEFAULT 0,
+    revenue DECIMAL(12,2) NOT NULL DEFAULT 0,
+    vehicles_in_use INT NOT NULL DEFAULT 0,
+    updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP ON UPDATE CURRENT_TIMESTAMP,
+
+    PRIMARY KEY (rollup_date, vehicle_type)
+);
+
+-- Table Versions (change counters bumped by the API on writes, used for ETags)
+CREATE TABLE IF NOT EXISTS table_versions (
+    table_name VARCHAR(64) PRIMARY KEY,
+    version BIGINT NOT NULL DEFAULT 0
+);
+
+-- Invoice Sequences (next free invoice number; the invoice pipeline reserves numbers in blocks)
+CREATE TABLE IF NOT EXISTS invoice_sequences (
+    name VARCHAR(32) PRIMARY KEY,
+    next_value BIGINT NOT NULL
+);
+
+-- Idempotency Keys (responses to retried POST requests, used when IDEMPOTENCY_SHARED is on;
+-- a row without a status code is a request still in flight)
+CREATE TABLE IF NOT EXISTS idempotency_keys (
+    idempotency_key VARCHAR(300) PRIMARY KEY,
+    request_hash CHAR(64) NOT NULL,
+    status_code INT NULL,
+    content_type VARCHAR(100) NULL,
+    body MEDIUMTEXT NULL,
+    expires_at TIMESTAMP NOT NULL,
+    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+);
+
+-- Email Outbox Table (messages queued by the API and sent by background workers)
+CREATE TABLE IF NOT EXISTS email_outbox (
+    id INT PRIMARY KEY AUTO_INCREMENT,
+    recipient VARCHAR(150) NOT NULL,
+    subject VARCHAR(255) NOT NULL,
+    body TEXT NOT NULL,
+    status ENUM('pending', 'sending', 'sent', 'failed') DEFAULT 'pending',
+    attempts INT NOT NULL DEFAULT 0,
+    next_attempt_at TIMESTAMP NULL,
+    locked_until TIMESTAMP NULL,
+    last_error VARCHAR(255),
+    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+    sent_at TIMESTAMP NULL
+);
+
 -- Create Indexes for Performance
 -- Note: If indexes already exist, you can safely ignore duplicate key errors
 -- Users table indexes
@@ -124,6 +177,21 @@ CREATE INDEX idx_invoices_booking_id ON invoices(booking_id);
 CREATE INDEX idx_invoices_issued_date ON invoices(issued_date);
 CREATE INDEX idx_invoices_invoice_number ON invoices(invoice_number);
 
+-- Idempotency keys indexes
+CREATE INDEX idx_idempotency_keys_expires_at ON idempotency_keys(expires_at);
+
+-- Email outbox indexes
+CREATE INDEX idx_email_outbox_status ON email_outbox(status, next_attempt_at);
+
+-- Insert invoice number sequence
+INSERT IGNORE INTO invoice_sequences (name, next_value) VALUES ('invoice', 1);
+
+-- Insert table version counters
+INSERT IGNORE INTO table_versions (table_name) VALUES
+('bookings'),
+('users'),
+('vehicles');
+
 -- Insert initial vehicle types
 INSERT IGNORE INTO vehicle_types (name, capacity, daily_rate) VALUES
 ('small_car', 4, 50.00),
@@ -225,40 +293,31 @@ BEGIN
 END //
 DELIMITER ;
 
--- Create triggers for business logic
+-- Create triggers for business logic. Overlapping bookings are rejected by the
+-- API's conditional insert under the vehicle row lock; an overlap scan here would
+-- repeat that range read on every insert. Sessions that load historical data,
+-- such as the benchmark seeder, SET @skip_booking_rules = 1 to bypass the checks.
 DROP TRIGGER IF EXISTS before_booking_insert;
 DELIMITER //
 CREATE TRIGGER before_booking_insert
 BEFORE INSERT ON bookings
 FOR EACH ROW
 BEGIN
-    -- Check rental period constraint (max 7 days)
-    IF DATEDIFF(NEW.return_date, NEW.pickup_date) > 7 THEN
-        SIGNAL SQLSTATE '45000' SET MESSAGE_TEXT = 'Rental period cannot exceed 7 days';
-    END IF;
-
-    -- Check advance booking constraint (max 7 days ahead)
-    IF DATEDIFF(NEW.pickup_date, CURDATE()) > 7 THEN
-        SIGNAL SQLSTATE '45000' SET MESSAGE_TEXT = 'Cannot book more than 7 days in advance';
-    END IF;
-
-    -- Check if dates are in the past
-    IF NEW.pickup_date < CURDATE() THEN
-        SIGNAL SQLSTATE '45000' SET MESSAGE_TEXT = 'Cannot book dates in the past';
-    END IF;
-
-    -- Check vehicle availability
-    IF EXISTS (
-        SELECT 1 FROM bookings
-        WHERE vehicle_id = NEW.vehicle_id
-        AND status = 'confirmed'
-        AND (
-            (pickup_date <= NEW.pickup_date AND return_date >= NEW.pickup_date) OR
-            (pickup_date <= NEW.return_date AND return_date >= NEW.return_date) OR
-            (pickup_date >= NEW.pickup_date AND pickup_date <= NEW.return_date)
-        )
-    ) THEN
-        SIGNAL SQLSTATE '45000' SET MESSAGE_TEXT = 'Vehicle is not available for the selected dates';
+    IF @skip_booking_rules IS NULL THEN
+        -- Check rental period constraint (max 7 days)
+        IF DATEDIFF(NEW.return_date, NEW.pickup_date) > 7 THEN
+            SIGNAL SQLSTATE '45000' SET MESSAGE_TEXT = 'Rental period cannot exceed 7 days';
+        END IF;
+
+        -- Check advance booking constraint (max 7 days ahead)
+        IF DATEDIFF(NEW.pickup_date, CURDATE()) > 7 THEN
+            SIGNAL SQLSTATE '45000' SET MESSAGE_TEXT = 'Cannot book more than 7 days in advance';
+        END IF;
+
+        -- Check if dates are in the past
+        IF NEW.pickup_date < CURDATE() THEN
+            SIGNAL SQLSTATE '45000' SET MESSAGE_TEXT = 'Cannot book dates in the past';
+        END IF;
     END IF;
 END //
 DELIMITER ;
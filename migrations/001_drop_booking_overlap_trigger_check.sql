@@ -0,0 +1,27 @@
+-- Drops the overlap scan from before_booking_insert; the API's conditional
+-- insert already rejects overlapping bookings under the vehicle row lock.
+-- Apply with: mysql -u root -p < migrations/001_drop_booking_overlap_trigger_check.sql
+USE vehicle_rental;
+
+DROP TRIGGER IF EXISTS before_booking_insert;
+DELIMITER //
+CREATE TRIGGER before_booking_insert
+BEFORE INSERT ON bookings
+FOR EACH ROW
+BEGIN
+    -- Check rental period constraint (max 7 days)
+    IF DATEDIFF(NEW.return_date, NEW.pickup_date) > 7 THEN
+        SIGNAL SQLSTATE '45000' SET MESSAGE_TEXT = 'Rental period cannot exceed 7 days';
+    END IF;
+
+    -- Check advance booking constraint (max 7 days ahead)
+    IF DATEDIFF(NEW.pickup_date, CURDATE()) > 7 THEN
+        SIGNAL SQLSTATE '45000' SET MESSAGE_TEXT = 'Cannot book more than 7 days in advance';
+    END IF;
+
+    -- Check if dates are in the past
+    IF NEW.pickup_date < CURDATE() THEN
+        SIGNAL SQLSTATE '45000' SET MESSAGE_TEXT = 'Cannot book dates in the past';
+    END IF;
+END //
+DELIMITER ;
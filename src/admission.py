@@ -0,0 +1,175 @@
+import math
+import threading
+import time
+from collections import OrderedDict
+from flask import g, jsonify, request
+from src.config import Config
+from src.database import DatabaseManager
+from src.metrics import metrics
+
+def check_limit(rate, burst, name):
+    # A rate of 0 would never refill, and a burst below 1 would never allow a request
+    if not rate > 0:
+        raise ValueError(f'Rate limit for {name} must be greater than 0, got {rate}')
+    if not burst >= 1:
+        raise ValueError(f'Burst for {name} must be at least 1, got {burst}')
+    return rate, burst
+
+def parse_route_limits(spec):
+    # "GET /vehicles/availability=10:20,GET /reports/daily=2:5" -> {(method, rule): (rate, burst)}
+    limits = {}
+    for item in filter(None, (part.strip() for part in spec.split(','))):
+        route, _, limit = item.rpartition('=')
+        method, _, rule = route.strip().partition(' ')
+        rate, _, burst = limit.partition(':')
+        limits[(method.upper(), rule.strip())] = check_limit(float(rate), float(burst or rate), route.strip())
+    return limits
+
+# One token bucket per client and route: a bucket holds up to burst tokens,
+# refills at rate tokens per second, and each request takes one
+class TokenBuckets:
+    def __init__(self, rate, burst, route_limits, max_buckets):
+        self.default = check_limit(rate, burst, 'RATE_LIMIT_RATE')
+        self.route_limits = route_limits
+        self.max_buckets = max_buckets
+        self.lock = threading.Lock()
+        self.buckets = OrderedDict()
+        self.evictions = 0
+        self._swept_at = time.monotonic()
+
+    def take(self, client, route):
+        # Returns 0 when a token was taken, otherwise the seconds until one is available
+        rate, burst = self.route_limits.get(route, self.default)
+        key = (client, route)
+        now = time.monotonic()
+        with self.lock:
+            bucket = self.buckets.get(key)
+            tokens = burst if bucket is None else min(burst, bucket[0] + (now - bucket[1]) * rate)
+            if tokens < 1:
+                self._put(key, (tokens, now))
+                return (1 - tokens) / rate
+            self._put(key, (tokens - 1, now))
+            if now - self._swept_at > 60:
+                self._sweep(now)
+        return 0
+
+    def _put(self, key, bucket):
+        # Bounded however many clients show up; the least recently used bucket goes first
+        self.buckets[key] = bucket
+        self.buckets.move_to_end(key)
+        while len(self.buckets) > self.max_buckets:
+            self.buckets.popitem(last=False)
+            self.evictions += 1
+
+    def _sweep(self, now):
+        # A bucket that has refilled is the same as no bucket
+        self._swept_at = now
+        for key, (tokens, updated) in list(self.buckets.items()):
+            rate, burst = self.route_limits.get(key[1], self.default)
+            if tokens + (now - updated) * rate >= burst:
+                del self.buckets[key]
+
+    def __len__(self):
+        return len(self.buckets)
+
+# Sheds load before it reaches the database: clients over their rate get 429,
+# and requests beyond the concurrency cap (the pool size by default) get 503
+# after a short wait, rather than queueing for a connection until the pool times
+# out. Health checks and /metrics are never limited.
+class AdmissionControl:
+    EXEMPT_PREFIXES = ('/health', '/metrics')
+
+    def __init__(self):
+        self.enabled = Config.ADMISSION_ENABLED
+        self.rate_limits = None
+        self.slots = None
+        self.max_concurrency = 0
+        self.stats_lock = threading.Lock()
+
+        # Stats
+        self.admitted = 0
+        self.rate_limited = 0
+        self.overloaded = 0
+        self.in_flight = 0
+
+    def init_app(self, app):
+        if not self.enabled:
+            return
+        if Config.RATE_LIMIT_ENABLED:
+            self.rate_limits = TokenBuckets(
+                Config.RATE_LIMIT_RATE, Config.RATE_LIMIT_BURST, parse_route_limits(Config.RATE_LIMIT_ROUTES),
+                Config.RATE_LIMIT_MAX_BUCKETS)
+        app.before_request(self._admit)
+        app.teardown_request(self._release)
+
+    def _slots(self):
+        # Sized on first use, so building the app opens no database pool
+        if self.slots is None:
+            with self.stats_lock:
+                if self.slots is None:
+                    self.max_concurrency = Config.ADMISSION_MAX_CONCURRENCY or DatabaseManager().pool.size
+                    self.slots = threading.BoundedSemaphore(self.max_concurrency)
+        return self.slots
+
+    def client_id(self):
+        if Config.RATE_LIMIT_CLIENT_HEADER:
+            client = request.headers.get(Config.RATE_LIMIT_CLIENT_HEADER)
+            if client:
+                return client.split(',')[0].strip()
+        return request.remote_addr or 'unknown'
+
+    def _admit(self):
+        if request.path.startswith(self.EXEMPT_PREFIXES):
+            return None
+
+        if self.rate_limits is not None:
+            rule = request.url_rule.rule if request.url_rule is not None else 'unmatched'
+            retry_after = self.rate_limits.take(self.client_id(), (request.method, rule))
+            if retry_after:
+                self._count('rate_limited')
+                return self._reject(429, 'Too many requests, please slow down', retry_after)
+
+        if not self._slots().acquire(timeout=Config.ADMISSION_QUEUE_TIMEOUT):
+            self._count('overloaded')
+            return self._reject(503, 'Server is busy, please retry', 1)
+        g.admission_slot = True
+        self._count('admitted')
+        return None
+
+    def _release(self, exception=None):
+        if g.pop('admission_slot', False):
+            with self.stats_lock:
+                self.in_flight -= 1
+            self.slots.release()
+
+    def _count(self, outcome):
+        with self.stats_lock:
+            if outcome == 'admitted':
+                self.admitted += 1
+                self.in_flight += 1
+            elif outcome == 'rate_limited':
+                self.rate_limited += 1
+            else:
+                self.overloaded += 1
+        metrics.record_admission(outcome)
+
+    def _reject(self, status_code, message, retry_after):
+        response = jsonify({'error': message})
+        response.status_code = status_code
+        response.headers['Retry-After'] = str(max(1, math.ceil(retry_after)))
+        return response
+
+    def stats(self):
+        with self.stats_lock:
+            return {
+                'enabled': self.enabled,
+                'max_concurrency': self.max_concurrency,
+                'in_flight': self.in_flight,
+                'admitted': self.admitted,
+                'rate_limited': self.rate_limited,
+                'overloaded': self.overloaded,
+                'rate_limit_buckets': len(self.rate_limits) if self.rate_limits is not None else 0,
+                'rate_limit_evictions': self.rate_limits.evictions if self.rate_limits is not None else 0
+            }
+
+admission_control = AdmissionControl()
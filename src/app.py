@@ -1,13 +1,82 @@
-from flask import Flask, jsonify
+from flask import Flask, Response, jsonify
 from pydantic import ValidationError
+from src.admission import admission_control
 from src.config import Config
+from src.catalog import fleet_catalog
+from src.database import DatabaseManager, close_request_connection, stick_to_primary
+from src.feed import availability_feed
+from src.idempotency import idempotency_store
+from src.metrics import metrics
+from src.occupancy import occupancy_index
+from src.invoicing import invoice_pipeline
+from src.outbox import email_outbox
+from src.serialization import create_json_provider
+from src.utils import format_validation_errors
 from src.routes.users import users_bp
 from src.routes.vehicles import vehicles_bp
 from src.routes.bookings import bookings_bp
 from src.routes.reports import reports_bp
+from src.versions import table_versions
 
-def create_app():
+def start_services(singletons=True):
+    # Everything that opens database connections or starts threads. The
+    # production server runs this in each worker after forking, and the
+    # singleton services in one worker only.
+    
+    # Load the fleet catalog; requests load it on demand if the database is not up yet
+    try:
+        fleet_catalog.refresh()
+    except Exception as e:
+        print(f"Fleet catalog warm-up failed: {e}")
+    
+    # Reload it when the vehicles counter moves, e.g. after a refresh in another process
+    table_versions.watch('vehicles', fleet_catalog.invalidate)
+    
+    # Warm the availability index, and re-read it when the bookings counter moves,
+    # e.g. after a booking made by another process
+    if Config.OCCUPANCY_INDEX_ENABLED:
+        occupancy_index.start(Config.OCCUPANCY_RECONCILE_INTERVAL)
+        table_versions.watch('bookings', occupancy_index.resync)
+        
+        # Push availability changes from the index to stream subscribers
+        availability_feed.start()
+    
+    # Poll the counters watched above
+    table_versions.start(Config.VERSION_POLL_INTERVAL)
+    
+    if singletons:
+        start_singleton_services()
+
+def start_singleton_services():
+    # Jobs that need to run once, not once per process
+    
+    # Take lagging or unreachable replicas out of rotation
+    DatabaseManager.start_replica_checks(Config.DB_REPLICA_CHECK_INTERVAL)
+    
+    # Send queued emails in the background
+    if Config.OUTBOX_WORKERS > 0:
+        email_outbox.start(Config.OUTBOX_WORKERS)
+    
+    # Invoice new bookings in batches
+    if Config.INVOICE_WORKER_ENABLED:
+        invoice_pipeline.start(Config.INVOICE_INTERVAL)
+
+def metric_gauges():
+    # Read when /metrics is scraped, or when a server worker writes its metrics
+    pool = DatabaseManager().pool_stats()
+    return [
+        ('db_pool_size', 'Maximum pooled connections', 'gauge', pool['size']),
+        ('db_pool_open_connections', 'Open pooled connections', 'gauge', pool['open']),
+        ('db_pool_in_use_connections', 'Pooled connections checked out', 'gauge', pool['in_use']),
+        ('db_pool_checkout_failures_total', 'Checkouts that timed out or failed to connect', 'counter', pool['checkout_failures']),
+        ('db_statement_cache_hits_total', 'Prepared statement cache hits', 'counter', pool['statement_cache']['hits']),
+        ('db_statement_cache_misses_total', 'Prepared statement cache misses', 'counter', pool['statement_cache']['misses']),
+        ('http_admission_in_flight', 'Requests holding an admission slot', 'gauge', admission_control.stats()['in_flight'])
+    ]
+
+def create_app(services=True):
     app = Flask(__name__)
+    app.json = create_json_provider(app)
     
     # Register blueprints
     app.register_blueprint(users_bp)
@@ -15,16 +84,23 @@ def create_app():
     app.register_blueprint(bookings_bp)
     app.register_blueprint(reports_bp)
     
+    # Time requests and count their database round trips
+    metrics.init_app(app)
+    
+    # Shed requests over the rate limits or the concurrency cap before they reach the pool
+    admission_control.init_app(app)
+    
+    # Return the request-scoped database connections to their pools, and keep
+    # clients that wrote reading from the primary
+    app.teardown_appcontext(close_request_connection)
+    app.after_request(stick_to_primary)
+    
+    if services:
+        start_services()
+    
     @app.errorhandler(ValidationError)
     def handle_validation_error(error):
-        error_details = []
-        for err in error.errors():
-            error_details.append({
-                'field': err.get('loc', ['unknown'])[0] if err.get('loc') else 'unknown',
-                'message': err.get('msg', 'Validation error'),
-                'type': err.get('type', 'validation_error')
-            })
-        return jsonify({'error': 'Validation error', 'details': error_details}), 400
+        return jsonify({'error': 'Validation error', 'details': format_validation_errors(error)}), 400
     
     @app.errorhandler(404)
     def not_found(error):
@@ -47,6 +123,39 @@ def create_app():
             }
         }), 200
     
+    @app.route('/health/db', methods=['GET'])
+    def database_health():
+        db = DatabaseManager()
+        return jsonify({'pool': db.pool_stats(), 'replicas': db.replica_stats()}), 200
+    
+    @app.route('/metrics', methods=['GET'])
+    def metrics_endpoint():
+        return Response(metrics.render(metric_gauges()), mimetype='text/plain; version=0.0.4'), 200
+    
+    @app.route('/health/catalog', methods=['GET'])
+    def catalog_health():
+        return jsonify(fleet_catalog.stats()), 200
+    
+    @app.route('/health/feed', methods=['GET'])
+    def feed_health():
+        return jsonify(availability_feed.stats()), 200
+    
+    @app.route('/health/outbox', methods=['GET'])
+    def outbox_health():
+        return jsonify(email_outbox.stats()), 200
+    
+    @app.route('/health/idempotency', methods=['GET'])
+    def idempotency_health():
+        return jsonify(idempotency_store.stats()), 200
+    
+    @app.route('/health/admission', methods=['GET'])
+    def admission_health():
+        return jsonify(admission_control.stats()), 200
+    
+    @app.route('/health/invoices', methods=['GET'])
+    def invoices_health():
+        return jsonify(invoice_pipeline.stats()), 200
+    
     return app
 
 if __name__ == '__main__':
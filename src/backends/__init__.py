@@ -0,0 +1,32 @@
+from src.config import Config
+from src.backends.base import StorageBackend
+
+def create_backend(engine=None):
+    engine = (engine or Config.DB_ENGINE).lower()
+    
+    # Engines are imported lazily so a driver is only required when it is used
+    if engine == 'mysql':
+        from src.backends.mysql import MySQLBackend
+        return MySQLBackend(Config.DB_CONFIG, Config.DB_LOCK_WAIT_TIMEOUT)
+    if engine == 'sqlite':
+        from src.backends.sqlite import SQLiteBackend
+        return SQLiteBackend(Config.SQLITE_PATH, Config.SCHEMA_PATH)
+    
+    raise ValueError(f"Unknown database engine: {engine}")
+
+def create_replica_backends(engine=None):
+    # (name, backend) for each of DB_REPLICAS: host[:port] for MySQL, a database file for SQLite
+    engine = (engine or Config.DB_ENGINE).lower()
+    replicas = []
+    for address in Config.DB_REPLICAS:
+        if engine == 'mysql':
+            from src.backends.mysql import MySQLBackend
+            host, _, port = address.partition(':')
+            config = dict(Config.DB_CONFIG, host=host, port=int(port or Config.DB_CONFIG['port']))
+            replicas.append((address, MySQLBackend(config, Config.DB_LOCK_WAIT_TIMEOUT)))
+        elif engine == 'sqlite':
+            from src.backends.sqlite import SQLiteBackend
+            replicas.append((address, SQLiteBackend(address, Config.SCHEMA_PATH)))
+        else:
+            raise ValueError(f"Unknown database engine: {engine}")
+    return replicas
@@ -0,0 +1,55 @@
+class StorageBackend:
+    name = None
+    
+    # Base class of the driver's exceptions
+    Error = Exception
+    
+    # Upper bound on pooled connections, None when the engine has no limit
+    max_connections = None
+    
+    # Turns a statement into a query returning its plan
+    explain_prefix = 'EXPLAIN'
+    
+    def connect(self):
+        raise NotImplementedError
+    
+    def is_healthy(self, connection):
+        raise NotImplementedError
+    
+    def cursor(self, connection):
+        raise NotImplementedError
+    
+    def prepared_cursor(self, connection):
+        # A cursor that keeps its statement prepared on the server between executions
+        return self.cursor(connection)
+    
+    def stream_cursor(self, connection):
+        # A cursor that fetches rows from the server as they are read
+        raise NotImplementedError
+    
+    def begin(self, connection):
+        raise NotImplementedError
+    
+    def is_lock_error(self, error):
+        # Lock wait timeouts and deadlocks, which are worth a retry by the client
+        return False
+    
+    def is_duplicate_error(self, error):
+        # Unique key violations
+        return False
+    
+    def explain(self, connection, query, params=None):
+        cursor = self.cursor(connection)
+        try:
+            cursor.execute(f'{self.explain_prefix} {self.translate(query)}', params or ())
+            return cursor.fetchall()
+        finally:
+            cursor.close()
+    
+    def replication_lag(self, connection):
+        # Seconds a replica is behind its primary, None when replication is stopped
+        return 0.0
+    
+    def translate(self, query):
+        # Queries are written in the MySQL dialect
+        return query
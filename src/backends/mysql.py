@@ -0,0 +1,66 @@
+import mysql.connector
+from src.backends.base import StorageBackend
+
+# Lock wait timeout, deadlock, and NOWAIT lock failure
+LOCK_ERRORS = (1205, 1213, 3572)
+
+# ER_DUP_ENTRY
+DUPLICATE_ERROR = 1062
+
+class MySQLBackend(StorageBackend):
+    name = 'mysql'
+    Error = mysql.connector.Error
+    
+    def __init__(self, config, lock_wait_timeout):
+        self.config = config
+        
+        # Fail lock waits fast, and let every statement read the latest committed
+        # rows so a locked read-check-insert sequence sees concurrent bookings
+        self.init_command = (
+            f"SET SESSION innodb_lock_wait_timeout = {int(lock_wait_timeout)}, "
+            "SESSION transaction_isolation = 'READ-COMMITTED'"
+        )
+    
+    def connect(self):
+        return mysql.connector.connect(autocommit=True, init_command=self.init_command, **self.config)
+    
+    def is_healthy(self, connection):
+        return connection.is_connected()
+    
+    def cursor(self, connection):
+        return connection.cursor(dictionary=True)
+    
+    def prepared_cursor(self, connection):
+        # Binary protocol: the statement is parsed once and executed with new parameters
+        return connection.cursor(prepared=True, dictionary=True)
+    
+    def stream_cursor(self, connection):
+        return connection.cursor(dictionary=True, buffered=False)
+    
+    def begin(self, connection):
+        connection.start_transaction()
+    
+    def is_lock_error(self, error):
+        return getattr(error, 'errno', None) in LOCK_ERRORS
+    
+    def is_duplicate_error(self, error):
+        return getattr(error, 'errno', None) == DUPLICATE_ERROR
+    
+    def replication_lag(self, connection):
+        cursor = self.cursor(connection)
+        try:
+            try:
+                cursor.execute('SHOW REPLICA STATUS')
+                column = 'Seconds_Behind_Source'
+            except mysql.connector.Error:
+                # Before MySQL 8.0.22
+                cursor.execute('SHOW SLAVE STATUS')
+                column = 'Seconds_Behind_Master'
+            rows = cursor.fetchall()
+        finally:
+            cursor.close()
+        if not rows:
+            # Not a replica, e.g. a stand-in server in development
+            return 0.0
+        lag = rows[0].get(column)
+        return float(lag) if lag is not None else None
@@ -0,0 +1,147 @@
+import re
+import sqlite3
+import uuid
+from datetime import date, datetime
+from decimal import Decimal
+from functools import lru_cache
+from src.backends.base import StorageBackend
+
+# Store dates, timestamps and decimals the way MySQL returns them
+sqlite3.register_adapter(date, lambda v: v.isoformat())
+sqlite3.register_adapter(datetime, lambda v: v.isoformat(' '))
+sqlite3.register_adapter(Decimal, str)
+sqlite3.register_converter('DATE', lambda v: date.fromisoformat(v.decode()))
+sqlite3.register_converter('TIMESTAMP', lambda v: datetime.fromisoformat(v.decode()))
+sqlite3.register_converter('DECIMAL', lambda v: Decimal(v.decode()))
+
+# MySQL -> SQLite rewrites shared by the schema loader and runtime queries
+COMMON_RULES = [
+    (re.compile(r'\bINSERT\s+IGNORE\b', re.I), 'INSERT OR IGNORE'),
+    (re.compile(r'\bCURDATE\(\)', re.I), "DATE('now')"),
+    (re.compile(r'\bNOW\(\)', re.I), 'CURRENT_TIMESTAMP'),
+]
+
+SCHEMA_RULES = COMMON_RULES + [
+    (re.compile(r'\bINT\s+PRIMARY\s+KEY\s+AUTO_INCREMENT\b', re.I), 'INTEGER PRIMARY KEY AUTOINCREMENT'),
+    (re.compile(r'\bAUTO_INCREMENT\b', re.I), ''),
+    (re.compile(r'(\w+)\s+ENUM\(([^)]*)\)', re.I), r'\1 TEXT CHECK (\1 IN (\2))'),
+    (re.compile(r'\bON\s+UPDATE\s+CURRENT_TIMESTAMP\b', re.I), ''),
+    (re.compile(r'\bCREATE\s+INDEX\s+(?!IF\b)', re.I), 'CREATE INDEX IF NOT EXISTS '),
+    (re.compile(r'\bCREATE\s+OR\s+REPLACE\s+VIEW\b', re.I), 'CREATE VIEW IF NOT EXISTS'),
+]
+
+QUERY_RULES = COMMON_RULES + [
+    (re.compile(r'%s'), '?'),
+    (re.compile(r'\s+FROM\s+DUAL\b', re.I), ''),
+    (re.compile(r'\s+FOR\s+(UPDATE|SHARE)(\s+OF\s+\w+(\s*,\s*\w+)*)?(\s+NOWAIT|\s+SKIP\s+LOCKED)?', re.I), ''),
+    (re.compile(r'\bON\s+DUPLICATE\s+KEY\s+UPDATE\b', re.I), 'ON CONFLICT DO UPDATE SET'),
+    (re.compile(r'\bVALUES\((\w+)\)', re.I), r'excluded.\1'),
+]
+
+# Statements with no SQLite equivalent: routines, triggers and database selection
+SKIPPED_STATEMENTS = re.compile(
+    r'^\s*(CREATE\s+DATABASE|USE\s|DROP\s+(PROCEDURE|FUNCTION|TRIGGER))', re.I)
+DELIMITER_BLOCK = re.compile(r'^DELIMITER\s+//.*?^DELIMITER\s+;', re.I | re.M | re.S)
+LINE_COMMENT = re.compile(r'--[^\n]*')
+
+def _apply(rules, sql):
+    for pattern, replacement in rules:
+        sql = pattern.sub(replacement, sql)
+    return sql
+
+@lru_cache(maxsize=512)
+def translate_query(query):
+    return _apply(QUERY_RULES, query)
+
+def translate_schema(script):
+    script = DELIMITER_BLOCK.sub('', script)
+    script = LINE_COMMENT.sub('', script)
+
+    statements = []
+    for statement in script.split(';'):
+        if not statement.strip() or SKIPPED_STATEMENTS.match(statement):
+            continue
+        statements.append(_apply(SCHEMA_RULES, statement).strip())
+    return statements
+
+def _dict_row(cursor, row):
+    return {column[0]: value for column, value in zip(cursor.description, row)}
+
+def _regexp(pattern, value):
+    return value is not None and re.search(pattern, value) is not None
+
+class SQLiteBackend(StorageBackend):
+    name = 'sqlite'
+    Error = sqlite3.Error
+    explain_prefix = 'EXPLAIN QUERY PLAN'
+
+    def __init__(self, path, schema_path):
+        self.schema_path = schema_path
+
+        if path == ':memory:':
+            # A named shared-cache database lives as long as one connection is open,
+            # so keep one aside; writers would lock each other out, so pool just one
+            self.database = f'file:vehicle_rental_{uuid.uuid4().hex}?mode=memory&cache=shared'
+            self.max_connections = 1
+            self._keeper = self._open()
+            self.load_schema(self._keeper)
+        else:
+            self.database = path
+            connection = self._open()
+            connection.execute('PRAGMA journal_mode = WAL')
+            self.load_schema(connection)
+            connection.close()
+
+    def _open(self):
+        connection = sqlite3.connect(
+            self.database,
+            uri=self.database.startswith('file:'),
+            timeout=30,
+            detect_types=sqlite3.PARSE_DECLTYPES,
+            isolation_level=None,
+            check_same_thread=False
+        )
+        connection.row_factory = _dict_row
+        connection.create_function('REGEXP', 2, _regexp, deterministic=True)
+        connection.execute('PRAGMA foreign_keys = ON')
+        return connection
+
+    def load_schema(self, connection):
+        with open(self.schema_path) as schema_file:
+            statements = translate_schema(schema_file.read())
+        for statement in statements:
+            connection.execute(statement)
+
+    def connect(self):
+        return self._open()
+
+    def is_healthy(self, connection):
+        try:
+            connection.execute('SELECT 1')
+            return True
+        except sqlite3.Error:
+            return False
+
+    def cursor(self, connection):
+        return connection.cursor()
+
+    def prepared_cursor(self, connection):
+        # sqlite3 keeps compiled statements in a per-connection cache keyed by SQL text
+        return connection.cursor()
+    
+    def stream_cursor(self, connection):
+        # SQLite cursors step through the result lazily
+        return connection.cursor()
+
+    def begin(self, connection):
+        # Take the write lock up front so concurrent writers queue instead of deadlocking
+        connection.execute('BEGIN IMMEDIATE')
+
+    def is_lock_error(self, error):
+        return isinstance(error, sqlite3.OperationalError) and 'locked' in str(error)
+
+    def is_duplicate_error(self, error):
+        return isinstance(error, sqlite3.IntegrityError) and 'UNIQUE' in str(error)
+
+    def translate(self, query):
+        return translate_query(query)
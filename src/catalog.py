@@ -0,0 +1,164 @@
+import hashlib
+import threading
+import time
+from src.config import Config
+from src.database import DatabaseManager
+
+class VehicleType:
+    __slots__ = ('id', 'name', 'capacity', 'daily_rate')
+
+    def __init__(self, row):
+        self.id = row['id']
+        self.name = row['name']
+        self.capacity = row['capacity']
+        self.daily_rate = row['daily_rate']
+
+class Vehicle:
+    __slots__ = ('id', 'type_id', 'model', 'year', 'license_plate', 'color', 'status',
+                 'created_at', 'updated_at', 'vehicle_type')
+
+    def __init__(self, row, vehicle_type):
+        self.id = row['id']
+        self.type_id = row['type_id']
+        self.model = row['model']
+        self.year = row['year']
+        self.license_plate = row['license_plate']
+        self.color = row['color']
+        self.status = row['status']
+        self.created_at = row['created_at']
+        self.updated_at = row['updated_at']
+        self.vehicle_type = vehicle_type
+
+    def to_dict(self):
+        # Same shape as SELECT v.*, vt.name as type_name, vt.capacity
+        return {
+            'id': self.id,
+            'type_id': self.type_id,
+            'model': self.model,
+            'year': self.year,
+            'license_plate': self.license_plate,
+            'color': self.color,
+            'status': self.status,
+            'created_at': self.created_at,
+            'updated_at': self.updated_at,
+            'type_name': self.vehicle_type.name,
+            'capacity': self.vehicle_type.capacity
+        }
+
+# Immutable view of the fleet; a refresh builds a new one and swaps it in
+class FleetSnapshot:
+    def __init__(self, type_rows, vehicle_rows):
+        self.types = {row['id']: VehicleType(row) for row in type_rows}
+        self.types_by_name = {vehicle_type.name: vehicle_type for vehicle_type in self.types.values()}
+
+        # Ordered by type name and model, like the availability listing
+        self.vehicles = [Vehicle(row, self.types[row['type_id']]) for row in vehicle_rows]
+        self.vehicles.sort(key=lambda vehicle: (vehicle.vehicle_type.name, vehicle.model))
+        self.by_id = {vehicle.id: vehicle for vehicle in self.vehicles}
+        self.by_plate = {vehicle.license_plate: vehicle for vehicle in self.vehicles}
+        self.by_type = {name: [] for name in self.types_by_name}
+        for vehicle in self.vehicles:
+            self.by_type[vehicle.vehicle_type.name].append(vehicle)
+
+        # Identifies the contents, so responses built from the catalog can be tagged with it
+        contents = repr((
+            sorted((t.id, t.name, t.capacity, str(t.daily_rate)) for t in self.types.values()),
+            sorted((v.id, v.type_id, v.model, v.year, v.license_plate, v.color, v.status, str(v.updated_at))
+                   for v in self.vehicles)
+        ))
+        self.digest = hashlib.blake2b(contents.encode(), digest_size=8).hexdigest()
+
+    def select(self, vehicle_type=None, vehicle_id=None):
+        if vehicle_id is not None:
+            vehicle = self.by_id.get(vehicle_id)
+            if vehicle is None or (vehicle_type is not None and vehicle.vehicle_type.name != vehicle_type):
+                return []
+            return [vehicle]
+        if vehicle_type is not None:
+            return self.by_type.get(vehicle_type, [])
+        return self.vehicles
+
+# In-process cache of vehicles and vehicle types. Entries are reloaded after
+# CATALOG_TTL seconds, or on the next access after invalidate().
+class FleetCatalog:
+    TYPES_QUERY = "SELECT id, name, capacity, daily_rate FROM vehicle_types"
+
+    VEHICLES_QUERY = """
+    SELECT id, type_id, model, year, license_plate, color, status, created_at, updated_at
+    FROM vehicles
+    """
+
+    def __init__(self):
+        self.db = DatabaseManager()
+        self.lock = threading.Lock()
+        self._snapshot = None
+        self._expires_at = 0.0
+
+        # Stats
+        self.loads = 0
+        self.load_failures = 0
+        self.invalidations = 0
+        self.last_loaded_at = None
+        self.load_time_ms = 0.0
+
+    def snapshot(self):
+        snapshot = self._snapshot
+        if snapshot is not None and time.monotonic() < self._expires_at:
+            return snapshot
+        try:
+            return self.refresh(stale=snapshot)
+        except Exception as e:
+            if snapshot is None:
+                raise
+            # Keep serving the previous catalog until the database is back
+            print(f"Fleet catalog refresh failed: {e}")
+            return snapshot
+
+    def refresh(self, stale=None):
+        with self.lock:
+            # Another request reloaded the catalog while this one waited
+            if stale is not None and self._snapshot is not stale:
+                return self._snapshot
+
+            started = time.monotonic()
+            type_rows = self.db.execute_query(self.TYPES_QUERY, fetch=True)
+            vehicle_rows = self.db.execute_query(self.VEHICLES_QUERY, fetch=True)
+            if type_rows is None or vehicle_rows is None:
+                self.load_failures += 1
+                self._expires_at = time.monotonic() + min(Config.CATALOG_TTL, 5)
+                raise RuntimeError('could not load vehicles and vehicle types')
+
+            self._snapshot = FleetSnapshot(type_rows, vehicle_rows)
+            self._expires_at = time.monotonic() + Config.CATALOG_TTL
+            self.loads += 1
+            self.last_loaded_at = time.time()
+            self.load_time_ms = round((time.monotonic() - started) * 1000, 3)
+            return self._snapshot
+
+    def invalidate(self):
+        # Call after writing vehicles or vehicle types
+        self._expires_at = 0.0
+        self.invalidations += 1
+
+    def vehicle(self, vehicle_id):
+        vehicle = self.snapshot().by_id.get(vehicle_id)
+        if vehicle is None:
+            # Vehicles added since the last load; callers only ask for ids they know exist
+            vehicle = self.refresh(stale=self._snapshot).by_id.get(vehicle_id)
+        return vehicle
+
+    def stats(self):
+        snapshot = self._snapshot
+        return {
+            'loaded': snapshot is not None,
+            'vehicle_types': len(snapshot.types) if snapshot else 0,
+            'vehicles': len(snapshot.vehicles) if snapshot else 0,
+            'ttl': Config.CATALOG_TTL,
+            'loads': self.loads,
+            'load_failures': self.load_failures,
+            'invalidations': self.invalidations,
+            'load_time_ms': self.load_time_ms,
+            'last_loaded_at': self.last_loaded_at
+        }
+
+fleet_catalog = FleetCatalog()
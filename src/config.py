@@ -13,15 +13,150 @@ class Config:
         'port': int(os.getenv('DB_PORT', 3306))
     }
     
+    # Storage engine: 'mysql', or 'sqlite' for benchmarking without a MySQL server
+    # (SQLITE_PATH may be a file or ':memory:'; tables are loaded from SCHEMA_PATH)
+    DB_ENGINE = os.getenv('DB_ENGINE', 'mysql').lower()
+    SQLITE_PATH = os.getenv('SQLITE_PATH', ':memory:')
+    SCHEMA_PATH = os.getenv('SCHEMA_PATH', os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'database_schema.sql'))
+    
+    # Connection pool configuration
+    DB_POOL_SIZE = int(os.getenv('DB_POOL_SIZE', 10))
+    DB_POOL_TIMEOUT = float(os.getenv('DB_POOL_TIMEOUT', 5))
+    DB_POOL_RECYCLE = int(os.getenv('DB_POOL_RECYCLE', 3600))
+    DB_POOL_PING_INTERVAL = float(os.getenv('DB_POOL_PING_INTERVAL', 1))
+    
+    # Read replicas, comma separated: host[:port] for MySQL, database files for SQLite.
+    # Reads go to a replica unless the request, client or thread wrote within the last
+    # DB_STICKY_PRIMARY_SECONDS; replicas that are down or more than DB_REPLICA_MAX_LAG
+    # seconds behind are left out until a check (every DB_REPLICA_CHECK_INTERVAL seconds) passes
+    DB_REPLICAS = [address.strip() for address in os.getenv('DB_REPLICAS', '').split(',') if address.strip()]
+    DB_REPLICA_MAX_LAG = float(os.getenv('DB_REPLICA_MAX_LAG', 5))
+    DB_REPLICA_CHECK_INTERVAL = float(os.getenv('DB_REPLICA_CHECK_INTERVAL', 5))
+    DB_STICKY_PRIMARY_SECONDS = float(os.getenv('DB_STICKY_PRIMARY_SECONDS', 10))
+    
+    # Prepared statements cached per pooled connection (0 disables the cache)
+    DB_STATEMENT_CACHE_SIZE = int(os.getenv('DB_STATEMENT_CACHE_SIZE', 64))
+    
+    # Seconds a transaction waits for a row lock before giving up
+    DB_LOCK_WAIT_TIMEOUT = int(os.getenv('DB_LOCK_WAIT_TIMEOUT', 3))
+    
+    # Seconds the in-process fleet catalog (vehicles and rates) is served before reloading
+    CATALOG_TTL = float(os.getenv('CATALOG_TTL', 300))
+    
+    # Seconds between polls of the table_versions counters; the catalog reloads when
+    # the vehicles counter moves, the occupancy index when the bookings counter does
+    # (0 disables)
+    VERSION_POLL_INTERVAL = float(os.getenv('VERSION_POLL_INTERVAL', 1))
+    
+    # In-memory occupancy index for availability checks, also re-read every
+    # OCCUPANCY_RECONCILE_INTERVAL seconds for bookings changed outside the API (0 for never)
+    OCCUPANCY_INDEX_ENABLED = os.getenv('OCCUPANCY_INDEX_ENABLED', 'True').lower() == 'true'
+    OCCUPANCY_RECONCILE_INTERVAL = int(os.getenv('OCCUPANCY_RECONCILE_INTERVAL', 60))
+    
+    # Availability change stream (SSE): subscribers, per-subscriber backlog, and seconds
+    # between heartbeats, before a stream is closed and before clients reconnect
+    AVAILABILITY_STREAM_MAX_SUBSCRIBERS = int(os.getenv('AVAILABILITY_STREAM_MAX_SUBSCRIBERS', 200))
+    AVAILABILITY_STREAM_QUEUE_SIZE = int(os.getenv('AVAILABILITY_STREAM_QUEUE_SIZE', 100))
+    AVAILABILITY_STREAM_HEARTBEAT = float(os.getenv('AVAILABILITY_STREAM_HEARTBEAT', 15))
+    AVAILABILITY_STREAM_MAX_AGE = float(os.getenv('AVAILABILITY_STREAM_MAX_AGE', 3600))
+    AVAILABILITY_STREAM_RETRY = float(os.getenv('AVAILABILITY_STREAM_RETRY', 5))
+    
+    # Maximum number of bookings accepted by POST /bookings/batch
+    BATCH_BOOKING_MAX_ITEMS = int(os.getenv('BATCH_BOOKING_MAX_ITEMS', 50))
+    
+    # Bulk user import: rows validated and inserted per chunk, and the error report cap
+    USER_IMPORT_CHUNK_SIZE = int(os.getenv('USER_IMPORT_CHUNK_SIZE', 500))
+    USER_IMPORT_MAX_ERRORS = int(os.getenv('USER_IMPORT_MAX_ERRORS', 1000))
+    
+    # Rows fetched per round trip when streaming reports
+    REPORT_STREAM_CHUNK_SIZE = int(os.getenv('REPORT_STREAM_CHUNK_SIZE', 500))
+    
     # Email configuration
     EMAIL_CONFIG = {
         'smtp_server': os.getenv('SMTP_SERVER', 'smtp.gmail.com'),
         'smtp_port': int(os.getenv('SMTP_PORT', 587)),
         'email': os.getenv('EMAIL_USER', ''),
-        'password': os.getenv('EMAIL_PASSWORD', '')
+        'password': os.getenv('EMAIL_PASSWORD', ''),
+        'use_tls': os.getenv('SMTP_USE_TLS', 'True').lower() == 'true',
+        'timeout': float(os.getenv('SMTP_TIMEOUT', 30)),
+        'session_idle_timeout': float(os.getenv('SMTP_SESSION_IDLE_TIMEOUT', 60))
     }
     
+    # Email outbox: queued messages are drained by background workers
+    OUTBOX_WORKERS = int(os.getenv('OUTBOX_WORKERS', 2))
+    OUTBOX_BATCH_SIZE = int(os.getenv('OUTBOX_BATCH_SIZE', 20))
+    OUTBOX_POLL_INTERVAL = float(os.getenv('OUTBOX_POLL_INTERVAL', 5))
+    OUTBOX_MAX_ATTEMPTS = int(os.getenv('OUTBOX_MAX_ATTEMPTS', 5))
+    OUTBOX_RETRY_BACKOFF = float(os.getenv('OUTBOX_RETRY_BACKOFF', 30))
+    OUTBOX_RETRY_BACKOFF_MAX = float(os.getenv('OUTBOX_RETRY_BACKOFF_MAX', 3600))
+    OUTBOX_LEASE_TIMEOUT = float(os.getenv('OUTBOX_LEASE_TIMEOUT', 300))
+    
+    # Background invoicing: batches of uninvoiced bookings, numbered from reserved blocks
+    INVOICE_WORKER_ENABLED = os.getenv('INVOICE_WORKER_ENABLED', 'True').lower() == 'true'
+    INVOICE_INTERVAL = float(os.getenv('INVOICE_INTERVAL', 30))
+    INVOICE_BATCH_SIZE = int(os.getenv('INVOICE_BATCH_SIZE', 500))
+    INVOICE_LOOKBACK_HOURS = int(os.getenv('INVOICE_LOOKBACK_HOURS', 72))
+    INVOICE_NUMBER_BLOCK_SIZE = int(os.getenv('INVOICE_NUMBER_BLOCK_SIZE', 1000))
+    INVOICE_NUMBER_PREFIX = os.getenv('INVOICE_NUMBER_PREFIX', 'INV')
+    # Booking totals include tax at this rate
+    INVOICE_TAX_RATE = os.getenv('INVOICE_TAX_RATE', '0.10')
+    
+    # Responses replayed to POST retries that carry an Idempotency-Key
+    IDEMPOTENCY_TTL = float(os.getenv('IDEMPOTENCY_TTL', 86400))
+    IDEMPOTENCY_CACHE_SIZE = int(os.getenv('IDEMPOTENCY_CACHE_SIZE', 10000))
+    IDEMPOTENCY_WAIT_TIMEOUT = float(os.getenv('IDEMPOTENCY_WAIT_TIMEOUT', 30))
+    # Also keep them in the idempotency_keys table, for retries that reach another
+    # process. Only turn it off for a single process; the server forces it on for
+    # several workers.
+    IDEMPOTENCY_SHARED = os.getenv('IDEMPOTENCY_SHARED', 'True').lower() == 'true'
+    
+    # Admission control: requests beyond the concurrency cap (0 means the pool size)
+    # wait at most ADMISSION_QUEUE_TIMEOUT seconds for a slot, then get a 503
+    ADMISSION_ENABLED = os.getenv('ADMISSION_ENABLED', 'True').lower() == 'true'
+    ADMISSION_MAX_CONCURRENCY = int(os.getenv('ADMISSION_MAX_CONCURRENCY', 0))
+    ADMISSION_QUEUE_TIMEOUT = float(os.getenv('ADMISSION_QUEUE_TIMEOUT', 0.05))
+    # Token buckets per client and route: RATE_LIMIT_RATE requests per second with
+    # bursts of RATE_LIMIT_BURST; RATE_LIMIT_ROUTES overrides them per route, e.g.
+    # "GET /vehicles/availability=10:20,POST /bookings=2:5". Off by default: behind
+    # a proxy every client shares its address unless RATE_LIMIT_CLIENT_HEADER is set.
+    RATE_LIMIT_ENABLED = os.getenv('RATE_LIMIT_ENABLED', 'False').lower() == 'true'
+    RATE_LIMIT_RATE = float(os.getenv('RATE_LIMIT_RATE', 20))
+    RATE_LIMIT_BURST = float(os.getenv('RATE_LIMIT_BURST', 40))
+    RATE_LIMIT_ROUTES = os.getenv('RATE_LIMIT_ROUTES', '')
+    # Header identifying the client behind a proxy (e.g. X-Forwarded-For); the peer address otherwise
+    RATE_LIMIT_CLIENT_HEADER = os.getenv('RATE_LIMIT_CLIENT_HEADER', '')
+    # Buckets kept at most; the least recently used are dropped, which refills them
+    RATE_LIMIT_MAX_BUCKETS = int(os.getenv('RATE_LIMIT_MAX_BUCKETS', 100000))
+    
+    # Request, database and email metrics served at /metrics; server workers write
+    # theirs for the others every METRICS_WRITE_INTERVAL seconds
+    METRICS_ENABLED = os.getenv('METRICS_ENABLED', 'True').lower() == 'true'
+    METRICS_WRITE_INTERVAL = float(os.getenv('METRICS_WRITE_INTERVAL', 5))
+    
+    # Statements slower than this are written to the slow query log (0 disables it)
+    SLOW_QUERY_THRESHOLD_MS = float(os.getenv('SLOW_QUERY_THRESHOLD_MS', 200))
+    SLOW_QUERY_LOG_PATH = os.getenv('SLOW_QUERY_LOG_PATH', 'slow_queries.log')
+    SLOW_QUERY_LOG_MAX_BYTES = int(os.getenv('SLOW_QUERY_LOG_MAX_BYTES', 10 * 1024 * 1024))
+    SLOW_QUERY_LOG_BACKUPS = int(os.getenv('SLOW_QUERY_LOG_BACKUPS', 5))
+    
     # Flask configuration
     DEBUG = os.getenv('FLASK_DEBUG', 'True').lower() == 'true'
     HOST = os.getenv('FLASK_HOST', '0.0.0.0')
-    PORT = int(os.getenv('FLASK_PORT', 5000))
\ No newline at end of file
+    PORT = int(os.getenv('FLASK_PORT', 5000))
+    
+    # Production server (python -m src.server): worker processes (0 means one per CPU)
+    # and request threads in each, per-worker SO_REUSEPORT listeners instead of one
+    # shared socket, seconds an idle keep-alive connection is kept, connections each
+    # worker opens before taking traffic, seconds a worker may take to start (and may
+    # stay unresponsive), and seconds a stopping worker drains requests
+    SERVER_WORKERS = int(os.getenv('SERVER_WORKERS', 0))
+    SERVER_THREADS = int(os.getenv('SERVER_THREADS', 16))
+    SERVER_REUSE_PORT = os.getenv('SERVER_REUSE_PORT', 'False').lower() == 'true'
+    SERVER_BACKLOG = int(os.getenv('SERVER_BACKLOG', 2048))
+    SERVER_KEEPALIVE = int(os.getenv('SERVER_KEEPALIVE', 5))
+    SERVER_WARM_CONNECTIONS = int(os.getenv('SERVER_WARM_CONNECTIONS', 2))
+    SERVER_READY_TIMEOUT = float(os.getenv('SERVER_READY_TIMEOUT', 60))
+    SERVER_GRACEFUL_TIMEOUT = float(os.getenv('SERVER_GRACEFUL_TIMEOUT', 30))
+    # Directory the processes of one server share: the lock held by the worker that
+    # runs the singleton services, and replica health
+    SERVER_STATE_DIR = os.getenv('SERVER_STATE_DIR', 'server_state')
\ No newline at end of file
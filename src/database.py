@@ -1,40 +1,779 @@
-import mysql.connector
-from mysql.connector import Error
+import itertools
+import json
+import os
+import re
+import threading
+import time
+from collections import OrderedDict, deque
+from contextlib import contextmanager
+from functools import lru_cache
+from flask import g, has_request_context, request
 from src.config import Config
+from src.backends import create_backend, create_replica_backends
+from src.metrics import metrics
+from src.slowlog import slow_query_log
+
+class PoolTimeoutError(Exception):
+    pass
+
+def in_list(values):
+    # Placeholders for an IN list, padded to a power-of-two length by repeating
+    # the last value, so variable-length lists map to a few cached statements
+    values = list(values)
+    size = 1
+    while size < len(values):
+        size *= 2
+    return ', '.join(['%s'] * size), values + values[-1:] * (size - len(values))
+
+# Statements that may run on a replica: plain reads, without locking clauses
+READ_ONLY = re.compile(r'^\s*(SELECT|WITH|SHOW)\b(?!.*\bFOR\s+(UPDATE|SHARE)\b)(?!.*\bLOCK\s+IN\s+SHARE\s+MODE\b)',
+                       re.IGNORECASE | re.DOTALL)
+
+@lru_cache(maxsize=1024)
+def is_read_only(query):
+    return READ_ONLY.match(query) is not None
+
+# Set after a request writes: the client's reads stay on the primary until the time it holds
+STICKY_COOKIE = 'db_primary_until'
+
+class StatementCache:
+    # Prepared statements of one connection keyed by SQL text, least recently used evicted first
+    __slots__ = ('capacity', 'statements', 'hits', 'misses', 'evictions')
+
+    def __init__(self, capacity):
+        self.capacity = capacity
+        self.statements = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def get(self, backend, connection, query):
+        # Returns the cached SQL string with its cursor: drivers re-prepare when
+        # handed a different string object, even one with the same text
+        entry = self.statements.get(query)
+        if entry is not None:
+            self.statements.move_to_end(query)
+            self.hits += 1
+            return entry
+
+        self.misses += 1
+        entry = (query, backend.prepared_cursor(connection))
+        self.statements[query] = entry
+        if len(self.statements) > self.capacity:
+            _, (_, evicted) = self.statements.popitem(last=False)
+            self.evictions += 1
+            self._close(evicted)
+        return entry
+
+    def discard(self, query):
+        entry = self.statements.pop(query, None)
+        if entry is not None:
+            self._close(entry[1])
+
+    def _close(self, cursor):
+        try:
+            cursor.close()
+        except Exception:
+            pass
+
+class PooledConnection:
+    __slots__ = ('connection', 'created_at', 'last_used', 'statements')
+
+    def __init__(self, connection, statement_cache_size=0):
+        self.connection = connection
+        self.created_at = time.monotonic()
+        self.last_used = self.created_at
+        self.statements = StatementCache(statement_cache_size) if statement_cache_size > 0 else None
+
+class ConnectionPool:
+    def __init__(self, connect, is_healthy, size, timeout, recycle, ping_interval, statement_cache_size=0):
+        self.connect = connect
+        self.is_healthy = is_healthy
+        self.size = size
+        self.timeout = timeout
+        self.recycle = recycle
+        self.ping_interval = ping_interval
+        self.statement_cache_size = statement_cache_size
+        self._idle = deque()
+        self._open = 0
+        self._cond = threading.Condition()
+
+        # Stats
+        self.checkouts = 0
+        self.checkout_failures = 0
+        self.wait_time_total = 0.0
+        self.wait_time_max = 0.0
+        self.recycled = 0
+        self.health_check_failures = 0
+        self.statement_hits = 0
+        self.statement_misses = 0
+        self.statement_evictions = 0
+
+    def acquire(self):
+        started = time.monotonic()
+        deadline = started + self.timeout
+
+        # Take an idle connection, or a slot to open a new one, waiting up to the timeout
+        with self._cond:
+            while True:
+                if self._idle:
+                    pooled = self._idle.pop()
+                    break
+                if self._open < self.size:
+                    self._open += 1
+                    pooled = None
+                    break
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    self.checkout_failures += 1
+                    raise PoolTimeoutError(f"No database connection available after {self.timeout}s")
+                self._cond.wait(remaining)
+
+        try:
+            pooled = self._checkout(pooled)
+        except Exception:
+            with self._cond:
+                self._open -= 1
+                self.checkout_failures += 1
+                self._cond.notify()
+            raise
+
+        waited = time.monotonic() - started
+        metrics.record_pool_wait(waited)
+        with self._cond:
+            self.checkouts += 1
+            self.wait_time_total += waited
+            self.wait_time_max = max(self.wait_time_max, waited)
+        return pooled
+
+    def _checkout(self, pooled):
+        now = time.monotonic()
+        if pooled is not None:
+            # Recycle connections past their lifetime, health-check the rest
+            if now - pooled.created_at > self.recycle:
+                self._close(pooled)
+                pooled = None
+                with self._cond:
+                    self.recycled += 1
+            elif now - pooled.last_used > self.ping_interval and not self._is_healthy(pooled):
+                self._close(pooled)
+                pooled = None
+                with self._cond:
+                    self.health_check_failures += 1
+
+        if pooled is None:
+            pooled = PooledConnection(self.connect(), self.statement_cache_size)
+        return pooled
+
+    def release(self, pooled, discard=False):
+        if not discard:
+            try:
+                # Never hand out a connection with a transaction left open
+                if pooled.connection.in_transaction:
+                    pooled.connection.rollback()
+            except Exception:
+                discard = True
+
+        if discard:
+            self._close(pooled)
+
+        with self._cond:
+            # Fold the connection's statement cache counters into the pool's
+            statements = pooled.statements
+            if statements is not None:
+                self.statement_hits += statements.hits
+                self.statement_misses += statements.misses
+                self.statement_evictions += statements.evictions
+                statements.hits = statements.misses = statements.evictions = 0
+
+            if discard:
+                self._open -= 1
+            else:
+                pooled.last_used = time.monotonic()
+                self._idle.append(pooled)
+            self._cond.notify()
+
+    def warm(self, count):
+        # Opens up to count connections ahead of the first requests
+        opened = []
+        try:
+            for _ in range(min(count, self.size)):
+                opened.append(self.acquire())
+        finally:
+            for pooled in opened:
+                self.release(pooled)
+        return len(opened)
+
+    def _is_healthy(self, pooled):
+        try:
+            return self.is_healthy(pooled.connection)
+        except Exception:
+            return False
+
+    def _close(self, pooled):
+        try:
+            pooled.connection.close()
+        except Exception:
+            pass
+
+    def stats(self):
+        with self._cond:
+            idle = len(self._idle)
+            lookups = self.statement_hits + self.statement_misses
+            return {
+                'size': self.size,
+                'open': self._open,
+                'in_use': self._open - idle,
+                'idle': idle,
+                'checkouts': self.checkouts,
+                'checkout_failures': self.checkout_failures,
+                'wait_time_total_ms': round(self.wait_time_total * 1000, 3),
+                'wait_time_avg_ms': round(self.wait_time_total * 1000 / self.checkouts, 3) if self.checkouts else 0.0,
+                'wait_time_max_ms': round(self.wait_time_max * 1000, 3),
+                'recycled': self.recycled,
+                'health_check_failures': self.health_check_failures,
+                'statement_cache': {
+                    'size': self.statement_cache_size,
+                    'hits': self.statement_hits,
+                    'misses': self.statement_misses,
+                    'evictions': self.statement_evictions,
+                    'hit_ratio': round(self.statement_hits / lookups, 4) if lookups else 0.0
+                }
+            }
+
+def execute_statement(backend, pooled, query, params=None, fetch=False, prepare=True):
+    started = time.perf_counter()
+    try:
+        result = _execute_statement(backend, pooled, query, params, fetch, prepare)
+    except Exception:
+        elapsed = time.perf_counter() - started
+        metrics.record_query(elapsed, error=True)
+        if slow_query_log.is_slow(elapsed):
+            slow_query_log.record(backend, None, query, params, elapsed, 0, error=True)
+        raise
+    elapsed = time.perf_counter() - started
+    metrics.record_query(elapsed, len(result) if fetch else 0)
+    if slow_query_log.is_slow(elapsed):
+        # Row count fetched, or affected by a write
+        slow_query_log.record(backend, pooled.connection, query, params, elapsed, len(result) if fetch else result)
+    return result
+
+def _execute_statement(backend, pooled, query, params, fetch, prepare):
+    # Runs one statement, as a cached prepared statement when the connection keeps a cache
+    query = backend.translate(query)
+    statements = pooled.statements
+    if prepare and statements is not None:
+        query, cursor = statements.get(backend, pooled.connection, query)
+        try:
+            cursor.execute(query, params or ())
+            if fetch:
+                return cursor.fetchall()
+            # Leave no unread rows behind on a cursor that stays open
+            if cursor.description is not None:
+                cursor.fetchall()
+            return cursor.rowcount
+        except Exception:
+            statements.discard(query)
+            raise
+
+    cursor = backend.cursor(pooled.connection)
+    try:
+        cursor.execute(query, params or ())
+        if fetch:
+            return cursor.fetchall()
+        return cursor.rowcount
+    finally:
+        try:
+            cursor.close()
+        except Exception:
+            pass
+
+class Transaction:
+    def __init__(self, backend, pooled):
+        self.backend = backend
+        self.pooled = pooled
+        self.cursor = None
+
+    def execute(self, query, params=None, fetch=False, prepare=True):
+        return execute_statement(self.backend, self.pooled, query, params, fetch, prepare)
+
+    def executemany(self, query, seq_params):
+        # The driver batches executemany inserts into multi-row statements, so this is not prepared
+        if self.cursor is None:
+            self.cursor = self.backend.cursor(self.pooled.connection)
+        started = time.perf_counter()
+        try:
+            self.cursor.executemany(self.backend.translate(query), seq_params)
+        except Exception:
+            elapsed = time.perf_counter() - started
+            metrics.record_query(elapsed, error=True)
+            if slow_query_log.is_slow(elapsed):
+                slow_query_log.record(self.backend, None, query, seq_params[0] if seq_params else None, elapsed, 0,
+                                      batch=len(seq_params), error=True)
+            raise
+        elapsed = time.perf_counter() - started
+        metrics.record_query(elapsed)
+        if slow_query_log.is_slow(elapsed):
+            slow_query_log.record(self.backend, None, query, seq_params[0] if seq_params else None, elapsed,
+                                  self.cursor.rowcount, batch=len(seq_params))
+        return self.cursor.rowcount
+
+    def close(self):
+        if self.cursor is not None:
+            self.cursor.close()
+
+class Replica:
+    # A read replica with its own pool, left out of rotation while down or lagging
+    def __init__(self, name, backend, pool):
+        self.name = name
+        self.backend = backend
+        self.pool = pool
+        self.healthy = True
+        self.reason = None
+        self.lag = None
+        self.checked_at = None
+
+        # Stats
+        self.reads = 0
+        self.failures = 0
+        self.failovers = 0
+        self.ejections = 0
+
+    def check(self, max_lag):
+        self.checked_at = time.time()
+        try:
+            pooled = self.pool.acquire()
+        except (self.backend.Error, PoolTimeoutError) as e:
+            self.mark_down(e)
+            return
+        discard = False
+        try:
+            lag = self.backend.replication_lag(pooled.connection)
+        except self.backend.Error as e:
+            discard = True
+            self.mark_down(e)
+            return
+        finally:
+            self.pool.release(pooled, discard=discard)
+
+        self.lag = lag
+        if lag is None or lag > max_lag:
+            self.mark_down(f"replication lag {lag}s, allowed {max_lag}s" if lag is not None else 'replication stopped')
+        else:
+            self.put_back()
+
+    def mark_down(self, reason):
+        self.failures += 1
+        self.take_out(reason)
+
+    def take_out(self, reason):
+        if self.healthy:
+            print(f"Replica {self.name} taken out of rotation: {reason}")
+            self.healthy = False
+            self.reason = str(reason)
+            self.ejections += 1
+            metrics.record_replica(self.name, 'down')
+
+    def put_back(self):
+        if not self.healthy:
+            print(f"Replica {self.name} is back in rotation")
+            self.healthy = True
+            self.reason = None
+            metrics.record_replica(self.name, 'up')
+
+    def state(self):
+        return {'healthy': self.healthy, 'reason': self.reason, 'lag': self.lag, 'checked_at': self.checked_at}
+
+    def follow(self, state):
+        # Applies a check made by another process, unless this one has already seen it
+        if state['checked_at'] == self.checked_at:
+            return
+        self.lag = state['lag']
+        self.checked_at = state['checked_at']
+        if state['healthy']:
+            self.put_back()
+        else:
+            self.take_out(state['reason'])
+
+    def failed_over(self):
+        # A read this replica could not answer went to the primary
+        self.failovers += 1
+        metrics.record_replica(self.name, 'failover')
+
+    def stats(self):
+        return {
+            'name': self.name,
+            'healthy': self.healthy,
+            'lag_seconds': self.lag,
+            'checked_at': self.checked_at,
+            'reads': self.reads,
+            'failures': self.failures,
+            'failovers': self.failovers,
+            'ejections': self.ejections,
+            'pool': self.pool.stats()
+        }
 
 class DatabaseManager:
+    # A single backend and pool are shared by every DatabaseManager in the process,
+    # and so are the read replicas (DB_REPLICAS), each with a pool of its own
+    _backend = None
+    _pool = None
+    _pool_lock = threading.Lock()
+    _replicas = []
+    _replica_turns = itertools.count()
+    _replica_checker = None
+    # Replica health written by the process that runs the checks, read by the others
+    _replica_state_path = None
+    _replica_state_due = 0.0
+    # Outside requests, a thread reads from the primary for a while after it writes
+    _local = threading.local()
+    _inherited = []
+
     def __init__(self):
         self.config = Config.DB_CONFIG
-    
+
+    @classmethod
+    def _setup(cls):
+        with cls._pool_lock:
+            if cls._pool is None:
+                backend = create_backend()
+                cls._backend = backend
+                cls._pool = cls._create_pool(backend)
+                cls._replicas = [
+                    Replica(name, replica_backend, cls._create_pool(replica_backend))
+                    for name, replica_backend in create_replica_backends()
+                ]
+
+    @staticmethod
+    def _create_pool(backend):
+        size = Config.DB_POOL_SIZE
+        if backend.max_connections:
+            size = min(size, backend.max_connections)
+        return ConnectionPool(
+            backend.connect,
+            backend.is_healthy,
+            size=size,
+            timeout=Config.DB_POOL_TIMEOUT,
+            recycle=Config.DB_POOL_RECYCLE,
+            ping_interval=Config.DB_POOL_PING_INTERVAL,
+            statement_cache_size=Config.DB_STATEMENT_CACHE_SIZE
+        )
+
+    @classmethod
+    def _reset_after_fork(cls):
+        # A forked child opens its own connections: the inherited ones share
+        # their sockets with the parent, and the replica checker thread is gone.
+        # They are kept referenced, never closed, so the parent's stay usable.
+        cls._inherited.append((cls._pool, cls._replicas))
+        cls._backend = None
+        cls._pool = None
+        cls._pool_lock = threading.Lock()
+        cls._replicas = []
+        cls._replica_checker = None
+        cls._replica_state_path = None
+        cls._replica_state_due = 0.0
+        cls._local = threading.local()
+
+    def warm(self, count):
+        # Opens count connections to the primary and to each replica
+        opened = self.pool.warm(count)
+        for replica in self.replicas:
+            replica.pool.warm(count)
+        return opened
+
+    @classmethod
+    def start_replica_checks(cls, interval):
+        if cls._pool is None:
+            cls._setup()
+        if cls._replicas and interval > 0 and cls._replica_checker is None:
+            cls._replica_checker = threading.Thread(
+                target=cls._check_replicas_forever, args=(interval,), name='replica-checker', daemon=True)
+            cls._replica_checker.start()
+
+    @classmethod
+    def _check_replicas_forever(cls, interval):
+        while True:
+            cls.check_replicas()
+            time.sleep(interval)
+
+    @classmethod
+    def check_replicas(cls):
+        for replica in cls._replicas:
+            replica.check(Config.DB_REPLICA_MAX_LAG)
+        if cls._replica_state_path is not None:
+            try:
+                temporary = f'{cls._replica_state_path}.{os.getpid()}'
+                with open(temporary, 'w') as state_file:
+                    json.dump({replica.name: replica.state() for replica in cls._replicas}, state_file)
+                os.replace(temporary, cls._replica_state_path)
+            except OSError as e:
+                print(f"Could not write replica state: {e}")
+
+    @classmethod
+    def share_replica_state(cls, path):
+        # Processes of one server share the checks made by whichever of them runs
+        # start_replica_checks; the others read their results from path
+        cls._replica_state_path = path
+
+    @classmethod
+    def _follow_replica_state(cls):
+        now = time.monotonic()
+        if cls._replica_checker is not None or cls._replica_state_path is None or now < cls._replica_state_due:
+            return
+        cls._replica_state_due = now + Config.DB_REPLICA_CHECK_INTERVAL
+        try:
+            with open(cls._replica_state_path) as state_file:
+                states = json.load(state_file)
+        except (OSError, ValueError):
+            return
+        for replica in cls._replicas:
+            if replica.name in states:
+                replica.follow(states[replica.name])
+
+    @property
+    def backend(self):
+        if DatabaseManager._backend is None:
+            self._setup()
+        return DatabaseManager._backend
+
+    @property
+    def pool(self):
+        if DatabaseManager._pool is None:
+            self._setup()
+        return DatabaseManager._pool
+
     def get_connection(self):
+        # Inside a Flask request the connection is borrowed once and shared by every query
+        if has_request_context():
+            pooled = g.get('db_connection')
+            if pooled is None:
+                pooled = self.pool.acquire()
+                g.db_connection = pooled
+            return pooled
+        return self.pool.acquire()
+
+    def release_connection(self, pooled, discard=False):
+        if has_request_context() and g.get('db_connection') is pooled:
+            if discard:
+                g.pop('db_connection')
+                self.pool.release(pooled, discard=True)
+            return
+        self.pool.release(pooled, discard=discard)
+
+    @property
+    def replicas(self):
+        if DatabaseManager._pool is None:
+            self._setup()
+        return DatabaseManager._replicas
+
+    def _mark_write(self):
+        # Reads that follow a write go to the primary, which already has it
+        if not self.replicas:
+            return
+        if has_request_context():
+            g.db_wrote = True
+        else:
+            DatabaseManager._local.primary_until = time.monotonic() + Config.DB_STICKY_PRIMARY_SECONDS
+
+    def _reads_from_primary(self):
+        if has_request_context():
+            if g.get('db_wrote'):
+                return True
+            try:
+                return float(request.cookies.get(STICKY_COOKIE, 0)) > time.time()
+            except ValueError:
+                return False
+        return getattr(DatabaseManager._local, 'primary_until', 0) > time.monotonic()
+
+    def read_replica(self, query):
+        # The replica a read should go to, or None for the primary. A request
+        # keeps to one replica, so its reads see one consistent state.
+        if not self.replicas or not is_read_only(query) or self._reads_from_primary():
+            return None
+        self._follow_replica_state()
+        if has_request_context():
+            replica = g.get('db_replica')
+            if replica is not None:
+                return replica if replica.healthy else None
+        healthy = [replica for replica in DatabaseManager._replicas if replica.healthy]
+        if not healthy:
+            return None
+        replica = healthy[next(DatabaseManager._replica_turns) % len(healthy)]
+        if has_request_context():
+            g.db_replica = replica
+        return replica
+
+    def _replica_connection(self, replica):
+        if has_request_context():
+            pooled = g.get('db_replica_connection')
+            if pooled is None:
+                pooled = replica.pool.acquire()
+                g.db_replica_connection = pooled
+            return pooled
+        return replica.pool.acquire()
+
+    def _release_replica_connection(self, replica, pooled, discard=False):
+        if has_request_context() and g.get('db_replica_connection') is pooled:
+            if discard:
+                g.pop('db_replica_connection')
+                replica.pool.release(pooled, discard=True)
+            return
+        replica.pool.release(pooled, discard=discard)
+
+    def _query_replica(self, replica, query, params, prepare):
+        # Returns the rows, or None when the replica failed and the primary should answer
         try:
-            connection = mysql.connector.connect(**self.config)
-            return connection
-        except Error as e:
-            print(f"Error connecting to MySQL: {e}")
+            pooled = self._replica_connection(replica)
+        except (replica.backend.Error, PoolTimeoutError) as e:
+            replica.mark_down(e)
+            replica.failed_over()
             return None
-    
-    def execute_query(self, query, params=None, fetch=False):
-        connection = self.get_connection()
-        if not connection:
+
+        broken = False
+        try:
+            rows = execute_statement(replica.backend, pooled, query, params, True, prepare)
+            replica.reads += 1
+            return rows
+        except replica.backend.Error as e:
+            print(f"Replica {replica.name} error: {e}")
+            broken = not replica.backend.is_healthy(pooled.connection)
+            if broken:
+                replica.mark_down(e)
+            replica.failed_over()
             return None
-        
+        finally:
+            self._release_replica_connection(replica, pooled, discard=broken)
+
+    def replica_stats(self):
+        return [replica.stats() for replica in self.replicas]
+
+    @property
+    def Error(self):
+        return self.backend.Error
+
+    def is_lock_error(self, error):
+        return self.backend.is_lock_error(error)
+
+    def is_duplicate_error(self, error):
+        return self.backend.is_duplicate_error(error)
+
+    def pool_stats(self):
+        return self.pool.stats()
+
+    def stream_query(self, query, params=None, chunk_size=500, primary=False):
+        # Yields the result in chunks read with fetchmany from an unbuffered cursor,
+        # so it is never held in memory. The stream owns its connection because it
+        # outlives the view function; it takes over the request's connection if
+        # there is one, since streaming is the last thing the request does.
+        replica = None if primary else self.read_replica(query)
+        backend, pool = (replica.backend, replica.pool) if replica is not None else (self.backend, self.pool)
+        pooled = None
+        if has_request_context():
+            primary_pooled = g.pop('db_connection', None)
+            replica_pooled = g.pop('db_replica_connection', None)
+            pooled = primary_pooled if replica is None else replica_pooled
+            # Hand back the connection the stream does not use
+            unused = replica_pooled if replica is None else primary_pooled
+            if unused is not None:
+                (g.db_replica.pool if unused is replica_pooled else self.pool).release(unused)
+        if pooled is None:
+            pooled = pool.acquire()
+        cursor = None
+        finished = False
+        # Database time only, not the time the consumer spends between chunks
+        elapsed = 0.0
+        fetched = 0
         try:
-            cursor = connection.cursor(dictionary=True)
-            cursor.execute(query, params or ())
-            
-            if fetch:
-                result = cursor.fetchall()
-            else:
-                connection.commit()
-                result = cursor.rowcount
-            
-            return result
-        except Error as e:
+            started = time.perf_counter()
+            cursor = backend.stream_cursor(pooled.connection)
+            cursor.execute(backend.translate(query), params or ())
+            while True:
+                rows = cursor.fetchmany(chunk_size)
+                elapsed += time.perf_counter() - started
+                if not rows:
+                    break
+                fetched += len(rows)
+                yield rows
+                started = time.perf_counter()
+            finished = True
+        finally:
+            metrics.record_query(elapsed, fetched, error=not finished)
+            # A stream abandoned halfway leaves unread rows on the connection
+            if cursor is not None and finished:
+                cursor.close()
+            if finished and slow_query_log.is_slow(elapsed):
+                slow_query_log.record(backend, pooled.connection, query, params, elapsed, fetched)
+            if replica is not None and finished:
+                replica.reads += 1
+            pool.release(pooled, discard=not finished)
+
+    @contextmanager
+    def transaction(self):
+        # Statements run on one connection and are committed together; the
+        # transaction is rolled back and the error re-raised if anything fails
+        self._mark_write()
+        pooled = self.get_connection()
+        connection = pooled.connection
+        tx = None
+        broken = False
+        try:
+            self.backend.begin(connection)
+            tx = Transaction(self.backend, pooled)
+            yield tx
+            connection.commit()
+        except BaseException:
+            try:
+                connection.rollback()
+            except self.backend.Error:
+                broken = True
+            raise
+        finally:
+            if tx is not None and not broken:
+                tx.close()
+            self.release_connection(pooled, discard=broken)
+
+    def execute_query(self, query, params=None, fetch=False, prepare=True, primary=False):
+        # Pass prepare=False for one-off statements, e.g. multi-row inserts of varying size,
+        # and primary=True for reads that must see the latest writes of other clients
+        if fetch and not primary:
+            replica = self.read_replica(query)
+            if replica is not None:
+                rows = self._query_replica(replica, query, params, prepare)
+                if rows is not None:
+                    return rows
+        if not fetch or not is_read_only(query):
+            self._mark_write()
+
+        try:
+            pooled = self.get_connection()
+        except (self.backend.Error, PoolTimeoutError) as e:
+            print(f"Error connecting to database: {e}")
+            return None
+
+        broken = False
+        try:
+            return execute_statement(self.backend, pooled, query, params, fetch, prepare)
+        except self.backend.Error as e:
             print(f"Database error: {e}")
-            connection.rollback()
+            broken = not self.backend.is_healthy(pooled.connection)
             return None
         finally:
-            if connection.is_connected():
-                cursor.close()
-                connection.close()
\ No newline at end of file
+            self.release_connection(pooled, discard=broken)
+
+
+def close_request_connection(exception=None):
+    pooled = g.pop('db_connection', None)
+    if pooled is not None:
+        DatabaseManager().pool.release(pooled)
+    pooled = g.pop('db_replica_connection', None)
+    if pooled is not None:
+        g.db_replica.pool.release(pooled)
+
+def stick_to_primary(response):
+    # A client that wrote reads from the primary for DB_STICKY_PRIMARY_SECONDS,
+    # until the replicas have caught up with its write
+    if g.get('db_wrote'):
+        until = time.time() + Config.DB_STICKY_PRIMARY_SECONDS
+        response.set_cookie(STICKY_COOKIE, f'{until:.3f}', max_age=int(Config.DB_STICKY_PRIMARY_SECONDS) + 1,
+                            httponly=True, samesite='Lax')
+    return response
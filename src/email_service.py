@@ -1,32 +1,94 @@
 import smtplib
+import threading
+import time
 from email.mime.text import MIMEText
 from email.mime.multipart import MIMEMultipart
 from src.config import Config
+from src.metrics import metrics
 
 class EmailService:
     def __init__(self):
         self.config = Config.EMAIL_CONFIG
+        
+        # Authenticated SMTP session, reused across messages
+        self._server = None
+        self._last_used = 0.0
+        self._lock = threading.Lock()
     
     def send_email(self, to_email, subject, body):
         try:
-            msg = MIMEMultipart()
-            msg['From'] = self.config['email']
-            msg['To'] = to_email
-            msg['Subject'] = subject
-            
-            msg.attach(MIMEText(body, 'html'))
-            
-            server = smtplib.SMTP(self.config['smtp_server'], self.config['smtp_port'])
-            server.starttls()
-            server.login(self.config['email'], self.config['password'])
-            server.send_message(msg)
-            server.quit()
+            self.deliver(to_email, subject, body)
             return True
         except Exception as e:
             print(f"Email error: {e}")
             return False
     
+    def deliver(self, to_email, subject, body):
+        msg = MIMEMultipart()
+        msg['From'] = self.config['email']
+        msg['To'] = to_email
+        msg['Subject'] = subject
+        
+        msg.attach(MIMEText(body, 'html'))
+        
+        with self._lock:
+            started = time.perf_counter()
+            try:
+                try:
+                    self._session().send_message(msg)
+                except smtplib.SMTPServerDisconnected:
+                    # The server dropped the session; reconnect once
+                    self._close()
+                    self._session().send_message(msg)
+            except Exception:
+                # A timeout or an error reply can leave the session out of step with
+                # the server, which would fail the next message too
+                self._abort()
+                metrics.record_email(time.perf_counter() - started, error=True)
+                raise
+            metrics.record_email(time.perf_counter() - started)
+            self._last_used = time.monotonic()
+    
+    def _session(self):
+        # Servers drop idle sessions, so don't reuse one that has been idle too long
+        if self._server is not None and time.monotonic() - self._last_used > self.config['session_idle_timeout']:
+            self._close()
+        
+        if self._server is None:
+            server = smtplib.SMTP(self.config['smtp_server'], self.config['smtp_port'], timeout=self.config['timeout'])
+            if self.config['use_tls']:
+                server.starttls()
+            if self.config['email'] and self.config['password']:
+                server.login(self.config['email'], self.config['password'])
+            self._server = server
+        return self._server
+    
+    def _close(self):
+        if self._server is not None:
+            try:
+                self._server.quit()
+            except (smtplib.SMTPException, OSError):
+                pass
+            self._server = None
+    
+    def _abort(self):
+        # Drops the session without a QUIT, which a broken session may not answer
+        if self._server is not None:
+            try:
+                self._server.close()
+            except OSError:
+                pass
+            self._server = None
+    
+    def close(self):
+        with self._lock:
+            self._close()
+    
     def send_booking_confirmation(self, user_email, user_name, booking_id, vehicle_model, pickup_date, return_date, total_amount):
+        subject, body = self.render_booking_confirmation(user_name, booking_id, vehicle_model, pickup_date, return_date, total_amount)
+        return self.send_email(user_email, subject, body)
+    
+    def render_booking_confirmation(self, user_name, booking_id, vehicle_model, pickup_date, return_date, total_amount):
         subject = "Booking Confirmation - Vehicle Rental"
         body = f"""
         <h2>Booking Confirmation</h2>
@@ -41,9 +103,36 @@ class EmailService:
         </ul>
         <p>Thank you for choosing our service!</p>
         """
-        return self.send_email(user_email, subject, body)
+        return subject, body
+    
+    def render_booking_summary(self, user_name, bookings):
+        subject = f"Booking Confirmation - {len(bookings)} vehicles - Vehicle Rental"
+        rows = "".join(f"""
+            <tr>
+                <td>{booking['booking_id']}</td>
+                <td>{booking['vehicle_model']}</td>
+                <td>{booking['pickup_date']}</td>
+                <td>{booking['return_date']}</td>
+                <td>${booking['total_amount']}</td>
+            </tr>""" for booking in bookings)
+        total_amount = sum(booking['total_amount'] for booking in bookings)
+        body = f"""
+        <h2>Booking Confirmation</h2>
+        <p>Dear {user_name},</p>
+        <p>Your vehicle bookings have been confirmed:</p>
+        <table>
+            <tr><th>Booking ID</th><th>Vehicle</th><th>Pickup Date</th><th>Return Date</th><th>Amount</th></tr>{rows}
+        </table>
+        <p>Total Amount: ${total_amount}</p>
+        <p>Thank you for choosing our service!</p>
+        """
+        return subject, body
     
     def send_invoice(self, user_email, user_name, booking_id, vehicle_model, pickup_date, return_date, total_amount, invoice_number):
+        subject, body = self.render_invoice(user_name, booking_id, vehicle_model, pickup_date, return_date, total_amount, invoice_number)
+        return self.send_email(user_email, subject, body)
+    
+    def render_invoice(self, user_name, booking_id, vehicle_model, pickup_date, return_date, total_amount, invoice_number):
         subject = f"Invoice #{invoice_number} - Vehicle Rental"
         body = f"""
         <h2>Invoice #{invoice_number}</h2>
@@ -59,4 +148,4 @@ class EmailService:
         <p>Payment has been processed successfully.</p>
         <p>Thank you for choosing our service!</p>
         """
-        return self.send_email(user_email, subject, body)
\ No newline at end of file
+        return subject, body
\ No newline at end of file
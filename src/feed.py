@@ -0,0 +1,193 @@
+import json
+import threading
+import time
+from collections import deque
+from src.catalog import fleet_catalog
+from src.config import Config
+from src.occupancy import occupancy_index
+
+class Subscription:
+    def __init__(self, pickup_date, return_date, vehicle_type=None, vehicle_id=None):
+        self.pickup_date = pickup_date
+        self.return_date = return_date
+        self.vehicle_type = vehicle_type
+        self.vehicle_id = vehicle_id
+        self.cond = threading.Condition()
+        self.events = deque()
+        # Ids last sent as available; a snapshot is sent first, and again after an overflow
+        self.available = set()
+        self.resync = True
+
+    def vehicles(self, snapshot, vehicle_ids=None):
+        candidates = snapshot.select(self.vehicle_type, self.vehicle_id)
+        if vehicle_ids is None:
+            return candidates
+        return [vehicle for vehicle in candidates if vehicle.id in vehicle_ids]
+
+# Server-sent availability changes. The occupancy index reports the vehicles
+# whose bookings changed, and one publisher thread turns them into per-subscriber
+# deltas from the index bitmaps, so subscribers cost no queries. A subscriber
+# that falls AVAILABILITY_STREAM_QUEUE_SIZE events behind has its backlog
+# dropped and gets a fresh snapshot instead.
+class AvailabilityFeed:
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.subscribers = set()
+        self.cond = threading.Condition()
+        self.changed = set()
+        self._publisher = None
+        self.closing = False
+
+        # Stats
+        self.notifications = 0
+        self.deltas = 0
+        self.snapshots = 0
+        self.overflows = 0
+        self.rejected = 0
+
+    def start(self):
+        if self._publisher is None:
+            occupancy_index.listeners.append(self.publish)
+            self._publisher = threading.Thread(target=self._publish_forever, name='availability-feed', daemon=True)
+            self._publisher.start()
+
+    def publish(self, vehicle_ids):
+        # Called on the booking write path: record the vehicles and return
+        if not self.subscribers:
+            return
+        with self.cond:
+            self.changed.update(vehicle_ids)
+            self.notifications += 1
+            self.cond.notify()
+
+    def subscribe(self, pickup_date, return_date, vehicle_type=None, vehicle_id=None):
+        # Returns None when AVAILABILITY_STREAM_MAX_SUBSCRIBERS are already connected
+        with self.lock:
+            if self.closing or len(self.subscribers) >= Config.AVAILABILITY_STREAM_MAX_SUBSCRIBERS:
+                self.rejected += 1
+                return None
+            subscription = Subscription(pickup_date, return_date, vehicle_type, vehicle_id)
+            self.subscribers.add(subscription)
+            return subscription
+
+    def unsubscribe(self, subscription):
+        with self.lock:
+            self.subscribers.discard(subscription)
+
+    def close(self):
+        # Ends every stream, e.g. when a server worker drains; clients reconnect elsewhere
+        with self.lock:
+            self.closing = True
+            subscribers = list(self.subscribers)
+        for subscription in subscribers:
+            with subscription.cond:
+                subscription.cond.notify()
+
+    def _publish_forever(self):
+        while True:
+            with self.cond:
+                while not self.changed:
+                    self.cond.wait()
+                changed, self.changed = self.changed, set()
+            try:
+                self._fan_out(changed)
+            except Exception as e:
+                print(f"Availability feed publish failed: {e}")
+
+    def _fan_out(self, changed):
+        snapshot = fleet_catalog.snapshot()
+        with self.lock:
+            subscribers = list(self.subscribers)
+        for subscription in subscribers:
+            vehicles = subscription.vehicles(snapshot, changed)
+            if not vehicles:
+                continue
+            with subscription.cond:
+                if subscription.resync:
+                    # The snapshot about to be sent includes these changes
+                    continue
+                available = occupancy_index.available_ids(vehicles, subscription.pickup_date, subscription.return_date)
+                if available is None:
+                    subscription.resync = True
+                    subscription.cond.notify()
+                    continue
+                ids = {vehicle.id for vehicle in vehicles}
+                freed = sorted(available - subscription.available)
+                taken = sorted((ids - available) & subscription.available)
+                if not freed and not taken:
+                    continue
+                subscription.available = (subscription.available - ids) | available
+                if len(subscription.events) >= Config.AVAILABILITY_STREAM_QUEUE_SIZE:
+                    subscription.events.clear()
+                    subscription.resync = True
+                    self.overflows += 1
+                else:
+                    subscription.events.append(('delta', {'available': freed, 'unavailable': taken}))
+                    self.deltas += 1
+                subscription.cond.notify()
+
+    def _snapshot(self, subscription):
+        vehicles = subscription.vehicles(fleet_catalog.snapshot())
+        available = occupancy_index.available_ids(vehicles, subscription.pickup_date, subscription.return_date)
+        if available is None:
+            return None
+        subscription.available = available
+        subscription.resync = False
+        subscription.events.clear()
+        self.snapshots += 1
+        return {
+            'pickup_date': subscription.pickup_date.isoformat(),
+            'return_date': subscription.return_date.isoformat(),
+            'vehicle_type': subscription.vehicle_type,
+            'vehicle_id': subscription.vehicle_id,
+            'available': sorted(available)
+        }
+
+    def stream(self, subscription):
+        # Yields the SSE body: a snapshot, then deltas, with a comment line every
+        # AVAILABILITY_STREAM_HEARTBEAT seconds so proxies keep the connection and
+        # dead clients are noticed. Streams end after AVAILABILITY_STREAM_MAX_AGE
+        # seconds; EventSource clients reconnect on their own.
+        deadline = time.monotonic() + Config.AVAILABILITY_STREAM_MAX_AGE
+        try:
+            yield f'retry: {int(Config.AVAILABILITY_STREAM_RETRY * 1000)}\n\n'
+            while time.monotonic() < deadline:
+                with subscription.cond:
+                    if not subscription.resync and not subscription.events and not self.closing:
+                        subscription.cond.wait(min(Config.AVAILABILITY_STREAM_HEARTBEAT, deadline - time.monotonic()))
+                    if self.closing:
+                        return
+                    if subscription.resync:
+                        payload = self._snapshot(subscription)
+                        if payload is None:
+                            # The dates fell out of the index, e.g. once they are in the past
+                            events = [('end', {'reason': 'dates no longer covered'})]
+                        else:
+                            events = [('snapshot', payload)]
+                    else:
+                        events = list(subscription.events)
+                        subscription.events.clear()
+                if not events:
+                    yield ': heartbeat\n\n'
+                for name, data in events:
+                    yield f'event: {name}\ndata: {json.dumps(data, separators=(",", ":"))}\n\n'
+                    if name == 'end':
+                        return
+        finally:
+            self.unsubscribe(subscription)
+
+    def stats(self):
+        with self.lock:
+            subscribers = len(self.subscribers)
+        return {
+            'running': self._publisher is not None,
+            'subscribers': subscribers,
+            'max_subscribers': Config.AVAILABILITY_STREAM_MAX_SUBSCRIBERS,
+            'notifications': self.notifications,
+            'deltas': self.deltas,
+            'snapshots': self.snapshots,
+            'overflows': self.overflows,
+            'rejected': self.rejected
+        }
+
+availability_feed = AvailabilityFeed()
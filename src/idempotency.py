@@ -0,0 +1,243 @@
+import hashlib
+import threading
+import time
+from collections import OrderedDict
+from datetime import datetime, timedelta
+from functools import wraps
+from flask import jsonify, make_response, request
+from src.config import Config
+from src.database import DatabaseManager
+
+class StoredResponse:
+    __slots__ = ('fingerprint', 'status_code', 'content_type', 'body', 'expires_at')
+
+    def __init__(self, fingerprint, status_code, content_type, body, expires_at):
+        self.fingerprint = fingerprint
+        self.status_code = status_code
+        self.content_type = content_type
+        self.body = body
+        self.expires_at = expires_at
+
+# Returned by begin() when another request with the same key is still running
+BUSY = object()
+
+# Responses to requests sent with an Idempotency-Key, kept for IDEMPOTENCY_TTL
+# seconds in an in-process LRU of IDEMPOTENCY_CACHE_SIZE entries. With
+# IDEMPOTENCY_SHARED the idempotency_keys table backs the LRU, so retries that
+# reach another process are answered too; a row without a status code marks a
+# request still in flight. Concurrent duplicates wait for the first request
+# instead of running alongside it.
+class IdempotencyStore:
+    GET_QUERY = """
+    SELECT request_hash, status_code, content_type, body, expires_at
+    FROM idempotency_keys
+    WHERE idempotency_key = %s
+    """
+
+    # Marks the key as in flight; the placeholder expires if its process dies
+    CLAIM_QUERY = """
+    INSERT IGNORE INTO idempotency_keys (idempotency_key, request_hash, expires_at, created_at)
+    VALUES (%s, %s, %s, %s)
+    """
+
+    COMPLETE_QUERY = """
+    UPDATE idempotency_keys
+    SET status_code = %s, content_type = %s, body = %s, expires_at = %s
+    WHERE idempotency_key = %s
+    """
+
+    RELEASE_QUERY = "DELETE FROM idempotency_keys WHERE idempotency_key = %s"
+
+    EXPIRED_KEY_QUERY = "DELETE FROM idempotency_keys WHERE idempotency_key = %s AND expires_at < %s"
+
+    PURGE_QUERY = "DELETE FROM idempotency_keys WHERE expires_at < %s"
+
+    # Failures worth retrying are not replayed
+    UNCACHED_STATUSES = {408, 409, 429}
+
+    def __init__(self):
+        self.db = DatabaseManager()
+        self.lock = threading.Lock()
+        self.entries = OrderedDict()
+        self.in_flight = {}
+        self.shared = Config.IDEMPOTENCY_SHARED
+        self._purged_at = 0.0
+
+        # Stats
+        self.replays = 0
+        self.stored = 0
+        self.waits = 0
+        self.conflicts = 0
+        self.evictions = 0
+
+    def _get(self, key):
+        entry = self.entries.get(key)
+        if entry is None:
+            return None
+        if entry.expires_at <= time.monotonic():
+            del self.entries[key]
+            return None
+        self.entries.move_to_end(key)
+        return entry
+
+    def _put(self, key, entry):
+        self.entries[key] = entry
+        self.entries.move_to_end(key)
+        while len(self.entries) > Config.IDEMPOTENCY_CACHE_SIZE:
+            self.entries.popitem(last=False)
+            self.evictions += 1
+
+    def begin(self, key, fingerprint):
+        # Returns the stored response, BUSY, or None when the caller should run the request
+        deadline = time.monotonic() + Config.IDEMPOTENCY_WAIT_TIMEOUT
+        while True:
+            with self.lock:
+                entry = self._get(key)
+                if entry is not None:
+                    self.replays += 1
+                    return entry
+                event = self.in_flight.get(key)
+                if event is None:
+                    self.in_flight[key] = threading.Event()
+                    break
+                self.waits += 1
+            remaining = deadline - time.monotonic()
+            if remaining <= 0 or not event.wait(remaining):
+                self.conflicts += 1
+                return BUSY
+
+        if not self.shared:
+            return None
+        try:
+            entry = self._claim_shared(key, fingerprint, deadline)
+        except Exception:
+            self._release_local(key)
+            raise
+        if entry is None:
+            return None
+        if entry is not BUSY:
+            with self.lock:
+                self._put(key, entry)
+                self.replays += 1
+        else:
+            self.conflicts += 1
+        self._release_local(key)
+        return entry
+
+    def _claim_shared(self, key, fingerprint, deadline):
+        now = datetime.now()
+        self.db.execute_query(self.EXPIRED_KEY_QUERY, (key, now))
+        while True:
+            claim_expires = datetime.now() + timedelta(seconds=Config.IDEMPOTENCY_WAIT_TIMEOUT)
+            claimed = self.db.execute_query(self.CLAIM_QUERY, (key, fingerprint, claim_expires, datetime.now()))
+            if claimed is None:
+                # The table is unavailable; fall back to this process's store
+                return None
+            if claimed:
+                return None
+
+            rows = self.db.execute_query(self.GET_QUERY, (key,), fetch=True, primary=True)
+            if rows and rows[0]['status_code'] is not None:
+                row = rows[0]
+                ttl = max((row['expires_at'] - datetime.now()).total_seconds(), 0)
+                body = row['body'].encode() if isinstance(row['body'], str) else row['body']
+                return StoredResponse(row['request_hash'], row['status_code'], row['content_type'], body,
+                                      time.monotonic() + ttl)
+            if time.monotonic() >= deadline:
+                return BUSY
+            if rows:
+                # Running in another process
+                time.sleep(0.05)
+
+    def finish(self, key, fingerprint, response):
+        try:
+            if response.status_code < 500 and response.status_code not in self.UNCACHED_STATUSES and not response.is_streamed:
+                body = response.get_data()
+                entry = StoredResponse(fingerprint, response.status_code, response.content_type, body,
+                                       time.monotonic() + Config.IDEMPOTENCY_TTL)
+                with self.lock:
+                    self._put(key, entry)
+                    self.stored += 1
+                if self.shared:
+                    expires_at = datetime.now() + timedelta(seconds=Config.IDEMPOTENCY_TTL)
+                    self.db.execute_query(self.COMPLETE_QUERY, (
+                        response.status_code, response.content_type, body.decode('utf-8', 'replace'), expires_at, key))
+                    self._purge()
+            elif self.shared:
+                self.db.execute_query(self.RELEASE_QUERY, (key,))
+        finally:
+            self._release_local(key)
+
+    def abandon(self, key):
+        try:
+            if self.shared:
+                self.db.execute_query(self.RELEASE_QUERY, (key,))
+        finally:
+            self._release_local(key)
+
+    def _release_local(self, key):
+        with self.lock:
+            event = self.in_flight.pop(key, None)
+        if event is not None:
+            event.set()
+
+    def _purge(self):
+        # Expired rows are deleted at most once a minute
+        if time.monotonic() - self._purged_at < 60:
+            return
+        self._purged_at = time.monotonic()
+        self.db.execute_query(self.PURGE_QUERY, (datetime.now(),))
+
+    def stats(self):
+        with self.lock:
+            return {
+                'entries': len(self.entries),
+                'capacity': Config.IDEMPOTENCY_CACHE_SIZE,
+                'ttl': Config.IDEMPOTENCY_TTL,
+                'shared': self.shared,
+                'in_flight': len(self.in_flight),
+                'replays': self.replays,
+                'stored': self.stored,
+                'waits': self.waits,
+                'conflicts': self.conflicts,
+                'evictions': self.evictions
+            }
+
+idempotency_store = IdempotencyStore()
+
+def idempotent(view):
+    # Requests with an Idempotency-Key header run once per key, method and path;
+    # retries get the first response back with Idempotent-Replayed: true
+    @wraps(view)
+    def wrapper(*args, **kwargs):
+        idempotency_key = request.headers.get('Idempotency-Key')
+        if idempotency_key is None:
+            return view(*args, **kwargs)
+        if not idempotency_key or len(idempotency_key) > 255:
+            return jsonify({'error': 'Idempotency-Key must be 1 to 255 characters'}), 400
+
+        key = f'{request.method} {request.path} {idempotency_key}'
+        fingerprint = hashlib.sha256(request.get_data()).hexdigest()
+
+        entry = idempotency_store.begin(key, fingerprint)
+        if entry is BUSY:
+            response = jsonify({'error': 'A request with this Idempotency-Key is still in progress, please retry'})
+            response.status_code = 409
+            response.headers['Retry-After'] = '1'
+            return response
+        if entry is not None:
+            if entry.fingerprint != fingerprint:
+                return jsonify({'error': 'Idempotency-Key was already used for a different request'}), 422
+            response = make_response(entry.body, entry.status_code)
+            response.content_type = entry.content_type
+            response.headers['Idempotent-Replayed'] = 'true'
+            return response
+
+        try:
+            response = make_response(view(*args, **kwargs))
+        except Exception:
+            idempotency_store.abandon(key)
+            raise
+        idempotency_store.finish(key, fingerprint, response)
+        return response
+    return wrapper
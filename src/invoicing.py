@@ -0,0 +1,217 @@
+import argparse
+import threading
+import time
+import uuid
+from collections import deque
+from datetime import datetime, timedelta
+from decimal import Decimal, ROUND_HALF_UP
+from src.catalog import fleet_catalog
+from src.config import Config
+from src.database import DatabaseManager
+from src.email_service import EmailService
+from src.outbox import email_outbox
+
+CENT = Decimal('0.01')
+
+def split_tax(total_amount, rate):
+    # Booking totals include tax: returns (amount, tax_amount) adding up to the total
+    total_amount = Decimal(str(total_amount)).quantize(CENT, ROUND_HALF_UP)
+    tax_amount = (total_amount * rate / (1 + rate)).quantize(CENT, ROUND_HALF_UP)
+    return total_amount - tax_amount, tax_amount
+
+# Invoices bookings in batches, off the request path. Each batch locks a page of
+# uninvoiced bookings, inserts their invoices in one statement and queues the
+# invoice emails in the outbox, all in one transaction. Invoice numbers come
+# from blocks reserved ahead in invoice_sequences, so the sequence row is locked
+# once per block rather than once per invoice; numbers left in a block when the
+# process exits are never used.
+class InvoicePipeline:
+    SEQUENCE = 'invoice'
+
+    SEQUENCE_QUERY = "SELECT next_value FROM invoice_sequences WHERE name = %s FOR UPDATE"
+
+    ADVANCE_QUERY = "UPDATE invoice_sequences SET next_value = next_value + %s WHERE name = %s"
+
+    # Keyset on (created_at, id) so a backfill never rescans invoiced bookings
+    PENDING_QUERY = """
+    SELECT b.id, b.vehicle_id, b.pickup_date, b.return_date, b.total_amount, b.created_at, u.email, u.name
+    FROM bookings b
+    JOIN users u ON u.id = b.user_id
+    LEFT JOIN invoices i ON i.booking_id = b.id
+    WHERE i.id IS NULL AND b.status <> 'cancelled' AND b.payment_status = 'paid'
+    AND b.created_at >= %s AND b.created_at < %s
+    AND (b.created_at > %s OR (b.created_at = %s AND b.id > %s))
+    ORDER BY b.created_at, b.id
+    LIMIT %s
+    FOR UPDATE OF b SKIP LOCKED
+    """
+
+    INSERT_QUERY = """
+    INSERT INTO invoices (id, booking_id, invoice_number, amount, tax_amount, total_amount, issued_date)
+    VALUES (%s, %s, %s, %s, %s, %s, %s)
+    """
+
+    def __init__(self):
+        self.db = DatabaseManager()
+        self.email_service = EmailService()
+        self.tax_rate = Decimal(Config.INVOICE_TAX_RATE)
+        self.numbers_lock = threading.Lock()
+        self.numbers = deque()
+        self._worker = None
+
+        # Stats
+        self.invoiced = 0
+        self.batches = 0
+        self.emails_queued = 0
+        self.blocks_reserved = 0
+        self.failures = 0
+        self.last_batch_ms = 0.0
+        self.last_run_at = None
+
+    def start(self, interval):
+        if interval > 0 and self._worker is None:
+            self._worker = threading.Thread(
+                target=self._run_forever, args=(interval,), name='invoice-pipeline', daemon=True)
+            self._worker.start()
+
+    def _run_forever(self, interval):
+        while True:
+            try:
+                self.run()
+            except Exception as e:
+                self.failures += 1
+                print(f"Invoice pipeline run failed: {e}")
+            time.sleep(interval)
+
+    def run(self):
+        # Bookings created within the lookback window; older ones need a backfill
+        now = datetime.now()
+        invoiced = self.invoice_range(now - timedelta(hours=Config.INVOICE_LOOKBACK_HOURS), now)
+        self.last_run_at = time.time()
+        return invoiced
+
+    def backfill(self, created_from, created_to, send_emails=False):
+        # Historical bookings created in [created_from, created_to); customers are
+        # not emailed about them unless asked
+        return self.invoice_range(created_from, created_to, send_emails)
+
+    def invoice_range(self, created_from, created_to, send_emails=True):
+        invoiced = 0
+        after = (created_from, '')
+        while True:
+            count, after = self.invoice_batch(created_from, created_to, after, send_emails)
+            invoiced += count
+            if count < Config.INVOICE_BATCH_SIZE:
+                return invoiced
+
+    def invoice_batch(self, created_from, created_to, after, send_emails=True):
+        limit = Config.INVOICE_BATCH_SIZE
+        # Reserve numbers before the transaction, so the sequence row is never
+        # locked while bookings are
+        numbers = self.take_numbers(limit)
+        snapshot = fleet_catalog.snapshot()
+        started = time.monotonic()
+        try:
+            with self.db.transaction() as tx:
+                bookings = tx.execute(self.PENDING_QUERY, (
+                    created_from, created_to, after[0], after[0], after[1], limit), fetch=True)
+                self.return_numbers(numbers[len(bookings):])
+                numbers = numbers[:len(bookings)]
+                if not bookings:
+                    return 0, after
+
+                issued_date = datetime.now()
+                invoices = []
+                emails = []
+                for booking, number in zip(bookings, numbers):
+                    invoice_number = f'{Config.INVOICE_NUMBER_PREFIX}-{number:08d}'
+                    amount, tax_amount = split_tax(booking['total_amount'], self.tax_rate)
+                    invoices.append((str(uuid.uuid4()), booking['id'], invoice_number,
+                                     amount, tax_amount, amount + tax_amount, issued_date))
+                    if send_emails:
+                        vehicle = snapshot.by_id.get(booking['vehicle_id'])
+                        subject, body = self.email_service.render_invoice(
+                            booking['name'], booking['id'], vehicle.model if vehicle else '',
+                            booking['pickup_date'], booking['return_date'], amount + tax_amount, invoice_number)
+                        emails.append((booking['email'], subject, body))
+
+                tx.executemany(self.INSERT_QUERY, invoices)
+                email_outbox.enqueue_many(emails, tx)
+        except Exception:
+            # The batch rolled back; its numbers go to the next one
+            self.return_numbers(numbers)
+            raise
+
+        if emails:
+            email_outbox.notify()
+        self.invoiced += len(invoices)
+        self.emails_queued += len(emails)
+        self.batches += 1
+        self.last_batch_ms = round((time.monotonic() - started) * 1000, 3)
+        last = bookings[-1]
+        return len(invoices), (last['created_at'], last['id'])
+
+    def take_numbers(self, count):
+        with self.numbers_lock:
+            while len(self.numbers) < count:
+                self.numbers.extend(self._reserve_block(max(Config.INVOICE_NUMBER_BLOCK_SIZE, count)))
+            return [self.numbers.popleft() for _ in range(count)]
+
+    def return_numbers(self, numbers):
+        with self.numbers_lock:
+            self.numbers.extendleft(reversed(numbers))
+
+    def _reserve_block(self, size):
+        with self.db.transaction() as tx:
+            sequence = tx.execute(self.SEQUENCE_QUERY, (self.SEQUENCE,), fetch=True)
+            if not sequence:
+                raise RuntimeError('invoice_sequences has no invoice row')
+            start = sequence[0]['next_value']
+            tx.execute(self.ADVANCE_QUERY, (size, self.SEQUENCE))
+        self.blocks_reserved += 1
+        return range(start, start + size)
+
+    def stats(self):
+        with self.numbers_lock:
+            numbers_left = len(self.numbers)
+        return {
+            'running': self._worker is not None,
+            'invoiced': self.invoiced,
+            'batches': self.batches,
+            'emails_queued': self.emails_queued,
+            'blocks_reserved': self.blocks_reserved,
+            'numbers_left': numbers_left,
+            'failures': self.failures,
+            'last_batch_ms': self.last_batch_ms,
+            'last_run_at': self.last_run_at
+        }
+
+invoice_pipeline = InvoicePipeline()
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Invoice bookings that have no invoice yet')
+    parser.add_argument('--backfill', action='store_true', help='Invoice bookings created between --from and --to')
+    parser.add_argument('--from', dest='date_from', help='First creation day of the backfill (YYYY-MM-DD)')
+    parser.add_argument('--to', dest='date_to', help='Last creation day of the backfill (YYYY-MM-DD), defaults to today')
+    parser.add_argument('--email', action='store_true', help='Also email backfilled invoices to customers')
+    parser.add_argument('--watch', action='store_true', help='Keep invoicing new bookings every INVOICE_INTERVAL seconds')
+    args = parser.parse_args()
+
+    if args.backfill:
+        if not args.date_from:
+            parser.error('--backfill needs --from')
+        created_from = datetime.strptime(args.date_from, '%Y-%m-%d')
+        created_to = datetime.strptime(args.date_to, '%Y-%m-%d') if args.date_to else datetime.combine(datetime.now().date(), datetime.min.time())
+        started = time.monotonic()
+        count = invoice_pipeline.backfill(created_from, created_to + timedelta(days=1), send_emails=args.email)
+        print(f"Invoiced {count} bookings created from {created_from.date()} to {created_to.date()} "
+              f"in {time.monotonic() - started:.1f}s")
+    elif args.watch:
+        invoice_pipeline.start(Config.INVOICE_INTERVAL)
+        try:
+            while True:
+                time.sleep(60)
+        except KeyboardInterrupt:
+            pass
+    else:
+        print(f"Invoiced {invoice_pipeline.run()} bookings")
@@ -0,0 +1,295 @@
+import fcntl
+import glob
+import json
+import os
+import threading
+import time
+from bisect import bisect_left
+from contextlib import contextmanager
+from flask import g, has_request_context, request
+from src.config import Config
+
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+COUNT_BUCKETS = (0, 1, 2, 3, 5, 8, 13, 21, 34, 55, 89)
+
+def _labels(names, values):
+    if not names:
+        return ''
+    pairs = ','.join('{}="{}"'.format(name, str(value).replace('\\', '\\\\').replace('"', '\\"'))
+                     for name, value in zip(names, values))
+    return '{' + pairs + '}'
+
+def _number(value):
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+class Counter:
+    def __init__(self, name, help_text, labels=()):
+        self.name = name
+        self.help_text = help_text
+        self.labels = labels
+        self.series = {}
+
+    def inc(self, label_values=(), amount=1):
+        self.series[label_values] = self.series.get(label_values, 0) + amount
+
+    def render(self, series=None):
+        lines = [f'# HELP {self.name} {self.help_text}', f'# TYPE {self.name} counter']
+        for label_values, value in sorted((self.series if series is None else series).items()):
+            lines.append(f'{self.name}{_labels(self.labels, label_values)} {_number(value)}')
+        return lines
+
+class Histogram:
+    def __init__(self, name, help_text, labels=(), buckets=LATENCY_BUCKETS):
+        self.name = name
+        self.help_text = help_text
+        self.labels = labels
+        self.buckets = buckets
+        # Per label set: a count per bucket (the last one is +Inf), then sum and count
+        self.series = {}
+
+    def observe(self, label_values, value):
+        series = self.series.get(label_values)
+        if series is None:
+            series = self.series[label_values] = [0] * (len(self.buckets) + 1) + [0.0, 0]
+        series[bisect_left(self.buckets, value)] += 1
+        series[-2] += value
+        series[-1] += 1
+
+    def render(self, series=None):
+        lines = [f'# HELP {self.name} {self.help_text}', f'# TYPE {self.name} histogram']
+        bounds = [repr(float(bound)) for bound in self.buckets] + ['+Inf']
+        for label_values, series in sorted((self.series if series is None else series).items()):
+            cumulative = 0
+            for bound, count in zip(bounds, series):
+                cumulative += count
+                labels = _labels(self.labels + ('le',), label_values + (bound,))
+                lines.append(f'{self.name}_bucket{labels} {cumulative}')
+            labels = _labels(self.labels, label_values)
+            lines.append(f'{self.name}_sum{labels} {_number(series[-2])}')
+            lines.append(f'{self.name}_count{labels} {series[-1]}')
+        return lines
+
+# Metrics of the server's worker processes. Each worker writes a snapshot of its
+# series to its own file in a shared directory, every few seconds and when it is
+# scraped, and /metrics sums the files. The master folds the file of a worker
+# that exited into an archive file, so totals never go backwards.
+ARCHIVE = 'archive.json'
+
+def _worker_path(directory, pid):
+    return os.path.join(directory, f'worker-{pid}.json')
+
+@contextmanager
+def _locked(directory, operation):
+    # Shared while reading the files, exclusive while moving a worker into the archive
+    with open(os.path.join(directory, 'metrics.lock'), 'a') as lock_file:
+        fcntl.flock(lock_file, operation)
+        yield
+
+def _read(path):
+    try:
+        with open(path) as snapshot_file:
+            return json.load(snapshot_file)
+    except (OSError, ValueError):
+        return None
+
+def _write(path, snapshot):
+    temporary = f'{path}.{threading.get_ident()}.tmp'
+    with open(temporary, 'w') as snapshot_file:
+        json.dump(snapshot, snapshot_file)
+    os.replace(temporary, path)
+
+def merge(snapshots):
+    # Sums counters, histogram buckets and gauges with the same name and labels
+    collectors = {}
+    gauges = {}
+    for snapshot in snapshots:
+        for name, entries in snapshot['collectors'].items():
+            series = collectors.setdefault(name, {})
+            for label_values, value in entries:
+                label_values = tuple(label_values)
+                if isinstance(value, list):
+                    total = series.get(label_values)
+                    series[label_values] = value if total is None else [a + b for a, b in zip(total, value)]
+                else:
+                    series[label_values] = series.get(label_values, 0) + value
+        for name, help_text, metric_type, value in snapshot['gauges']:
+            gauge = gauges.get(name)
+            gauges[name] = (help_text, metric_type, value if gauge is None else gauge[2] + value)
+    return {
+        'collectors': {name: [[list(k), v] for k, v in series.items()] for name, series in collectors.items()},
+        'gauges': [[name, help_text, metric_type, value] for name, (help_text, metric_type, value) in gauges.items()]
+    }
+
+def archive_worker(directory, pid):
+    # Called by the master when a worker exits. Gauges are dropped, counters kept.
+    path = _worker_path(directory, pid)
+    with _locked(directory, fcntl.LOCK_EX):
+        snapshot = _read(path)
+        if snapshot is None:
+            return
+        snapshot['gauges'] = [gauge for gauge in snapshot['gauges'] if gauge[2] == 'counter']
+        archive = _read(os.path.join(directory, ARCHIVE)) or {'collectors': {}, 'gauges': []}
+        _write(os.path.join(directory, ARCHIVE), merge([archive, snapshot]))
+        os.remove(path)
+
+def archive_exited_workers(directory):
+    # Called when a server starts, for workers of a server that is gone
+    os.makedirs(directory, exist_ok=True)
+    for path in glob.glob(_worker_path(directory, '*')):
+        pid = int(os.path.basename(path)[len('worker-'):-len('.json')])
+        try:
+            os.kill(pid, 0)
+        except ProcessLookupError:
+            archive_worker(directory, pid)
+        except PermissionError:
+            pass
+
+# Process-wide metrics. Observations take one lock and a few dict and list
+# updates; the text format is only built when /metrics is scraped.
+class Metrics:
+    def __init__(self):
+        self.enabled = Config.METRICS_ENABLED
+        self.lock = threading.Lock()
+        # Set in server workers, which share their metrics through this directory
+        self.directory = None
+        self.gauges = None
+
+        self.requests = Counter('http_requests_total', 'HTTP requests by route and status', ('method', 'endpoint', 'status'))
+        self.request_duration = Histogram(
+            'http_request_duration_seconds', 'Time to build the response, streamed bodies excluded', ('method', 'endpoint'))
+        self.request_db_queries = Histogram(
+            'http_request_db_queries', 'Database round trips per request', ('method', 'endpoint'), COUNT_BUCKETS)
+        self.request_db_duration = Histogram(
+            'http_request_db_seconds', 'Database time per request', ('method', 'endpoint'))
+        self.queries = Counter('db_queries_total', 'Database statements by outcome', ('outcome',))
+        self.query_duration = Histogram('db_query_duration_seconds', 'Database statement latency')
+        self.rows_fetched = Counter('db_rows_fetched_total', 'Rows fetched from the database')
+        self.pool_wait = Histogram('db_pool_wait_seconds', 'Time waited for a pooled connection')
+        self.emails = Counter('email_sends_total', 'Emails handed to the SMTP server by outcome', ('outcome',))
+        self.email_duration = Histogram('email_send_duration_seconds', 'SMTP send latency', ('outcome',))
+        self.admission = Counter('http_admission_total', 'Requests admitted or shed before reaching the database', ('outcome',))
+        self.replica_events = Counter(
+            'db_replica_events_total', 'Replicas taken out of rotation (down), put back (up) and reads failed over to the primary',
+            ('replica', 'event'))
+
+        self.collectors = [
+            self.requests, self.request_duration, self.request_db_queries, self.request_db_duration,
+            self.queries, self.query_duration, self.rows_fetched, self.pool_wait, self.emails, self.email_duration,
+            self.admission, self.replica_events
+        ]
+
+    def init_app(self, app):
+        if self.enabled:
+            app.before_request(self._start_request)
+            app.after_request(self._finish_request)
+
+    def _start_request(self):
+        g.metrics_started = time.perf_counter()
+        g.metrics_db_queries = 0
+        g.metrics_db_time = 0.0
+
+    def _finish_request(self, response):
+        started = g.get('metrics_started')
+        if started is None:
+            return response
+        elapsed = time.perf_counter() - started
+        # Route templates, not raw paths, so the label set stays small
+        endpoint = request.url_rule.rule if request.url_rule is not None else 'unmatched'
+        labels = (request.method, endpoint)
+        with self.lock:
+            self.requests.inc(labels + (response.status_code,))
+            self.request_duration.observe(labels, elapsed)
+            self.request_db_queries.observe(labels, g.metrics_db_queries)
+            self.request_db_duration.observe(labels, g.metrics_db_time)
+        return response
+
+    def record_query(self, elapsed, rows=0, error=False):
+        if not self.enabled:
+            return
+        with self.lock:
+            self.queries.inc(('error' if error else 'ok',))
+            self.query_duration.observe((), elapsed)
+            if rows:
+                self.rows_fetched.inc((), rows)
+        if has_request_context() and 'metrics_started' in g:
+            g.metrics_db_queries += 1
+            g.metrics_db_time += elapsed
+
+    def record_pool_wait(self, elapsed):
+        if not self.enabled:
+            return
+        with self.lock:
+            self.pool_wait.observe((), elapsed)
+
+    def record_email(self, elapsed, error=False):
+        if not self.enabled:
+            return
+        outcome = ('error' if error else 'ok',)
+        with self.lock:
+            self.emails.inc(outcome)
+            self.email_duration.observe(outcome, elapsed)
+
+    def record_admission(self, outcome):
+        if not self.enabled:
+            return
+        with self.lock:
+            self.admission.inc((outcome,))
+
+    def record_replica(self, replica, event):
+        if not self.enabled:
+            return
+        with self.lock:
+            self.replica_events.inc((replica, event))
+
+    def share(self, directory, interval, gauges):
+        # gauges: a function returning the gauges to render, as for render()
+        if not self.enabled:
+            return
+        self.directory = directory
+        self.gauges = gauges
+        threading.Thread(target=self._share_forever, args=(interval,), name='metrics-writer', daemon=True).start()
+
+    def _share_forever(self, interval):
+        while True:
+            time.sleep(interval)
+            try:
+                self.write()
+            except Exception as e:
+                print(f"Metrics write failed: {e}")
+
+    def write(self):
+        if self.directory is not None:
+            _write(_worker_path(self.directory, os.getpid()), self.snapshot(self.gauges()))
+
+    def snapshot(self, gauges=()):
+        with self.lock:
+            collectors = {
+                collector.name: [[list(k), list(v) if isinstance(v, list) else v] for k, v in collector.series.items()]
+                for collector in self.collectors
+            }
+        return {'collectors': collectors, 'gauges': [list(gauge) for gauge in gauges]}
+
+    def render(self, gauges=()):
+        # gauges: (name, help, type, value) read at scrape time, e.g. from the pool stats.
+        # Server workers render the gauges of every worker's snapshot instead.
+        if self.directory is None:
+            lines = []
+            with self.lock:
+                for collector in self.collectors:
+                    lines.extend(collector.render())
+        else:
+            # Every worker's latest snapshot, this one's taken now
+            self.write()
+            with _locked(self.directory, fcntl.LOCK_SH):
+                paths = glob.glob(_worker_path(self.directory, '*')) + [os.path.join(self.directory, ARCHIVE)]
+                merged = merge(filter(None, map(_read, paths)))
+            series = {name: {tuple(k): v for k, v in entries} for name, entries in merged['collectors'].items()}
+            lines = []
+            for collector in self.collectors:
+                lines.extend(collector.render(series.get(collector.name, {})))
+            gauges = merged['gauges']
+        for name, help_text, metric_type, value in gauges:
+            lines.extend([f'# HELP {name} {help_text}', f'# TYPE {name} {metric_type}', f'{name} {_number(value)}'])
+        return '\n'.join(lines) + '\n'
+
+metrics = Metrics()
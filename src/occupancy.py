@@ -0,0 +1,262 @@
+import hashlib
+import threading
+import time
+from datetime import date
+from src.catalog import fleet_catalog
+from src.database import DatabaseManager
+
+# Per-vehicle day bitmaps of confirmed bookings: bit i is set when the vehicle is
+# booked on window_start + i days. Ranges are inclusive on both ends, like the SQL
+# conflict checks. Dates before window_start are not indexed, so callers fall back
+# to the database for them. Bookings only ever get added through the API; one
+# added again with other dates or another vehicle replaces its old entry, and
+# ones cancelled or completed elsewhere drop out at the next reconciliation.
+class OccupancyIndex:
+    BOOKINGS_QUERY = """
+    SELECT id, vehicle_id, pickup_date, return_date
+    FROM bookings
+    WHERE status = 'confirmed' AND return_date >= %s
+    """
+
+    def __init__(self):
+        self.db = DatabaseManager()
+        self.lock = threading.RLock()
+        self.ready = False
+        self.window_start = None
+        self.bookings = {}
+        self.vehicle_bookings = {}
+        self.occupancy = {}
+
+        # XOR of the hashes of the indexed bookings: identifies the index's contents,
+        # the same in every process that indexed the same bookings
+        self.digest = 0
+
+        # Writes applied while a reconciliation is reading the database
+        self._pending = None
+        self._reconciler = None
+        self._resync = threading.Event()
+
+        # Called with the ids of vehicles whose occupancy changed, e.g. by the availability feed
+        self.listeners = []
+
+        # Stats
+        self.hits = 0
+        self.misses = 0
+        self.reconciliations = 0
+        self.drift_corrections = 0
+        self.last_reconciled_at = None
+
+    def start(self, reconcile_interval):
+        # Reconciles when resync() is called, and every reconcile_interval seconds
+        # (0 for never) for changes that bypass the API
+        try:
+            self.reconcile()
+        except Exception as e:
+            print(f"Occupancy index warm-up failed: {e}")
+
+        if self._reconciler is None:
+            self._reconciler = threading.Thread(
+                target=self._reconcile_forever, args=(reconcile_interval,),
+                name='occupancy-reconciler', daemon=True)
+            self._reconciler.start()
+
+    def resync(self):
+        # Bookings were written elsewhere, e.g. by another server worker. Calls
+        # made while a reconciliation runs are served by one more after it.
+        self._resync.set()
+
+    def _reconcile_forever(self, interval):
+        while True:
+            self._resync.wait(interval or None)
+            self._resync.clear()
+            try:
+                self.reconcile()
+            except Exception as e:
+                print(f"Occupancy index reconciliation failed: {e}")
+
+    def reconcile(self):
+        window_start = date.today()
+
+        with self.lock:
+            self._pending = []
+
+        try:
+            # From the primary: a lagging replica would drop bookings the index already has
+            bookings = self.db.execute_query(self.BOOKINGS_QUERY, (window_start,), fetch=True, primary=True)
+            if bookings is None:
+                raise RuntimeError('could not load bookings')
+
+            loaded = {
+                row['id']: (row['vehicle_id'], row['pickup_date'], row['return_date'])
+                for row in bookings
+            }
+
+            with self.lock:
+                # Replay writes that raced with the queries above
+                for booking_id, booking in self._pending:
+                    loaded[booking_id] = booking
+
+                if self.ready:
+                    drift = {
+                        booking_id for booking_id in self.bookings.keys() ^ loaded.keys()
+                        if booking_id in loaded or self.bookings[booking_id][2] >= window_start
+                    }
+                    self.drift_corrections += len(drift)
+                previous = self.occupancy
+                window_moved = window_start != self.window_start
+
+                self.window_start = window_start
+                self.bookings = {}
+                self.vehicle_bookings = {}
+                self.occupancy = {}
+                self.digest = 0
+                for booking_id, booking in loaded.items():
+                    self._add(booking_id, booking)
+
+                self.ready = True
+                self.reconciliations += 1
+                self.last_reconciled_at = time.time()
+
+                # Bookings cancelled or completed outside the API show up here
+                changed = {
+                    vehicle_id for vehicle_id in previous.keys() | self.occupancy.keys()
+                    if window_moved or previous.get(vehicle_id, 0) != self.occupancy.get(vehicle_id, 0)
+                }
+        finally:
+            with self.lock:
+                self._pending = None
+        self._notify(changed)
+
+    def _notify(self, vehicle_ids):
+        if not vehicle_ids:
+            return
+        for listener in self.listeners:
+            try:
+                listener(vehicle_ids)
+            except Exception as e:
+                print(f"Occupancy listener failed: {e}")
+
+    def _mask(self, pickup_date, return_date):
+        first = max((pickup_date - self.window_start).days, 0)
+        last = (return_date - self.window_start).days
+        if last < first:
+            return 0
+        return ((1 << (last - first + 1)) - 1) << first
+
+    def _hash(self, booking_id, booking):
+        vehicle_id, pickup_date, return_date = booking
+        key = f'{booking_id}|{vehicle_id}|{pickup_date.isoformat()}|{return_date.isoformat()}'
+        return int.from_bytes(hashlib.blake2b(key.encode(), digest_size=8).digest(), 'big')
+
+    def _add(self, booking_id, booking):
+        vehicle_id, pickup_date, return_date = booking
+        previous = self.bookings.get(booking_id)
+        if previous == booking:
+            return
+        if previous is not None:
+            self._remove(booking_id, previous)
+        self.digest ^= self._hash(booking_id, booking)
+        self.bookings[booking_id] = booking
+        self.vehicle_bookings.setdefault(vehicle_id, set()).add(booking_id)
+        self.occupancy[vehicle_id] = self.occupancy.get(vehicle_id, 0) | self._mask(pickup_date, return_date)
+
+    def _remove(self, booking_id, booking):
+        # The vehicle's other bookings may share days with this one, so its
+        # bitmap is rebuilt from them rather than cleared by this booking's mask
+        vehicle_id = booking[0]
+        self.digest ^= self._hash(booking_id, booking)
+        del self.bookings[booking_id]
+        booking_ids = self.vehicle_bookings[vehicle_id]
+        booking_ids.discard(booking_id)
+        occupancy = 0
+        for other_id in booking_ids:
+            _, pickup_date, return_date = self.bookings[other_id]
+            occupancy |= self._mask(pickup_date, return_date)
+        self.occupancy[vehicle_id] = occupancy
+
+    def add_booking(self, booking_id, vehicle_id, pickup_date, return_date):
+        booking = (vehicle_id, pickup_date, return_date)
+        with self.lock:
+            if self._pending is not None:
+                self._pending.append((booking_id, booking))
+            if not self.ready:
+                return
+            previous = self.bookings.get(booking_id)
+            self._add(booking_id, booking)
+        self._notify({vehicle_id, previous[0]} if previous else (vehicle_id,))
+
+    def covers(self, pickup_date):
+        return self.ready and pickup_date >= self.window_start
+
+    def version(self):
+        # Changes whenever a booking is indexed or reconciliation changes the contents
+        with self.lock:
+            return f'{self.window_start.isoformat()}:{self.digest:016x}'
+
+    def available_vehicles(self, pickup_date, return_date, vehicle_type=None, vehicle_id=None):
+        # Vehicles come from the fleet catalog; only their occupancy is kept here
+        candidates = fleet_catalog.snapshot().select(vehicle_type, vehicle_id)
+        with self.lock:
+            if not self.covers(pickup_date):
+                self.misses += 1
+                return None
+            self.hits += 1
+
+            mask = self._mask(pickup_date, return_date)
+            occupancy = self.occupancy
+            return [vehicle for vehicle in candidates if not occupancy.get(vehicle.id, 0) & mask]
+
+    def available_counts(self, pickup_date, return_date):
+        # Available vehicles per type name, counted without building the rows
+        snapshot = fleet_catalog.snapshot()
+        with self.lock:
+            if not self.covers(pickup_date):
+                self.misses += 1
+                return None
+            self.hits += 1
+
+            mask = self._mask(pickup_date, return_date)
+            occupancy = self.occupancy
+            return {
+                name: sum(1 for vehicle in vehicles if not occupancy.get(vehicle.id, 0) & mask)
+                for name, vehicles in snapshot.by_type.items()
+            }
+
+    def available_ids(self, vehicles, pickup_date, return_date):
+        # Ids of the given vehicles that are free over the dates, None when not
+        # covered; for the availability feed, so not counted as hits
+        with self.lock:
+            if not self.covers(pickup_date):
+                return None
+            mask = self._mask(pickup_date, return_date)
+            occupancy = self.occupancy
+            return {vehicle.id for vehicle in vehicles if not occupancy.get(vehicle.id, 0) & mask}
+
+    def booked_days(self, first_day, days, vehicle_type=None):
+        # Per vehicle, a bitmap of the booked days in first_day .. first_day + days - 1
+        candidates = fleet_catalog.snapshot().select(vehicle_type)
+        with self.lock:
+            if not self.covers(first_day):
+                self.misses += 1
+                return None
+            self.hits += 1
+
+            offset = (first_day - self.window_start).days
+            days_mask = (1 << days) - 1
+            occupancy = self.occupancy
+            return [(vehicle, (occupancy.get(vehicle.id, 0) >> offset) & days_mask) for vehicle in candidates]
+
+    def stats(self):
+        with self.lock:
+            return {
+                'ready': self.ready,
+                'window_start': self.window_start.isoformat() if self.window_start else None,
+                'bookings': len(self.bookings),
+                'hits': self.hits,
+                'misses': self.misses,
+                'reconciliations': self.reconciliations,
+                'drift_corrections': self.drift_corrections,
+                'last_reconciled_at': self.last_reconciled_at
+            }
+
+occupancy_index = OccupancyIndex()
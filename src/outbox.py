@@ -0,0 +1,184 @@
+import threading
+import time
+from datetime import datetime, timedelta
+from src.config import Config
+from src.database import DatabaseManager, in_list
+from src.email_service import EmailService
+
+class EmailOutbox:
+    ENQUEUE_QUERY = """
+    INSERT INTO email_outbox (recipient, subject, body, status, attempts, next_attempt_at, created_at)
+    VALUES (%s, %s, %s, 'pending', 0, %s, %s)
+    """
+
+    # Due messages, plus messages whose sender died before finishing them
+    CLAIM_QUERY = """
+    SELECT id, recipient, subject, body, attempts
+    FROM email_outbox
+    WHERE (status = 'pending' AND next_attempt_at <= %s)
+    OR (status = 'sending' AND locked_until < %s)
+    ORDER BY id
+    LIMIT %s
+    FOR UPDATE SKIP LOCKED
+    """
+
+    SENT_QUERY = """
+    UPDATE email_outbox
+    SET status = 'sent', attempts = attempts + 1, locked_until = NULL, last_error = NULL, sent_at = %s
+    WHERE id = %s
+    """
+
+    RETRY_QUERY = """
+    UPDATE email_outbox
+    SET status = %s, attempts = attempts + 1, locked_until = NULL, last_error = %s, next_attempt_at = %s
+    WHERE id = %s
+    """
+
+    DEPTH_QUERY = "SELECT status, COUNT(*) as count FROM email_outbox WHERE status <> 'sent' GROUP BY status"
+
+    def __init__(self):
+        self.db = DatabaseManager()
+        self.wakeup = threading.Event()
+        self.stopping = threading.Event()
+        self.workers = []
+        self.stats_lock = threading.Lock()
+
+        # Stats
+        self.enqueued = 0
+        self.sent = 0
+        self.retried = 0
+        self.failed = 0
+        self.send_time_total = 0.0
+        self.send_time_max = 0.0
+
+    def enqueue(self, to_email, subject, body, tx=None):
+        # Pass the caller's transaction so the message commits with the data it
+        # describes; call notify() after the commit to wake a worker
+        now = datetime.now()
+        params = (to_email, subject, body, now, now)
+        if tx is not None:
+            result = tx.execute(self.ENQUEUE_QUERY, params)
+        else:
+            result = self.db.execute_query(self.ENQUEUE_QUERY, params)
+            self.notify()
+
+        if result:
+            with self.stats_lock:
+                self.enqueued += 1
+        return bool(result)
+
+    def enqueue_many(self, messages, tx):
+        # (to_email, subject, body) tuples, inserted in one round trip inside the caller's transaction
+        if not messages:
+            return 0
+        now = datetime.now()
+        tx.executemany(self.ENQUEUE_QUERY, [(to_email, subject, body, now, now) for to_email, subject, body in messages])
+        with self.stats_lock:
+            self.enqueued += len(messages)
+        return len(messages)
+
+    def notify(self):
+        self.wakeup.set()
+
+    def start(self, workers):
+        self.stopping.clear()
+        while len(self.workers) < workers:
+            worker = threading.Thread(
+                target=self._work_forever, name=f'email-outbox-{len(self.workers)}', daemon=True)
+            worker.start()
+            self.workers.append(worker)
+
+    def stop(self, timeout=None):
+        self.stopping.set()
+        self.wakeup.set()
+        for worker in self.workers:
+            worker.join(timeout)
+        self.workers = []
+
+    def _work_forever(self):
+        email_service = EmailService()
+        try:
+            while not self.stopping.is_set():
+                self.wakeup.clear()
+                try:
+                    messages = self.claim(Config.OUTBOX_BATCH_SIZE)
+                except Exception as e:
+                    print(f"Email outbox claim failed: {e}")
+                    messages = []
+
+                if not messages:
+                    self.wakeup.wait(Config.OUTBOX_POLL_INTERVAL)
+                    continue
+
+                for message in messages:
+                    self._send(email_service, message)
+        finally:
+            email_service.close()
+
+    def claim(self, limit):
+        now = datetime.now()
+        with self.db.transaction() as tx:
+            messages = tx.execute(self.CLAIM_QUERY, (now, now, limit), fetch=True)
+            if messages:
+                # Lease the messages so other workers skip them until the lease runs out
+                placeholders, ids = in_list(message['id'] for message in messages)
+                lease_query = f"UPDATE email_outbox SET status = 'sending', locked_until = %s WHERE id IN ({placeholders})"
+                locked_until = now + timedelta(seconds=Config.OUTBOX_LEASE_TIMEOUT)
+                tx.execute(lease_query, [locked_until] + ids)
+        return messages
+
+    def _send(self, email_service, message):
+        started = time.monotonic()
+        try:
+            email_service.deliver(message['recipient'], message['subject'], message['body'])
+        except Exception as e:
+            attempts = message['attempts'] + 1
+            if attempts >= Config.OUTBOX_MAX_ATTEMPTS:
+                status = 'failed'
+                print(f"Email to {message['recipient']} failed after {attempts} attempts: {e}")
+            else:
+                status = 'pending'
+
+            # Exponential backoff between attempts
+            backoff = min(Config.OUTBOX_RETRY_BACKOFF * 2 ** (attempts - 1), Config.OUTBOX_RETRY_BACKOFF_MAX)
+            next_attempt_at = datetime.now() + timedelta(seconds=backoff)
+            self.db.execute_query(self.RETRY_QUERY, (status, str(e)[:255], next_attempt_at, message['id']))
+
+            with self.stats_lock:
+                if status == 'failed':
+                    self.failed += 1
+                else:
+                    self.retried += 1
+            return
+
+        elapsed = time.monotonic() - started
+        self.db.execute_query(self.SENT_QUERY, (datetime.now(), message['id']))
+        with self.stats_lock:
+            self.sent += 1
+            self.send_time_total += elapsed
+            self.send_time_max = max(self.send_time_max, elapsed)
+
+    def stats(self):
+        depth = self.db.execute_query(self.DEPTH_QUERY, fetch=True)
+        with self.stats_lock:
+            return {
+                'workers': len(self.workers),
+                'queue_depth': {row['status']: row['count'] for row in depth} if depth is not None else None,
+                'enqueued': self.enqueued,
+                'sent': self.sent,
+                'retried': self.retried,
+                'failed': self.failed,
+                'send_time_avg_ms': round(self.send_time_total * 1000 / self.sent, 3) if self.sent else 0.0,
+                'send_time_max_ms': round(self.send_time_max * 1000, 3)
+            }
+
+email_outbox = EmailOutbox()
+
+if __name__ == '__main__':
+    # Run the outbox workers on their own, e.g. when the API runs with OUTBOX_WORKERS=0
+    email_outbox.start(max(Config.OUTBOX_WORKERS, 1))
+    try:
+        while True:
+            time.sleep(60)
+    except KeyboardInterrupt:
+        email_outbox.stop()
@@ -0,0 +1,121 @@
+import argparse
+from datetime import date, datetime, timedelta
+from decimal import Decimal
+from src.database import DatabaseManager
+from src.schemas import VehicleTypeEnum
+from src.versions import table_versions
+
+# Per day and vehicle type (bookings that are not cancelled):
+#   booking_count    bookings picked up or returned that day, the rows of the daily report
+#   pickup_count     bookings picked up that day
+#   return_count     bookings returned that day
+#   revenue          total amount of the bookings picked up that day
+#   vehicles_in_use  vehicles booked that day, pickup and return days included
+class DailyRollups:
+    UPSERT_QUERY = """
+    INSERT INTO daily_booking_rollups
+        (rollup_date, vehicle_type, booking_count, pickup_count, return_count, revenue, vehicles_in_use)
+    VALUES (%s, %s, %s, %s, %s, %s, %s)
+    ON DUPLICATE KEY UPDATE
+        booking_count = booking_count + VALUES(booking_count),
+        pickup_count = pickup_count + VALUES(pickup_count),
+        return_count = return_count + VALUES(return_count),
+        revenue = revenue + VALUES(revenue),
+        vehicles_in_use = vehicles_in_use + VALUES(vehicles_in_use)
+    """
+
+    REBUILD_BOOKINGS_QUERY = """
+    SELECT b.pickup_date, b.return_date, b.total_amount, vt.name as vehicle_type
+    FROM bookings b
+    JOIN vehicles v ON b.vehicle_id = v.id
+    JOIN vehicle_types vt ON v.type_id = vt.id
+    WHERE b.status <> 'cancelled' AND b.pickup_date <= %s AND b.return_date >= %s
+    """
+
+    # Days rebuilt per transaction
+    REBUILD_WINDOW_DAYS = 31
+
+    def __init__(self):
+        self.db = DatabaseManager()
+
+    def add_booking(self, deltas, vehicle_type, pickup_date, return_date, total_amount, sign=1, first_day=None, last_day=None):
+        # Accumulates the booking's contribution into deltas, keyed by (day, vehicle type)
+        day = max(pickup_date, first_day) if first_day else pickup_date
+        last = min(return_date, last_day) if last_day else return_date
+        while day <= last:
+            delta = deltas.setdefault((day, vehicle_type), [0, 0, 0, Decimal('0'), 0])
+            if day == pickup_date:
+                delta[0] += sign
+                delta[1] += sign
+                delta[3] += sign * Decimal(str(total_amount))
+            if day == return_date:
+                delta[0] += sign
+                delta[2] += sign
+            delta[4] += sign
+            day += timedelta(days=1)
+        return deltas
+
+    def apply(self, tx, deltas):
+        # Rows are written in key order so concurrent writers lock them in the same order
+        if deltas:
+            tx.executemany(self.UPSERT_QUERY, [
+                (day, vehicle_type, *delta)
+                for (day, vehicle_type), delta in sorted(deltas.items())
+            ])
+
+    def record_booking(self, tx, vehicle_type, pickup_date, return_date, total_amount, sign=1):
+        self.apply(tx, self.add_booking({}, vehicle_type, pickup_date, return_date, total_amount, sign))
+
+    def rebuild(self, date_from, date_to):
+        # Recomputes the rollups of every day in the range from bookings, one window per transaction
+        rebuilt = 0
+        window_start = date_from
+        while window_start <= date_to:
+            window_end = min(window_start + timedelta(days=self.REBUILD_WINDOW_DAYS - 1), date_to)
+            with self.db.transaction() as tx:
+                tx.execute("DELETE FROM daily_booking_rollups WHERE rollup_date BETWEEN %s AND %s",
+                           (window_start, window_end))
+
+                # Every day gets a row per vehicle type, so later writes only update existing rows
+                deltas = {}
+                day = window_start
+                while day <= window_end:
+                    for vehicle_type in VehicleTypeEnum:
+                        deltas[(day, vehicle_type.value)] = [0, 0, 0, Decimal('0'), 0]
+                    day += timedelta(days=1)
+
+                bookings = tx.execute(self.REBUILD_BOOKINGS_QUERY, (window_end, window_start), fetch=True)
+                for booking in bookings:
+                    self.add_booking(deltas, booking['vehicle_type'], booking['pickup_date'], booking['return_date'],
+                                     booking['total_amount'], first_day=window_start, last_day=window_end)
+
+                # Upsert rather than insert: bookings committed during the rebuild add to these rows
+                self.apply(tx, deltas)
+                rebuilt += len(deltas)
+            
+            # Summary reports are tagged with the bookings version
+            table_versions.bump('bookings')
+            window_start = window_end + timedelta(days=1)
+        return rebuilt
+
+daily_rollups = DailyRollups()
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Rebuild the daily booking rollups from the bookings table')
+    parser.add_argument('--from', dest='date_from', help='First day to rebuild (YYYY-MM-DD), defaults to the earliest pickup')
+    parser.add_argument('--to', dest='date_to', help='Last day to rebuild (YYYY-MM-DD), defaults to the end of the booking horizon')
+    args = parser.parse_args()
+
+    db = DatabaseManager()
+    if args.date_from:
+        date_from = datetime.strptime(args.date_from, '%Y-%m-%d').date()
+    else:
+        earliest = db.execute_query("SELECT MIN(pickup_date) as earliest FROM bookings", fetch=True)
+        date_from = earliest[0]['earliest'] if earliest and earliest[0]['earliest'] else date.today()
+    if args.date_to:
+        date_to = datetime.strptime(args.date_to, '%Y-%m-%d').date()
+    else:
+        date_to = date.today() + timedelta(days=14)
+
+    rows = daily_rollups.rebuild(date_from, date_to)
+    print(f"Rebuilt {rows} rollup rows from {date_from} to {date_to}")
@@ -2,113 +2,270 @@ from flask import Blueprint, request, jsonify
 from datetime import datetime, date
 import uuid
 from pydantic import ValidationError
-from src.database import DatabaseManager
+from src.catalog import fleet_catalog
+from src.database import DatabaseManager, in_list
 from src.email_service import EmailService
-from src.schemas import BookingCreate, BookingResponse
+from src.idempotency import idempotent
+from src.occupancy import occupancy_index
+from src.outbox import email_outbox
+from src.rollups import daily_rollups
+from src.config import Config
+from src.schemas import BookingCreate, BookingResponse, BatchBookingMode
+from src.utils import format_validation_errors
+from src.versions import table_versions
 
 bookings_bp = Blueprint('bookings', __name__)
 db = DatabaseManager()
 email_service = EmailService()
 
+def parse_booking(request_data):
+    # Convert string dates to date objects for validation
+    if 'pickup_date' in request_data:
+        request_data['pickup_date'] = datetime.strptime(request_data['pickup_date'], '%Y-%m-%d').date()
+    if 'return_date' in request_data:
+        request_data['return_date'] = datetime.strptime(request_data['return_date'], '%Y-%m-%d').date()
+    
+    return BookingCreate(**request_data)
+
+def changed_tables(bookings):
+    # Tables whose version counters a commit of these bookings moves
+    if any(data.pickup_date == date.today() for data in bookings):
+        return 'bookings', 'vehicles'
+    return ('bookings',)
+
 @bookings_bp.route('/bookings', methods=['POST'])
+@idempotent
 def create_booking():
     try:
         # Parse and validate input data
-        request_data = request.get_json()
-        
-        # Convert string dates to date objects for validation
-        if 'pickup_date' in request_data:
-            request_data['pickup_date'] = datetime.strptime(request_data['pickup_date'], '%Y-%m-%d').date()
-        if 'return_date' in request_data:
-            request_data['return_date'] = datetime.strptime(request_data['return_date'], '%Y-%m-%d').date()
-        
-        data = BookingCreate(**request_data)
+        data = parse_booking(request.get_json())
         
         # Convert back to strings for SQL queries
         pickup_date_str = data.pickup_date.strftime('%Y-%m-%d')
         return_date_str = data.return_date.strftime('%Y-%m-%d')
         
-        # Check if user exists
-        user_check_query = "SELECT id FROM users WHERE id = %s"
-        user_exists = db.execute_query(user_check_query, (data.user_id,), fetch=True)
-        if not user_exists:
-            return jsonify({'error': 'User not found'}), 404
+        booking_id = str(uuid.uuid4())
         
-        # Check vehicle availability
-        availability_query = """
-        SELECT COUNT(*) as conflicts FROM bookings
-        WHERE vehicle_id = %s AND status = 'confirmed' AND (
-            (pickup_date <= %s AND return_date >= %s) OR
-            (pickup_date <= %s AND return_date >= %s) OR
-            (pickup_date >= %s AND pickup_date <= %s)
-        )
-        """
-        conflicts = db.execute_query(availability_query,
-            (data.vehicle_id, pickup_date_str, pickup_date_str,
-             return_date_str, return_date_str, pickup_date_str, return_date_str),
-            fetch=True)
+        with db.transaction() as tx:
+            # Lock the vehicle row so concurrent bookings of it are serialized,
+            # and read the user in the same round trip
+            lock_query = """
+            SELECT u.id as user_id, u.email, u.name, v.id as vehicle_id
+            FROM users u
+            LEFT JOIN vehicles v ON v.id = %s
+            WHERE u.id = %s
+            FOR UPDATE OF v
+            """
+            booking_info = tx.execute(lock_query, (data.vehicle_id, data.user_id), fetch=True)
+            
+            if not booking_info:
+                return jsonify({'error': 'User not found'}), 404
+            booking_info = booking_info[0]
+            if booking_info['vehicle_id'] is None:
+                return jsonify({'error': 'Vehicle not found'}), 404
+            
+            # Model and daily rate come from the fleet catalog
+            vehicle = fleet_catalog.vehicle(data.vehicle_id)
+            days = (data.return_date - data.pickup_date).days
+            total_amount = float(days * vehicle.vehicle_type.daily_rate)
+            
+            # Create the booking only if no confirmed booking overlaps the dates
+            booking_query = """
+            INSERT INTO bookings (id, user_id, vehicle_id, pickup_date, return_date, total_amount, status, created_at)
+            SELECT %s, %s, %s, %s, %s, %s, 'confirmed', %s
+            FROM DUAL
+            WHERE NOT EXISTS (
+                SELECT 1 FROM bookings
+                WHERE vehicle_id = %s AND status = 'confirmed'
+                AND pickup_date <= %s AND return_date >= %s
+            )
+            """
+            inserted = tx.execute(booking_query,
+                (booking_id, data.user_id, data.vehicle_id,
+                 pickup_date_str, return_date_str, total_amount, datetime.now(),
+                 data.vehicle_id, return_date_str, pickup_date_str))
+            
+            if not inserted:
+                return jsonify({'error': 'Vehicle not available for selected dates'}), 400
+            
+            daily_rollups.record_booking(tx, vehicle.vehicle_type.name, data.pickup_date, data.return_date, total_amount)
+            
+            # Queue the confirmation email; it commits with the booking and is sent by the outbox workers
+            days_in_advance = (data.pickup_date - date.today()).days
+            if days_in_advance > 0:
+                subject, body = email_service.render_booking_confirmation(
+                    booking_info['name'], booking_id, vehicle.model,
+                    pickup_date_str, return_date_str, total_amount
+                )
+                email_outbox.enqueue(booking_info['email'], subject, body, tx=tx)
         
-        if conflicts and conflicts[0]['conflicts'] > 0:
-            return jsonify({'error': 'Vehicle not available for selected dates'}), 400
+        occupancy_index.add_booking(booking_id, data.vehicle_id, data.pickup_date, data.return_date)
+        email_outbox.notify()
         
-        # Get vehicle pricing
-        vehicle_query = """
-        SELECT v.*, vt.daily_rate
-        FROM vehicles v
-        JOIN vehicle_types vt ON v.type_id = vt.id
-        WHERE v.id = %s
-        """
-        vehicle = db.execute_query(vehicle_query, (data.vehicle_id,), fetch=True)
+        # Same-day pickups also change the vehicle's status, in the after_booking_insert trigger
+        table_versions.bump(*changed_tables([data]))
         
-        if not vehicle:
-            return jsonify({'error': 'Vehicle not found'}), 404
+        return jsonify({
+            'message': 'Booking created successfully',
+            'booking_id': booking_id,
+            'total_amount': total_amount
+        }), 201
         
-        days = (data.return_date - data.pickup_date).days
-        total_amount = float(days * vehicle[0]['daily_rate'])
+    except ValidationError as e:
+        return jsonify({'error': 'Validation error', 'details': format_validation_errors(e)}), 400
+    except ValueError as e:
+        return jsonify({'error': 'Invalid date format. Use YYYY-MM-DD'}), 400
+    except db.Error as e:
+        if db.is_lock_error(e):
+            return jsonify({'error': 'Vehicle is being booked by another request, please retry'}), 409
+        return jsonify({'error': 'Failed to create booking'}), 500
+    except Exception as e:
+        return jsonify({'error': 'Failed to create booking'}), 500
+
+@bookings_bp.route('/bookings/batch', methods=['POST'])
+@idempotent
+def create_booking_batch():
+    try:
+        request_data = request.get_json()
+        mode = BatchBookingMode(request_data.get('mode', BatchBookingMode.all_or_nothing.value))
+        items = request_data.get('bookings')
         
-        # Create booking
-        booking_id = str(uuid.uuid4())
-        booking_query = """
-        INSERT INTO bookings (id, user_id, vehicle_id, pickup_date, return_date, total_amount, status, created_at)
-        VALUES (%s, %s, %s, %s, %s, %s, 'confirmed', %s)
-        """
+        if not isinstance(items, list) or not items:
+            return jsonify({'error': 'bookings must be a non-empty list'}), 400
+        if len(items) > Config.BATCH_BOOKING_MAX_ITEMS:
+            return jsonify({'error': f'A batch cannot contain more than {Config.BATCH_BOOKING_MAX_ITEMS} bookings'}), 400
         
-        result = db.execute_query(booking_query,
-            (booking_id, data.user_id, data.vehicle_id,
-             pickup_date_str, return_date_str, total_amount, datetime.now()))
+        # Validate every item in one pass, collecting per-item errors
+        results = [None] * len(items)
+        bookings = {}
+        for index, item in enumerate(items):
+            if not isinstance(item, dict):
+                results[index] = {'index': index, 'status': 'failed', 'error': 'Booking must be an object'}
+                continue
+            try:
+                bookings[index] = parse_booking(item)
+            except ValidationError as e:
+                results[index] = {'index': index, 'status': 'failed', 'error': 'Validation error',
+                                  'details': format_validation_errors(e)}
+            except ValueError as e:
+                results[index] = {'index': index, 'status': 'failed', 'error': 'Invalid date format. Use YYYY-MM-DD'}
         
-        if result:
-            # Get user email for confirmation
-            user_query = "SELECT email, name FROM users WHERE id = %s"
-            user = db.execute_query(user_query, (data.user_id,), fetch=True)
-            
-            if user:
-                # Send confirmation email
-                days_in_advance = (data.pickup_date - date.today()).days
-                if days_in_advance > 0:
-                    email_service.send_booking_confirmation(
-                        user[0]['email'], user[0]['name'], booking_id,
-                        vehicle[0]['model'], pickup_date_str, return_date_str, total_amount
-                    )
+        created = []
+        if bookings:
+            vehicle_placeholders, vehicle_ids = in_list(sorted({data.vehicle_id for data in bookings.values()}))
+            user_placeholders, user_ids = in_list(sorted({data.user_id for data in bookings.values()}))
             
-            return jsonify({
-                'message': 'Booking created successfully',
-                'booking_id': booking_id,
-                'total_amount': total_amount
-            }), 201
+            with db.transaction() as tx:
+                # Lock all vehicles in id order, so concurrent batches cannot deadlock;
+                # their models and rates come from the fleet catalog
+                vehicles_query = f"""
+                SELECT id FROM vehicles
+                WHERE id IN ({vehicle_placeholders})
+                ORDER BY id
+                FOR UPDATE
+                """
+                vehicles = {row['id']: fleet_catalog.vehicle(row['id'])
+                            for row in tx.execute(vehicles_query, vehicle_ids, fetch=True)}
+                
+                users_query = f"SELECT id, email, name FROM users WHERE id IN ({user_placeholders})"
+                users = {row['id']: row for row in tx.execute(users_query, user_ids, fetch=True)}
+                
+                # One set-based query for every confirmed booking that could overlap the batch
+                conflicts_query = f"""
+                SELECT vehicle_id, pickup_date, return_date FROM bookings
+                WHERE vehicle_id IN ({vehicle_placeholders}) AND status = 'confirmed'
+                AND pickup_date <= %s AND return_date >= %s
+                """
+                latest_return = max(data.return_date for data in bookings.values())
+                earliest_pickup = min(data.pickup_date for data in bookings.values())
+                booked = {}
+                for row in tx.execute(conflicts_query, vehicle_ids + [latest_return, earliest_pickup], fetch=True):
+                    booked.setdefault(row['vehicle_id'], []).append((row['pickup_date'], row['return_date']))
+                
+                now = datetime.now()
+                for index, data in bookings.items():
+                    if data.user_id not in users:
+                        error = 'User not found'
+                    elif data.vehicle_id not in vehicles:
+                        error = 'Vehicle not found'
+                    elif any(pickup_date <= data.return_date and return_date >= data.pickup_date
+                             for pickup_date, return_date in booked.get(data.vehicle_id, [])):
+                        error = 'Vehicle not available for selected dates'
+                    else:
+                        error = None
+                    
+                    if error:
+                        results[index] = {'index': index, 'status': 'failed', 'error': error}
+                        continue
+                    
+                    # Later items in the batch must not overlap the ones accepted before them
+                    booked.setdefault(data.vehicle_id, []).append((data.pickup_date, data.return_date))
+                    days = (data.return_date - data.pickup_date).days
+                    total_amount = float(days * vehicles[data.vehicle_id].vehicle_type.daily_rate)
+                    created.append((index, str(uuid.uuid4()), data, total_amount))
+                
+                if created and (mode == BatchBookingMode.partial or len(created) == len(items)):
+                    booking_query = """
+                    INSERT INTO bookings (id, user_id, vehicle_id, pickup_date, return_date, total_amount, status, created_at)
+                    VALUES (%s, %s, %s, %s, %s, %s, 'confirmed', %s)
+                    """
+                    tx.executemany(booking_query, [
+                        (booking_id, data.user_id, data.vehicle_id, data.pickup_date.strftime('%Y-%m-%d'),
+                         data.return_date.strftime('%Y-%m-%d'), total_amount, now)
+                        for _, booking_id, data, total_amount in created
+                    ])
+                    
+                    deltas = {}
+                    for _, booking_id, data, total_amount in created:
+                        daily_rollups.add_booking(deltas, vehicles[data.vehicle_id].vehicle_type.name,
+                                                  data.pickup_date, data.return_date, total_amount)
+                    daily_rollups.apply(tx, deltas)
+                    
+                    # One summary email per customer instead of one per booking; like
+                    # single bookings, same-day pickups get no confirmation
+                    summaries = {}
+                    for _, booking_id, data, total_amount in created:
+                        if (data.pickup_date - date.today()).days <= 0:
+                            continue
+                        summaries.setdefault(data.user_id, []).append({
+                            'booking_id': booking_id,
+                            'vehicle_model': vehicles[data.vehicle_id].model,
+                            'pickup_date': data.pickup_date.strftime('%Y-%m-%d'),
+                            'return_date': data.return_date.strftime('%Y-%m-%d'),
+                            'total_amount': total_amount
+                        })
+                    for user_id, user_bookings in summaries.items():
+                        subject, body = email_service.render_booking_summary(users[user_id]['name'], user_bookings)
+                        email_outbox.enqueue(users[user_id]['email'], subject, body, tx=tx)
+                else:
+                    created = []
         
-        return jsonify({'error': 'Failed to create booking'}), 500
+        for index, booking_id, data, total_amount in created:
+            occupancy_index.add_booking(booking_id, data.vehicle_id, data.pickup_date, data.return_date)
+            results[index] = {'index': index, 'status': 'created', 'booking_id': booking_id, 'total_amount': total_amount}
+        if created:
+            email_outbox.notify()
+            table_versions.bump(*changed_tables([data for _, _, data, _ in created]))
+        
+        # Valid items that were not written because the all-or-nothing batch failed
+        for index in range(len(items)):
+            if results[index] is None:
+                results[index] = {'index': index, 'status': 'rejected', 'error': 'Batch rejected'}
+        
+        response = {'mode': mode.value, 'created': len(created), 'failed': len(items) - len(created), 'results': results}
+        if len(created) == len(items):
+            return jsonify(response), 201
+        if created:
+            return jsonify(response), 207
+        return jsonify(response), 400
         
     except ValidationError as e:
-        error_details = []
-        for error in e.errors():
-            error_details.append({
-                'field': error.get('loc', ['unknown'])[0] if error.get('loc') else 'unknown',
-                'message': error.get('msg', 'Validation error'),
-                'type': error.get('type', 'validation_error')
-            })
-        return jsonify({'error': 'Validation error', 'details': error_details}), 400
+        return jsonify({'error': 'Validation error', 'details': format_validation_errors(e)}), 400
     except ValueError as e:
-        return jsonify({'error': 'Invalid date format. Use YYYY-MM-DD'}), 400
+        return jsonify({'error': 'Invalid mode. Use all_or_nothing or partial'}), 400
+    except db.Error as e:
+        if db.is_lock_error(e):
+            return jsonify({'error': 'Vehicles are being booked by another request, please retry'}), 409
+        return jsonify({'error': 'Failed to create bookings'}), 500
     except Exception as e:
-        return jsonify({'error': 'Failed to create booking'}), 500
\ No newline at end of file
+        return jsonify({'error': 'Failed to create bookings'}), 500
@@ -1,13 +1,128 @@
-from flask import Blueprint, request, jsonify
+from flask import Blueprint, Response, current_app, request, jsonify, stream_with_context
 from datetime import datetime
+import csv
+import io
 from pydantic import ValidationError
-from src.database import DatabaseManager
-from src.schemas import DailyReportQuery, DailyReportResponse
+from src.catalog import fleet_catalog
+from src.config import Config
+from src.database import DatabaseManager, in_list
+from src.serialization import RowSerializer
+from src.schemas import DailyReportQuery, DailyReportResponse, SummaryReportQuery
+from src.utils import format_validation_errors
+from src.versions import conditional
 
 reports_bp = Blueprint('reports', __name__)
 db = DatabaseManager()
+report_serializer = RowSerializer(DailyReportResponse)
+
+STREAM_FORMATS = {
+    'json': 'application/json',
+    'ndjson': 'application/x-ndjson',
+    'csv': 'text/csv'
+}
+
+REPORT_COLUMNS = [
+    'booking_id', 'pickup_date', 'return_date', 'total_amount', 'status', 'customer_name',
+    'customer_email', 'vehicle_model', 'license_plate', 'vehicle_type', 'capacity'
+]
+
+def build_daily_report_query(report_query):
+    # Convert back to string for SQL query
+    date_str = report_query.date.strftime('%Y-%m-%d')
+    
+    # Vehicle columns are joined from the fleet catalog, see attach_vehicles
+    base_query = """
+    SELECT
+        b.id as booking_id,
+        b.pickup_date,
+        b.return_date,
+        b.total_amount,
+        b.status,
+        u.name as customer_name,
+        u.email as customer_email,
+        b.vehicle_id
+    FROM bookings b
+    JOIN users u ON b.user_id = u.id
+    WHERE (b.pickup_date = %s OR b.return_date = %s)
+    """
+    params = [date_str, date_str]
+    
+    if report_query.vehicle_type:
+        vehicle_ids = [vehicle.id for vehicle in fleet_catalog.snapshot().select(report_query.vehicle_type.value)]
+        if not vehicle_ids:
+            return None, None
+        placeholders, vehicle_ids = in_list(vehicle_ids)
+        base_query += f" AND b.vehicle_id IN ({placeholders})"
+        params.extend(vehicle_ids)
+    
+    base_query += " ORDER BY b.pickup_date"
+    return base_query, params
+
+def attach_vehicles(rows, snapshot, refresh=True):
+    # Pass refresh=False while a stream holds the connection: a catalog reload
+    # would need a second one, and with a pool of one (SQLite :memory:) it would
+    # wait out the pool timeout. Vehicles missing then are left blank.
+    for row in rows:
+        vehicle_id = row.pop('vehicle_id')
+        vehicle = snapshot.by_id.get(vehicle_id)
+        if vehicle is None and refresh:
+            vehicle = fleet_catalog.vehicle(vehicle_id)
+        row['vehicle_model'] = vehicle.model if vehicle else None
+        row['license_plate'] = vehicle.license_plate if vehicle else None
+        row['vehicle_type'] = vehicle.vehicle_type.name if vehicle else None
+        row['capacity'] = vehicle.vehicle_type.capacity if vehicle else None
+    return rows
+
+def stream_snapshot():
+    # A catalog that has every vehicle the stream can reference; vehicle ids only
+    # grow, so one that has the newest vehicle has them all
+    snapshot = fleet_catalog.snapshot()
+    newest = db.execute_query("SELECT MAX(id) as id FROM vehicles", fetch=True)
+    if newest and newest[0]['id'] is not None and newest[0]['id'] not in snapshot.by_id:
+        snapshot = fleet_catalog.refresh(stale=snapshot)
+    return snapshot
+
+def stream_daily_report(query, params, stream_format, report_date):
+    if query is None:
+        chunks = iter(())
+    else:
+        # Take the catalog before the stream holds its connection
+        snapshot = stream_snapshot()
+        chunks = (attach_vehicles(rows, snapshot, refresh=False)
+                  for rows in db.stream_query(query, params, chunk_size=Config.REPORT_STREAM_CHUNK_SIZE))
+    
+    def generate_json():
+        separator = '['
+        for rows in chunks:
+            # Encode the chunk as one array and drop its brackets
+            yield separator + current_app.json.dumps(report_serializer.dump_lenient(rows))[1:-1]
+            separator = ','
+        yield '[]' if separator == '[' else ']'
+    
+    def generate_ndjson():
+        for rows in chunks:
+            yield ''.join(current_app.json.dumps(row) + '\n' for row in report_serializer.dump_lenient(rows))
+    
+    def generate_csv():
+        # Raw column values, so amounts keep their exact decimal form
+        buffer = io.StringIO()
+        writer = csv.writer(buffer)
+        writer.writerow(REPORT_COLUMNS)
+        for rows in chunks:
+            writer.writerows([row[column] for column in REPORT_COLUMNS] for row in rows)
+            yield buffer.getvalue()
+            buffer.seek(0)
+            buffer.truncate()
+        yield buffer.getvalue()
+    
+    generators = {'json': generate_json, 'ndjson': generate_ndjson, 'csv': generate_csv}
+    response = Response(stream_with_context(generators[stream_format]()), mimetype=STREAM_FORMATS[stream_format])
+    if stream_format == 'csv':
+        response.headers['Content-Disposition'] = f'attachment; filename=daily-report-{report_date.isoformat()}.csv'
+    return response
 
 @reports_bp.route('/reports/daily', methods=['GET'])
+@conditional('bookings', 'users', catalog=True)
 def daily_report():
     try:
         # Parse query parameters
@@ -26,61 +141,116 @@ def daily_report():
         # Validate using Pydantic
         report_query = DailyReportQuery(**query_params)
         
-        # Convert back to string for SQL query
-        date_str = report_query.date.strftime('%Y-%m-%d')
-        
-        base_query = """
-        SELECT
-            b.id as booking_id,
-            b.pickup_date,
-            b.return_date,
-            b.total_amount,
-            b.status,
-            u.name as customer_name,
-            u.email as customer_email,
-            v.model as vehicle_model,
-            v.license_plate,
-            vt.name as vehicle_type,
-            vt.capacity
-        FROM bookings b
-        JOIN users u ON b.user_id = u.id
-        JOIN vehicles v ON b.vehicle_id = v.id
-        JOIN vehicle_types vt ON v.type_id = vt.id
-        WHERE DATE(b.pickup_date) = %s OR DATE(b.return_date) = %s
-        """
-        params = [date_str, date_str]
+        stream_format = request.args.get('stream')
+        if stream_format is not None and stream_format not in STREAM_FORMATS:
+            return jsonify({'error': 'Invalid stream format. Use json, ndjson or csv'}), 400
         
-        if report_query.vehicle_type:
-            base_query += " AND vt.name = %s"
-            params.append(report_query.vehicle_type.value)
+        base_query, params = build_daily_report_query(report_query)
         
-        base_query += " ORDER BY b.pickup_date"
+        # Streaming mode: rows are read and encoded chunk by chunk, so memory stays flat
+        if stream_format:
+            return stream_daily_report(base_query, params, stream_format, report_query.date), 200
         
-        result = db.execute_query(base_query, params, fetch=True)
+        result = db.execute_query(base_query, params, fetch=True) if base_query else []
         
         # Convert result to Pydantic models for validation
         if result:
-            validated_results = []
-            for row in result:
-                try:
-                    validated_row = DailyReportResponse(**row)
-                    validated_results.append(validated_row.dict())
-                except ValidationError:
-                    # If validation fails, return raw data
-                    validated_results.append(row)
+            validated_results = report_serializer.dump_lenient(attach_vehicles(result, fleet_catalog.snapshot()))
             return jsonify(validated_results), 200
         
         return jsonify([]), 200
         
     except ValidationError as e:
-        error_details = []
-        for error in e.errors():
-            error_details.append({
-                'field': error.get('loc', ['unknown'])[0] if error.get('loc') else 'unknown',
-                'message': error.get('msg', 'Validation error'),
-                'type': error.get('type', 'validation_error')
+        return jsonify({'error': 'Validation error', 'details': format_validation_errors(e)}), 400
+    except ValueError as e:
+        return jsonify({'error': 'Invalid date format. Use YYYY-MM-DD'}), 400
+    except Exception as e:
+        return jsonify({'error': 'Failed to generate report'}), 500
+
+@reports_bp.route('/reports/summary', methods=['GET'])
+@conditional('bookings', catalog=True)
+def summary_report():
+    try:
+        # Parse query parameters
+        query_params = {
+            'date_from': request.args.get('from'),
+            'date_to': request.args.get('to'),
+            'vehicle_type': request.args.get('vehicle_type')
+        }
+        
+        # Remove None values
+        query_params = {k: v for k, v in query_params.items() if v is not None}
+        
+        # Convert string dates to date objects
+        for key in ('date_from', 'date_to'):
+            if key in query_params:
+                query_params[key] = datetime.strptime(query_params[key], '%Y-%m-%d').date()
+        
+        # Validate using Pydantic
+        report_query = SummaryReportQuery(**query_params)
+        
+        # Totals come from the rollup table, one row per day and vehicle type
+        rollups_query = """
+        SELECT rollup_date, vehicle_type, booking_count, pickup_count, return_count, revenue, vehicles_in_use
+        FROM daily_booking_rollups
+        WHERE rollup_date BETWEEN %s AND %s
+        """
+        params = [report_query.date_from, report_query.date_to]
+        
+        if report_query.vehicle_type:
+            rollups_query += " AND vehicle_type = %s"
+            params.append(report_query.vehicle_type.value)
+        
+        rollups_query += " ORDER BY rollup_date, vehicle_type"
+        
+        rollups = db.execute_query(rollups_query, params, fetch=True)
+        if rollups is None:
+            return jsonify({'error': 'Failed to generate report'}), 500
+        
+        # Fleet size per type from the fleet catalog
+        snapshot = fleet_catalog.snapshot()
+        fleet_sizes = {name: len(vehicles) for name, vehicles in snapshot.by_type.items()}
+        if report_query.vehicle_type:
+            fleet_size = fleet_sizes.get(report_query.vehicle_type.value, 0)
+        else:
+            fleet_size = sum(fleet_sizes.values())
+        days = []
+        totals = {'booking_count': 0, 'pickup_count': 0, 'return_count': 0, 'revenue': 0, 'vehicle_days': 0}
+        for row in rollups:
+            size = fleet_sizes.get(row['vehicle_type'], 0)
+            days.append({
+                'date': row['rollup_date'].isoformat(),
+                'vehicle_type': row['vehicle_type'],
+                'booking_count': row['booking_count'],
+                'pickup_count': row['pickup_count'],
+                'return_count': row['return_count'],
+                'revenue': round(float(row['revenue']), 2),
+                'vehicles_in_use': row['vehicles_in_use'],
+                'fleet_size': size,
+                'utilization': round(row['vehicles_in_use'] / size, 4) if size else 0.0
             })
-        return jsonify({'error': 'Validation error', 'details': error_details}), 400
+            totals['booking_count'] += row['booking_count']
+            totals['pickup_count'] += row['pickup_count']
+            totals['return_count'] += row['return_count']
+            totals['revenue'] += row['revenue']
+            totals['vehicle_days'] += row['vehicles_in_use']
+        
+        # Utilization over the whole range: booked vehicle-days out of available vehicle-days
+        range_days = (report_query.date_to - report_query.date_from).days + 1
+        totals['revenue'] = round(float(totals['revenue']), 2)
+        totals['fleet_size'] = fleet_size
+        totals['utilization'] = round(totals['vehicle_days'] / (fleet_size * range_days), 4) if fleet_size else 0.0
+        
+        return jsonify({
+            'from': report_query.date_from.isoformat(),
+            'to': report_query.date_to.isoformat(),
+            'vehicle_type': report_query.vehicle_type.value if report_query.vehicle_type else None,
+            'days': days,
+            'totals': totals
+        }), 200
+        
+    except ValidationError as e:
+        return jsonify({'error': 'Validation error', 'details': format_validation_errors(e)}), 400
     except ValueError as e:
         return jsonify({'error': 'Invalid date format. Use YYYY-MM-DD'}), 400
     except Exception as e:
@@ -1,20 +1,32 @@
-from flask import Blueprint, request, jsonify
-from datetime import datetime
+from flask import Blueprint, request, jsonify, url_for
+from datetime import datetime, timedelta
+import base64
+import csv
+import json
+import time
 from pydantic import ValidationError
-from src.database import DatabaseManager
-from src.schemas import UserCreate, UserUpdate, UserResponse
+from src.config import Config
+from src.database import DatabaseManager, in_list
+from src.idempotency import idempotent
+from src.schemas import UserCreate, UserUpdate, UserResponse, UserListQuery
+from src.serialization import RowSerializer
+from src.utils import format_validation_errors
+from src.versions import conditional, table_versions
 
 users_bp = Blueprint('users', __name__)
 db = DatabaseManager()
+# Users are validated on every write, so listed rows are trusted
+user_serializer = RowSerializer(UserResponse, validate=False)
 
 @users_bp.route('/users', methods=['POST'])
+@idempotent
 def create_user():
     try:
         data = UserCreate(**request.get_json())
         
         # Check if email already exists
         check_query = "SELECT id FROM users WHERE email = %s"
-        existing_user = db.execute_query(check_query, (data.email,), fetch=True)
+        existing_user = db.execute_query(check_query, (data.email,), fetch=True, primary=True)
         if existing_user:
             return jsonify({'error': 'Email already exists'}), 400
         
@@ -26,6 +38,8 @@ def create_user():
         
         result = db.execute_query(query, params)
         if result:
+            table_versions.bump('users')
+            
             # Get the created user
             user_query = "SELECT * FROM users WHERE email = %s"
             user_data = db.execute_query(user_query, (data.email,), fetch=True)
@@ -36,18 +50,12 @@ def create_user():
         return jsonify({'error': 'Failed to create user'}), 500
         
     except ValidationError as e:
-        error_details = []
-        for error in e.errors():
-            error_details.append({
-                'field': error.get('loc', ['unknown'])[0] if error.get('loc') else 'unknown',
-                'message': error.get('msg', 'Validation error'),
-                'type': error.get('type', 'validation_error')
-            })
-        return jsonify({'error': 'Validation error', 'details': error_details}), 400
+        return jsonify({'error': 'Validation error', 'details': format_validation_errors(e)}), 400
     except Exception as e:
         return jsonify({'error': 'Failed to create user'}), 500
 
 @users_bp.route('/users/<int:user_id>', methods=['GET'])
+@conditional('users')
 def get_user(user_id):
     query = "SELECT * FROM users WHERE id = %s"
     result = db.execute_query(query, (user_id,), fetch=True)
@@ -57,15 +65,88 @@ def get_user(user_id):
         return jsonify(response.dict()), 200
     return jsonify({'error': 'User not found'}), 404
 
+def encode_cursor(user):
+    raw = json.dumps([user['created_at'].isoformat(), user['id']])
+    return base64.urlsafe_b64encode(raw.encode()).decode().rstrip('=')
+
+def decode_cursor(cursor):
+    try:
+        raw = base64.urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4))
+        created_at, user_id = json.loads(raw)
+        return datetime.fromisoformat(created_at), int(user_id)
+    except (ValueError, TypeError) as e:
+        raise ValueError('Invalid cursor') from e
+
 @users_bp.route('/users', methods=['GET'])
+@conditional('users')
 def get_all_users():
-    query = "SELECT * FROM users ORDER BY created_at DESC"
-    result = db.execute_query(query, fetch=True)
-    
-    if result:
-        response = [UserResponse(**user).dict() for user in result]
-        return jsonify(response), 200
-    return jsonify([]), 200
+    try:
+        # Parse query parameters
+        query_params = {
+            'limit': request.args.get('limit'),
+            'cursor': request.args.get('cursor'),
+            'email': request.args.get('email'),
+            'name': request.args.get('name'),
+            'created_from': request.args.get('created_from'),
+            'created_to': request.args.get('created_to')
+        }
+        
+        # Remove None values
+        query_params = {k: v for k, v in query_params.items() if v is not None}
+        
+        # Validate using Pydantic
+        list_query = UserListQuery(**query_params)
+        
+        conditions = []
+        params = []
+        if list_query.email:
+            conditions.append("email = %s")
+            params.append(list_query.email)
+        if list_query.name:
+            escaped = list_query.name.replace('!', '!!').replace('%', '!%').replace('_', '!_')
+            conditions.append("name LIKE %s ESCAPE '!'")
+            params.append(escaped + '%')
+        if list_query.created_from:
+            conditions.append("created_at >= %s")
+            params.append(list_query.created_from)
+        if list_query.created_to:
+            conditions.append("created_at < %s")
+            params.append(list_query.created_to + timedelta(days=1))
+        
+        # Keyset pagination on (created_at, id), served by idx_users_created_at
+        # (InnoDB secondary indexes carry the primary key)
+        if list_query.cursor:
+            created_at, user_id = decode_cursor(list_query.cursor)
+            conditions.append("(created_at < %s OR (created_at = %s AND id < %s))")
+            params.extend([created_at, created_at, user_id])
+        
+        query = "SELECT * FROM users"
+        if conditions:
+            query += " WHERE " + " AND ".join(conditions)
+        query += " ORDER BY created_at DESC, id DESC LIMIT %s"
+        
+        # Fetch one extra row to know whether there is a next page
+        params.append(list_query.limit + 1)
+        result = db.execute_query(query, params, fetch=True)
+        if result is None:
+            return jsonify({'error': 'Failed to fetch users'}), 500
+        page = result[:list_query.limit]
+        
+        response = jsonify(user_serializer.dump(page))
+        if len(result) > list_query.limit:
+            next_cursor = encode_cursor(page[-1])
+            next_args = request.args.to_dict()
+            next_args['cursor'] = next_cursor
+            response.headers['X-Next-Cursor'] = next_cursor
+            response.headers['Link'] = f'<{url_for("users.get_all_users", **next_args)}>; rel="next"'
+        return response, 200
+        
+    except ValidationError as e:
+        return jsonify({'error': 'Validation error', 'details': format_validation_errors(e)}), 400
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    except Exception as e:
+        return jsonify({'error': 'Failed to fetch users'}), 500
 
 @users_bp.route('/users/<int:user_id>', methods=['PUT'])
 def update_user(user_id):
@@ -74,13 +155,13 @@ def update_user(user_id):
         
         # Check if user exists
         check_query = "SELECT id FROM users WHERE id = %s"
-        user_exists = db.execute_query(check_query, (user_id,), fetch=True)
+        user_exists = db.execute_query(check_query, (user_id,), fetch=True, primary=True)
         if not user_exists:
             return jsonify({'error': 'User not found'}), 404
         
         # Check if email already exists for another user
         email_query = "SELECT id FROM users WHERE email = %s AND id != %s"
-        existing_email = db.execute_query(email_query, (data.email, user_id), fetch=True)
+        existing_email = db.execute_query(email_query, (data.email, user_id), fetch=True, primary=True)
         if existing_email:
             return jsonify({'error': 'Email already exists'}), 400
         
@@ -93,6 +174,8 @@ def update_user(user_id):
         
         result = db.execute_query(query, params)
         if result:
+            table_versions.bump('users')
+            
             # Get the updated user
             user_query = "SELECT * FROM users WHERE id = %s"
             user_data = db.execute_query(user_query, (user_id,), fetch=True)
@@ -103,14 +186,7 @@ def update_user(user_id):
         return jsonify({'error': 'Failed to update user'}), 500
         
     except ValidationError as e:
-        error_details = []
-        for error in e.errors():
-            error_details.append({
-                'field': error.get('loc', ['unknown'])[0] if error.get('loc') else 'unknown',
-                'message': error.get('msg', 'Validation error'),
-                'type': error.get('type', 'validation_error')
-            })
-        return jsonify({'error': 'Validation error', 'details': error_details}), 400
+        return jsonify({'error': 'Validation error', 'details': format_validation_errors(e)}), 400
     except Exception as e:
         return jsonify({'error': 'Failed to update user'}), 500
 
@@ -119,13 +195,13 @@ def delete_user(user_id):
     try:
         # Check if user exists
         check_query = "SELECT id FROM users WHERE id = %s"
-        user_exists = db.execute_query(check_query, (user_id,), fetch=True)
+        user_exists = db.execute_query(check_query, (user_id,), fetch=True, primary=True)
         if not user_exists:
             return jsonify({'error': 'User not found'}), 404
         
         # Check if user has active bookings
         booking_query = "SELECT COUNT(*) as count FROM bookings WHERE user_id = %s AND status = 'confirmed'"
-        active_bookings = db.execute_query(booking_query, (user_id,), fetch=True)
+        active_bookings = db.execute_query(booking_query, (user_id,), fetch=True, primary=True)
         if active_bookings and active_bookings[0]['count'] > 0:
             return jsonify({'error': 'Cannot delete user with active bookings'}), 400
         
@@ -133,8 +209,166 @@ def delete_user(user_id):
         result = db.execute_query(query, (user_id,))
         
         if result:
+            table_versions.bump('users')
             return jsonify({'message': 'User deleted successfully'}), 200
         return jsonify({'error': 'Failed to delete user'}), 500
         
     except Exception as e:
-        return jsonify({'error': 'Failed to delete user'}), 500
\ No newline at end of file
+        return jsonify({'error': 'Failed to delete user'}), 500
+
+class ImportReport:
+    def __init__(self):
+        self.processed = 0
+        self.created = 0
+        self.duplicates = 0
+        self.failed = 0
+        self.errors = []
+        self.errors_truncated = False
+        self.started = time.monotonic()
+    
+    def error(self, line, error, details=None, duplicate=False):
+        if duplicate:
+            self.duplicates += 1
+        else:
+            self.failed += 1
+        
+        # Keep the report bounded however bad the input is
+        if len(self.errors) >= Config.USER_IMPORT_MAX_ERRORS:
+            self.errors_truncated = True
+            return
+        entry = {'line': line, 'error': error}
+        if details:
+            entry['details'] = details
+        self.errors.append(entry)
+    
+    def to_dict(self):
+        elapsed = time.monotonic() - self.started
+        return {
+            'processed': self.processed,
+            'created': self.created,
+            'duplicates': self.duplicates,
+            'failed': self.failed,
+            'errors': self.errors,
+            'errors_truncated': self.errors_truncated,
+            'elapsed_seconds': round(elapsed, 3),
+            'rows_per_second': round(self.processed / elapsed, 1) if elapsed > 0 else None
+        }
+
+def read_import_rows(stream, content_type):
+    # Yields (line number, row dict or parse error message) one line at a time
+    if content_type == 'text/csv':
+        reader = csv.DictReader(line.decode('utf-8') for line in stream)
+        missing = {'name', 'email', 'phone'} - set(reader.fieldnames or [])
+        if missing:
+            raise ValueError(f"CSV header is missing columns: {', '.join(sorted(missing))}")
+        for row in reader:
+            # DictReader puts fields beyond the header under a None key
+            if None in row:
+                yield reader.line_num, 'Line has more fields than the header'
+                continue
+            yield reader.line_num, row
+        return
+    
+    for line_number, line in enumerate(stream, start=1):
+        if not line.strip():
+            continue
+        try:
+            row = json.loads(line)
+        except ValueError:
+            yield line_number, 'Invalid JSON'
+            continue
+        yield line_number, row if isinstance(row, dict) else 'Line must be a JSON object'
+
+def import_users_chunk(chunk, report):
+    # Drop emails repeated inside the chunk, then those that already exist
+    unique = {}
+    for line_number, user in chunk:
+        key = user.email.lower()
+        if key in unique:
+            report.error(line_number, 'Duplicate email in import', duplicate=True)
+        else:
+            unique[key] = (line_number, user)
+    
+    placeholders, emails = in_list(user.email for _, user in unique.values())
+    existing_query = f"SELECT email FROM users WHERE email IN ({placeholders})"
+    existing = db.execute_query(existing_query, emails, fetch=True, primary=True)
+    if existing is None:
+        for line_number, _ in unique.values():
+            report.error(line_number, 'Failed to create user')
+        return
+    
+    existing = {row['email'].lower() for row in existing}
+    new_users = []
+    for key, (line_number, user) in unique.items():
+        if key in existing:
+            report.error(line_number, 'Email already exists', duplicate=True)
+        else:
+            new_users.append((line_number, user))
+    if not new_users:
+        return
+    
+    # One multi-row INSERT per chunk. Without IGNORE, any rejected row fails the
+    # whole statement, so nothing is silently dropped or miscounted
+    now = datetime.now()
+    values = ', '.join(['(%s, %s, %s, %s)'] * len(new_users))
+    insert_query = f"INSERT INTO users (name, email, phone, created_at) VALUES {values}"
+    params = []
+    for _, user in new_users:
+        params.extend((user.name, user.email, user.phone, now))
+    
+    try:
+        with db.transaction() as tx:
+            created = tx.execute(insert_query, params, prepare=False)
+    except Exception as e:
+        # Retry row by row, so each failure, e.g. an email inserted concurrently,
+        # is reported against its own line
+        created = 0
+        row_query = "INSERT INTO users (name, email, phone, created_at) VALUES (%s, %s, %s, %s)"
+        for line_number, user in new_users:
+            try:
+                with db.transaction() as tx:
+                    created += tx.execute(row_query, (user.name, user.email, user.phone, now))
+            except Exception as e:
+                if db.is_duplicate_error(e):
+                    report.error(line_number, 'Email already exists', duplicate=True)
+                else:
+                    report.error(line_number, 'Failed to create user')
+    
+    report.created += created
+    if created:
+        table_versions.bump('users')
+
+@users_bp.route('/users/import', methods=['POST'])
+def import_users():
+    content_type = request.mimetype
+    if content_type not in ('application/x-ndjson', 'application/jsonl', 'text/csv'):
+        return jsonify({'error': 'Content-Type must be application/x-ndjson or text/csv'}), 415
+    
+    report = ImportReport()
+    chunk = []
+    try:
+        # Stream the body and validate it chunk by chunk, so memory stays bounded
+        for line_number, row in read_import_rows(request.stream, content_type):
+            report.processed += 1
+            if isinstance(row, str):
+                report.error(line_number, row)
+                continue
+            try:
+                chunk.append((line_number, UserCreate(**row)))
+            except ValidationError as e:
+                report.error(line_number, 'Validation error', format_validation_errors(e))
+                continue
+            
+            if len(chunk) >= Config.USER_IMPORT_CHUNK_SIZE:
+                import_users_chunk(chunk, report)
+                chunk = []
+        
+        if chunk:
+            import_users_chunk(chunk, report)
+        
+        return jsonify(report.to_dict()), 200
+        
+    except (ValueError, UnicodeDecodeError) as e:
+        return jsonify({'error': str(e), 'report': report.to_dict()}), 400
+    except Exception as e:
+        return jsonify({'error': 'Failed to import users', 'report': report.to_dict()}), 500
@@ -1,13 +1,20 @@
-from flask import Blueprint, request, jsonify
-from datetime import datetime, date
+from flask import Blueprint, Response, request, jsonify
+from datetime import datetime, date, timedelta
 from pydantic import ValidationError
+from src.catalog import fleet_catalog
+from src.config import Config
 from src.database import DatabaseManager
-from src.schemas import AvailabilityQuery, VehicleAvailabilityResponse
+from src.feed import availability_feed
+from src.occupancy import occupancy_index
+from src.schemas import AvailabilityQuery, CalendarEncoding, CalendarQuery, VehicleAvailabilityResponse, VehicleTypeEnum
+from src.utils import format_validation_errors
+from src.versions import conditional, table_versions
 
 vehicles_bp = Blueprint('vehicles', __name__)
 db = DatabaseManager()
 
 @vehicles_bp.route('/vehicles/availability', methods=['GET'])
+@conditional('bookings', catalog=True, occupancy='pickup_date')
 def check_availability():
     try:
         # Parse query parameters
@@ -36,58 +43,252 @@ def check_availability():
         pickup_date_str = availability_query.pickup_date.strftime('%Y-%m-%d')
         return_date_str = availability_query.return_date.strftime('%Y-%m-%d')
         
-        # Build query based on parameters
-        if availability_query.vehicle_id:
-            query = """
-            SELECT v.*, vt.name as type_name, vt.capacity
-            FROM vehicles v
-            JOIN vehicle_types vt ON v.type_id = vt.id
-            WHERE v.id = %s AND v.id NOT IN (
-                SELECT vehicle_id FROM bookings
-                WHERE status = 'confirmed' AND (
-                    (pickup_date <= %s AND return_date >= %s) OR
-                    (pickup_date <= %s AND return_date >= %s) OR
-                    (pickup_date >= %s AND pickup_date <= %s)
-                )
-            )
+        vehicle_type = availability_query.vehicle_type.value if availability_query.vehicle_type else None
+        
+        # Answer from the in-memory occupancy index when it covers the requested dates
+        result = occupancy_index.available_vehicles(
+            availability_query.pickup_date, availability_query.return_date,
+            vehicle_type=vehicle_type, vehicle_id=availability_query.vehicle_id)
+        
+        if result is None:
+            # Only the booked vehicle ids come from SQL; the fleet is joined from the catalog
+            booked_query = """
+            SELECT DISTINCT vehicle_id FROM bookings
+            WHERE status = 'confirmed' AND pickup_date <= %s AND return_date >= %s
             """
-            params = (availability_query.vehicle_id, pickup_date_str, pickup_date_str,
-                     return_date_str, return_date_str, pickup_date_str, return_date_str)
-        else:
-            base_query = """
-            SELECT v.*, vt.name as type_name, vt.capacity
-            FROM vehicles v
-            JOIN vehicle_types vt ON v.type_id = vt.id
-            WHERE v.id NOT IN (
-                SELECT vehicle_id FROM bookings
-                WHERE status = 'confirmed' AND (
-                    (pickup_date <= %s AND return_date >= %s) OR
-                    (pickup_date <= %s AND return_date >= %s) OR
-                    (pickup_date >= %s AND pickup_date <= %s)
-                )
-            )
+            booked = db.execute_query(booked_query, (return_date_str, pickup_date_str), fetch=True)
+            if booked is None:
+                return jsonify({'error': 'Failed to check availability'}), 500
+            
+            booked_ids = {row['vehicle_id'] for row in booked}
+            candidates = fleet_catalog.snapshot().select(vehicle_type, availability_query.vehicle_id)
+            result = [vehicle for vehicle in candidates if vehicle.id not in booked_ids]
+        
+        return jsonify([vehicle.to_dict() for vehicle in result]), 200
+        
+    except ValidationError as e:
+        return jsonify({'error': 'Validation error', 'details': format_validation_errors(e)}), 400
+    except ValueError as e:
+        return jsonify({'error': 'Invalid date format. Use YYYY-MM-DD'}), 400
+    except Exception as e:
+        return jsonify({'error': 'Failed to check availability'}), 500
+
+@vehicles_bp.route('/vehicles/availability/counts', methods=['GET'])
+@conditional('bookings', catalog=True, occupancy='pickup_date')
+def availability_counts():
+    try:
+        # Parse query parameters
+        query_params = {
+            'pickup_date': request.args.get('pickup_date'),
+            'return_date': request.args.get('return_date')
+        }
+        
+        # Remove None values
+        query_params = {k: v for k, v in query_params.items() if v is not None}
+        
+        # Convert string dates to date objects
+        if 'pickup_date' in query_params:
+            query_params['pickup_date'] = datetime.strptime(query_params['pickup_date'], '%Y-%m-%d').date()
+        if 'return_date' in query_params:
+            query_params['return_date'] = datetime.strptime(query_params['return_date'], '%Y-%m-%d').date()
+        
+        # Validate using Pydantic
+        availability_query = AvailabilityQuery(**query_params)
+        
+        counts = occupancy_index.available_counts(availability_query.pickup_date, availability_query.return_date)
+        
+        if counts is None:
+            # Fleet size per type from the catalog, minus the booked vehicles of each type
+            booked_query = """
+            SELECT DISTINCT vehicle_id FROM bookings
+            WHERE status = 'confirmed' AND pickup_date <= %s AND return_date >= %s
             """
-            params = [pickup_date_str, pickup_date_str, return_date_str, return_date_str, pickup_date_str, return_date_str]
+            booked = db.execute_query(booked_query, (availability_query.return_date, availability_query.pickup_date), fetch=True)
+            if booked is None:
+                return jsonify({'error': 'Failed to check availability'}), 500
             
-            if availability_query.vehicle_type:
-                base_query += " AND vt.name = %s"
-                params.append(availability_query.vehicle_type.value)
+            snapshot = fleet_catalog.snapshot()
+            counts = {name: len(vehicles) for name, vehicles in snapshot.by_type.items()}
+            for row in booked:
+                vehicle = snapshot.by_id.get(row['vehicle_id'])
+                if vehicle is not None:
+                    counts[vehicle.vehicle_type.name] -= 1
+        
+        # Every vehicle type is listed, with 0 when none is free
+        counts = {vehicle_type.value: counts.get(vehicle_type.value, 0) for vehicle_type in VehicleTypeEnum}
+        return jsonify({
+            'pickup_date': availability_query.pickup_date.isoformat(),
+            'return_date': availability_query.return_date.isoformat(),
+            'counts': counts,
+            'total': sum(counts.values())
+        }), 200
+        
+    except ValidationError as e:
+        return jsonify({'error': 'Validation error', 'details': format_validation_errors(e)}), 400
+    except ValueError as e:
+        return jsonify({'error': 'Invalid date format. Use YYYY-MM-DD'}), 400
+    except Exception as e:
+        return jsonify({'error': 'Failed to check availability'}), 500
+
+@vehicles_bp.route('/vehicles/availability/stream', methods=['GET'])
+def availability_stream():
+    try:
+        # Parse query parameters
+        query_params = {
+            'pickup_date': request.args.get('pickup_date'),
+            'return_date': request.args.get('return_date'),
+            'vehicle_type': request.args.get('type'),
+            'vehicle_id': request.args.get('vehicle_id')
+        }
+        
+        # Remove None values
+        query_params = {k: v for k, v in query_params.items() if v is not None}
+        
+        # Convert string dates to date objects
+        if 'pickup_date' in query_params:
+            query_params['pickup_date'] = datetime.strptime(query_params['pickup_date'], '%Y-%m-%d').date()
+        if 'return_date' in query_params:
+            query_params['return_date'] = datetime.strptime(query_params['return_date'], '%Y-%m-%d').date()
+        if 'vehicle_id' in query_params:
+            query_params['vehicle_id'] = int(query_params['vehicle_id'])
+        
+        # Validate using Pydantic
+        availability_query = AvailabilityQuery(**query_params)
+        
+        # Changes are computed from the occupancy index, so it must cover the dates
+        if not occupancy_index.ready:
+            return jsonify({'error': 'Availability stream is not available'}), 503
+        if not occupancy_index.covers(availability_query.pickup_date):
+            return jsonify({'error': 'Availability stream covers pickup dates from today'}), 400
+        
+        vehicle_type = availability_query.vehicle_type.value if availability_query.vehicle_type else None
+        subscription = availability_feed.subscribe(
+            availability_query.pickup_date, availability_query.return_date,
+            vehicle_type=vehicle_type, vehicle_id=availability_query.vehicle_id)
+        if subscription is None:
+            response = jsonify({'error': 'Too many availability subscribers, please retry later'})
+            response.status_code = 503
+            response.headers['Retry-After'] = str(int(Config.AVAILABILITY_STREAM_RETRY))
+            return response
+        
+        # The stream runs outside the request, holding no database connection
+        response = Response(availability_feed.stream(subscription), mimetype='text/event-stream', headers={
+            'Cache-Control': 'no-cache',
+            'X-Accel-Buffering': 'no'
+        })
+        # The stream's own cleanup only runs once it has started, which a HEAD
+        # request or a client gone before the first chunk never does
+        response.call_on_close(lambda: availability_feed.unsubscribe(subscription))
+        return response
+        
+    except ValidationError as e:
+        return jsonify({'error': 'Validation error', 'details': format_validation_errors(e)}), 400
+    except ValueError as e:
+        return jsonify({'error': 'Invalid date format. Use YYYY-MM-DD'}), 400
+    except Exception as e:
+        return jsonify({'error': 'Failed to open availability stream'}), 500
+
+def encode_bitmap(bitmap, days):
+    # One character per day, '1' when the vehicle is booked
+    return format(bitmap, f'0{days}b')[::-1]
+
+def encode_runs(bitmap):
+    # [offset, length] of each run of booked days
+    runs = []
+    offset = 0
+    while bitmap:
+        if bitmap & 1:
+            length = 0
+            while bitmap & 1:
+                bitmap >>= 1
+                length += 1
+            runs.append([offset, length])
+            offset += length
+        else:
+            bitmap >>= 1
+            offset += 1
+    return runs
+
+@vehicles_bp.route('/vehicles/calendar', methods=['GET'])
+@conditional('bookings', catalog=True, occupancy='from')
+def availability_calendar():
+    try:
+        # Parse query parameters
+        query_params = {
+            'date_from': request.args.get('from'),
+            'days': request.args.get('days'),
+            'vehicle_type': request.args.get('type'),
+            'encoding': request.args.get('encoding')
+        }
+        
+        # Remove None values
+        query_params = {k: v for k, v in query_params.items() if v is not None}
+        
+        # Convert string date to date object
+        if 'date_from' in query_params:
+            query_params['date_from'] = datetime.strptime(query_params['date_from'], '%Y-%m-%d').date()
+        
+        # Validate using Pydantic
+        calendar_query = CalendarQuery(**query_params)
+        
+        first_day = calendar_query.date_from
+        days = calendar_query.days
+        last_day = first_day + timedelta(days=days - 1)
+        vehicle_type = calendar_query.vehicle_type.value if calendar_query.vehicle_type else None
+        
+        # Bitmaps from the occupancy index, or built in one pass over the bookings in range
+        calendar = occupancy_index.booked_days(first_day, days, vehicle_type)
+        if calendar is None:
+            booked_query = """
+            SELECT vehicle_id, pickup_date, return_date FROM bookings
+            WHERE status = 'confirmed' AND pickup_date <= %s AND return_date >= %s
+            """
+            booked = db.execute_query(booked_query, (last_day, first_day), fetch=True)
+            if booked is None:
+                return jsonify({'error': 'Failed to build availability calendar'}), 500
             
-            query = base_query + " ORDER BY vt.name, v.model"
+            bitmaps = {}
+            for row in booked:
+                first = max((row['pickup_date'] - first_day).days, 0)
+                last = min((row['return_date'] - first_day).days, days - 1)
+                bitmaps[row['vehicle_id']] = bitmaps.get(row['vehicle_id'], 0) | (((1 << (last - first + 1)) - 1) << first)
+            candidates = fleet_catalog.snapshot().select(vehicle_type)
+            calendar = [(vehicle, bitmaps.get(vehicle.id, 0)) for vehicle in candidates]
         
-        result = db.execute_query(query, params, fetch=True)
-        return jsonify(result or []), 200
+        if calendar_query.encoding == CalendarEncoding.runs:
+            encode = encode_runs
+        else:
+            encode = lambda bitmap: encode_bitmap(bitmap, days)
+        
+        return jsonify({
+            'from': first_day.isoformat(),
+            'days': days,
+            'encoding': calendar_query.encoding.value,
+            'vehicles': [{
+                'id': vehicle.id,
+                'model': vehicle.model,
+                'license_plate': vehicle.license_plate,
+                'vehicle_type': vehicle.vehicle_type.name,
+                'booked': encode(bitmap)
+            } for vehicle, bitmap in calendar]
+        }), 200
         
     except ValidationError as e:
-        error_details = []
-        for error in e.errors():
-            error_details.append({
-                'field': error.get('loc', ['unknown'])[0] if error.get('loc') else 'unknown',
-                'message': error.get('msg', 'Validation error'),
-                'type': error.get('type', 'validation_error')
-            })
-        return jsonify({'error': 'Validation error', 'details': error_details}), 400
+        return jsonify({'error': 'Validation error', 'details': format_validation_errors(e)}), 400
     except ValueError as e:
         return jsonify({'error': 'Invalid date format. Use YYYY-MM-DD'}), 400
     except Exception as e:
-        return jsonify({'error': 'Failed to check availability'}), 500
\ No newline at end of file
+        return jsonify({'error': 'Failed to build availability calendar'}), 500
+
+@vehicles_bp.route('/vehicles/catalog/refresh', methods=['POST'])
+def refresh_catalog():
+    # Call after changing vehicles or rates so the API stops serving the cached catalog
+    try:
+        fleet_catalog.invalidate()
+        fleet_catalog.snapshot()
+        
+        # Other processes reload their catalogs when they see the vehicles counter move
+        table_versions.bump('vehicles')
+        return jsonify(fleet_catalog.stats()), 200
+    except Exception as e:
+        return jsonify({'error': 'Failed to refresh fleet catalog'}), 500
\ No newline at end of file
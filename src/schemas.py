@@ -23,6 +23,14 @@ class VehicleTypeEnum(str, Enum):
     suv = "suv"
     van = "van"
 
+class BatchBookingMode(str, Enum):
+    all_or_nothing = "all_or_nothing"
+    partial = "partial"
+
+class CalendarEncoding(str, Enum):
+    bitmap = "bitmap"
+    runs = "runs"
+
 # User Schemas
 class UserBase(BaseModel):
     name: str
@@ -198,6 +206,21 @@ class InvoiceResponse(InvoiceBase):
     class Config:
         from_attributes = True
 
+# User List Query Schema
+class UserListQuery(BaseModel):
+    limit: int = 50
+    cursor: Optional[str] = None
+    email: Optional[str] = None
+    name: Optional[str] = None
+    created_from: Optional[date] = None
+    created_to: Optional[date] = None
+    
+    @validator('limit')
+    def validate_limit(cls, v):
+        if v < 1 or v > 500:
+            raise ValueError('Limit must be between 1 and 500')
+        return v
+
 # Availability Query Schema
 class AvailabilityQuery(BaseModel):
     pickup_date: date
@@ -221,6 +244,37 @@ class AvailabilityQuery(BaseModel):
         
         return v
 
+# Last day a booking can cover: pickup up to 7 days ahead, for up to 7 days
+BOOKING_HORIZON_DAYS = 14
+
+class CalendarQuery(BaseModel):
+    date_from: Optional[date] = None
+    days: Optional[int] = None
+    vehicle_type: Optional[VehicleTypeEnum] = None
+    encoding: CalendarEncoding = CalendarEncoding.bitmap
+    
+    @validator('date_from', always=True)
+    def validate_date_from(cls, v):
+        today = date.today()
+        v = v or today
+        if v < today:
+            raise ValueError('Calendar cannot start in the past')
+        if (v - today).days > BOOKING_HORIZON_DAYS:
+            raise ValueError(f'Calendar cannot start more than {BOOKING_HORIZON_DAYS} days ahead')
+        return v
+    
+    @validator('days', always=True)
+    def validate_days(cls, v, values):
+        if 'date_from' not in values:
+            return v
+        # Up to the end of the booking horizon, which is also the default
+        remaining = BOOKING_HORIZON_DAYS - (values['date_from'] - date.today()).days + 1
+        if v is None:
+            return remaining
+        if v < 1 or v > remaining:
+            raise ValueError(f'Days must be between 1 and {remaining}')
+        return v
+
 # Daily Report Schema
 class DailyReportQuery(BaseModel):
     date: date
@@ -242,6 +296,21 @@ class DailyReportResponse(BaseModel):
     class Config:
         from_attributes = True
 
+# Summary Report Schema
+class SummaryReportQuery(BaseModel):
+    date_from: date
+    date_to: date
+    vehicle_type: Optional[VehicleTypeEnum] = None
+    
+    @validator('date_to')
+    def validate_range(cls, v, values):
+        if 'date_from' in values:
+            if v < values['date_from']:
+                raise ValueError('End date must not be before start date')
+            if (v - values['date_from']).days >= 366:
+                raise ValueError('Summary range cannot exceed 366 days')
+        return v
+
 # Error Response Schema
 class ErrorResponse(BaseModel):
     error: str
@@ -0,0 +1,79 @@
+from datetime import date, datetime, timezone
+from decimal import Decimal
+from typing import List
+from flask.json.provider import DefaultJSONProvider
+from pydantic import TypeAdapter, ValidationError
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+# Bulk validation: one TypeAdapter call validates and dumps a whole page of rows
+# in pydantic-core, instead of building and dumping one model per row. Rows that
+# were validated when written can skip it (validate=False); they are only
+# projected onto the model's fields.
+class RowSerializer:
+    def __init__(self, model, validate=True):
+        self.model = model
+        self.validate = validate
+        self.adapter = TypeAdapter(List[model])
+        self.fields = tuple(model.model_fields)
+
+    def dump(self, rows):
+        if not self.validate:
+            fields = self.fields
+            return [{field: row.get(field) for field in fields} for row in rows]
+        return self.adapter.dump_python(self.adapter.validate_python(rows))
+
+    def dump_lenient(self, rows):
+        # Rows that fail validation are returned raw, as the per-row code did
+        try:
+            return self.dump(rows)
+        except ValidationError:
+            dumped = []
+            for row in rows:
+                try:
+                    dumped.append(self.model(**row).model_dump())
+                except ValidationError:
+                    dumped.append(row)
+            return dumped
+
+_DAYS = ('Mon', 'Tue', 'Wed', 'Thu', 'Fri', 'Sat', 'Sun')
+_MONTHS = ('Jan', 'Feb', 'Mar', 'Apr', 'May', 'Jun', 'Jul', 'Aug', 'Sep', 'Oct', 'Nov', 'Dec')
+
+def http_date(value):
+    # Same output as werkzeug.http.http_date, which Flask's provider uses
+    if isinstance(value, datetime):
+        if value.tzinfo is not None:
+            value = value.astimezone(timezone.utc)
+        return (f'{_DAYS[value.weekday()]}, {value.day:02d} {_MONTHS[value.month - 1]} {value.year:04d} '
+                f'{value.hour:02d}:{value.minute:02d}:{value.second:02d} GMT')
+    return f'{_DAYS[value.weekday()]}, {value.day:02d} {_MONTHS[value.month - 1]} {value.year:04d} 00:00:00 GMT'
+
+def _default(value):
+    if isinstance(value, date):
+        return http_date(value)
+    if isinstance(value, Decimal):
+        return str(value)
+    return DefaultJSONProvider.default(value)
+
+# JSON provider backed by orjson. Keeps the wire format of Flask's default
+# provider (sorted keys, RFC 822 dates, decimals as strings), except that
+# non-ASCII text is sent as UTF-8 instead of \u escapes.
+class OrjsonProvider(DefaultJSONProvider):
+    def dumps(self, obj, **kwargs):
+        option = orjson.OPT_PASSTHROUGH_DATETIME | orjson.OPT_NON_STR_KEYS
+        if kwargs.get('sort_keys', self.sort_keys):
+            option |= orjson.OPT_SORT_KEYS
+        if kwargs.get('indent'):
+            option |= orjson.OPT_INDENT_2
+        return orjson.dumps(obj, default=kwargs.get('default', _default), option=option).decode()
+
+    def loads(self, s, **kwargs):
+        return orjson.loads(s)
+
+def create_json_provider(app):
+    if orjson is None:
+        return DefaultJSONProvider(app)
+    return OrjsonProvider(app)
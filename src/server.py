@@ -0,0 +1,152 @@
+import argparse
+import fcntl
+import os
+import sys
+import threading
+from gunicorn.app.base import BaseApplication
+from gunicorn.workers.gthread import ThreadWorker
+from src.config import Config
+from src.app import create_app, metric_gauges, start_services, start_singleton_services
+from src.database import DatabaseManager
+from src.feed import availability_feed
+from src.idempotency import idempotency_store
+from src.metrics import archive_exited_workers, archive_worker, metrics
+from src.outbox import email_outbox
+
+LEADER_LOCK = 'leader.lock'
+REPLICA_STATE = 'replicas.json'
+METRICS_DIR = 'metrics'
+
+# Gunicorn's threaded worker, with a drain that does not wait on idle clients:
+# availability streams never end on their own, and keep-alive connections would
+# be served new requests until they time out. Both are closed when draining starts.
+class Worker(ThreadWorker):
+    def handle_exit(self, sig, frame):
+        if self.alive:
+            self.method_queue.defer(self.close_idle)
+        super().handle_exit(sig, frame)
+
+    def close_idle(self):
+        # Runs on the worker's main thread, which owns the poller; clients reconnect to another worker
+        availability_feed.close()
+        for conns in (self.keepalived_conns, self.pending_conns):
+            while conns:
+                conn = conns.popleft()
+                try:
+                    self.poller.unregister(conn.sock)
+                except (OSError, KeyError, ValueError):
+                    pass
+                self.nr_conns -= 1
+                conn.close()
+
+def on_starting(server):
+    # USR2 re-executes the master; start it the way it was started (python -m src.server)
+    server.START_CTX['args'] = [sys.executable] + sys.orig_argv[1:]
+    os.makedirs(Config.SERVER_STATE_DIR, exist_ok=True)
+    archive_exited_workers(os.path.join(Config.SERVER_STATE_DIR, METRICS_DIR))
+
+def post_fork(server, worker):
+    # The worker opens its own connections: the master's would share their sockets
+    DatabaseManager._reset_after_fork()
+
+def post_worker_init(worker):
+    # Start background services and open connections before taking traffic
+    start_services(singletons=False)
+    DatabaseManager.share_replica_state(os.path.join(Config.SERVER_STATE_DIR, REPLICA_STATE))
+    metrics.share(os.path.join(Config.SERVER_STATE_DIR, METRICS_DIR), Config.METRICS_WRITE_INTERVAL, metric_gauges)
+    try:
+        DatabaseManager().warm(Config.SERVER_WARM_CONNECTIONS)
+    except Exception as e:
+        print(f"Worker {os.getpid()}: database warm-up failed: {e}")
+    elect_leader(worker, os.path.join(Config.SERVER_STATE_DIR, LEADER_LOCK))
+
+def worker_exit(server, worker):
+    # Let the leader finish the emails it is sending before the next one takes over
+    if getattr(worker, 'leader_lock', None) is not None:
+        email_outbox.stop(Config.SERVER_GRACEFUL_TIMEOUT)
+    # The final counts, which the master archives
+    try:
+        metrics.write()
+    except Exception as e:
+        print(f"Worker {os.getpid()}: metrics write failed: {e}")
+
+def child_exit(server, worker):
+    # Keep an exited worker's counts in the totals
+    archive_worker(os.path.join(Config.SERVER_STATE_DIR, METRICS_DIR), worker.pid)
+
+def elect_leader(worker, path):
+    # Every worker waits for the lock on path; the one holding it runs the
+    # singleton services (replica checks, outbox, invoicing). The kernel releases
+    # the lock when its holder exits, and a waiting worker takes over.
+    def wait_for_lock():
+        lock_file = open(path, 'a')
+        fcntl.flock(lock_file, fcntl.LOCK_EX)
+        worker.leader_lock = lock_file
+        print(f"Worker {os.getpid()} runs the singleton services")
+        start_singleton_services()
+
+    threading.Thread(target=wait_for_lock, name='leader-election', daemon=True).start()
+
+# Serves the app with gunicorn. The app is built once in the master
+# (preload_app), without database connections or threads, so imports and schema
+# compilation are paid once and shared copy-on-write by the forked workers.
+class Server(BaseApplication):
+    def __init__(self, options):
+        self.options = options
+        super().__init__()
+
+    def load_config(self):
+        for key, value in self.options.items():
+            self.cfg.set(key, value)
+
+    def load(self):
+        app = create_app(services=False)
+        app.url_map.update()
+        return app
+
+def server_options(host, port, workers, reuse_port=False, pidfile=None):
+    return {
+        'bind': [f'[{host}]:{port}' if ':' in host else f'{host}:{port}'],
+        'workers': workers,
+        'worker_class': Worker,
+        'threads': Config.SERVER_THREADS,
+        'preload_app': True,
+        'reuse_port': reuse_port,
+        'backlog': Config.SERVER_BACKLOG,
+        'keepalive': Config.SERVER_KEEPALIVE,
+        # Workers that do not report in for this long, warm-up included, are replaced
+        'timeout': int(Config.SERVER_READY_TIMEOUT),
+        'graceful_timeout': int(Config.SERVER_GRACEFUL_TIMEOUT),
+        'pidfile': pidfile,
+        'on_starting': on_starting,
+        'post_fork': post_fork,
+        'post_worker_init': post_worker_init,
+        'worker_exit': worker_exit,
+        'child_exit': child_exit
+    }
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Serve the API with preforked worker processes')
+    parser.add_argument('--host', default=Config.HOST)
+    parser.add_argument('--port', type=int, default=Config.PORT)
+    parser.add_argument('--workers', type=int, default=Config.SERVER_WORKERS, help='Worker processes, 0 for one per CPU')
+    parser.add_argument('--reuse-port', action='store_true', default=Config.SERVER_REUSE_PORT,
+                        help='Give each worker its own SO_REUSEPORT listener instead of sharing one socket')
+    parser.add_argument('--pid', help='Write the master pid to this file; a master started by USR2 writes <file>.2 until the old one exits')
+    args = parser.parse_args()
+
+    workers = args.workers or os.cpu_count() or 1
+    if Config.DB_ENGINE == 'sqlite' and Config.SQLITE_PATH == ':memory:' and workers > 1:
+        parser.error('an in-memory SQLite database cannot be shared by worker processes; set SQLITE_PATH to a file')
+    # A retry can reach another worker than the first request, which only the table lets it see
+    if workers > 1 and not Config.IDEMPOTENCY_SHARED:
+        print("IDEMPOTENCY_SHARED is off; turning it on, since retries can reach any worker")
+        Config.IDEMPOTENCY_SHARED = True
+        idempotency_store.shared = True
+    # Each availability stream holds one of its worker's threads while it is open
+    max_streams = Config.SERVER_THREADS // 2
+    if Config.AVAILABILITY_STREAM_MAX_SUBSCRIBERS > max_streams:
+        print(f"Availability streams capped at {max_streams} per worker, half of SERVER_THREADS")
+        Config.AVAILABILITY_STREAM_MAX_SUBSCRIBERS = max_streams
+
+    Server(server_options(args.host, args.port, workers, args.reuse_port, args.pid)).run()
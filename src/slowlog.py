@@ -0,0 +1,224 @@
+import argparse
+import fcntl
+import glob
+import hashlib
+import json
+import logging
+import os
+import re
+import threading
+from datetime import date, datetime
+from decimal import Decimal
+from functools import lru_cache
+from logging.handlers import RotatingFileHandler
+from src.config import Config
+
+STRING_LITERAL = re.compile(r"'(?:[^'\\]|\\.|'')*'")
+NUMBER_LITERAL = re.compile(r'\b\d+(?:\.\d+)?\b')
+PLACEHOLDER = re.compile(r'%s|\?')
+IN_LIST = re.compile(r'\bIN\s*\(\s*\?(?:\s*,\s*\?)*\s*\)', re.I)
+WHITESPACE = re.compile(r'\s+')
+
+# Statements EXPLAIN accepts on both engines
+EXPLAINABLE = ('SELECT', 'UPDATE', 'DELETE', 'INSERT', 'REPLACE', 'WITH')
+
+@lru_cache(maxsize=1024)
+def normalize(query):
+    # Literals and placeholders become ?, IN lists of any length become IN (...)
+    sql = STRING_LITERAL.sub('?', query)
+    sql = NUMBER_LITERAL.sub('?', sql)
+    sql = PLACEHOLDER.sub('?', sql)
+    sql = IN_LIST.sub('IN (...)', sql)
+    sql = WHITESPACE.sub(' ', sql).strip()
+    return sql, hashlib.sha1(sql.encode()).hexdigest()[:12]
+
+def params_shape(params):
+    # Types only, never values: parameters carry customer data
+    if not params:
+        return []
+    shape = [type(param).__name__ for param in params]
+    if len(shape) > 20:
+        return shape[:20] + [f'... {len(shape)} total']
+    return shape
+
+def _json_default(value):
+    if isinstance(value, (date, datetime)):
+        return value.isoformat()
+    if isinstance(value, Decimal):
+        return str(value)
+    if isinstance(value, (bytes, bytearray)):
+        return value.decode(errors='replace')
+    return str(value)
+
+# A RotatingFileHandler that several processes, e.g. server workers, can share.
+# Each write holds an exclusive lock on <log>.lock, so one process rotates at a
+# time, and a process reopens the log when another one has rotated it.
+class SharedRotatingFileHandler(RotatingFileHandler):
+    def __init__(self, filename, maxBytes, backupCount):
+        super().__init__(filename, maxBytes=maxBytes, backupCount=backupCount, delay=True)
+        self.lock_path = f'{self.baseFilename}.lock'
+        self._lock_file = None
+        self._lock_pid = None
+
+    def emit(self, record):
+        # Locks opened before a fork would be shared with the parent
+        if self._lock_pid != os.getpid():
+            self._lock_file = open(self.lock_path, 'a')
+            self._lock_pid = os.getpid()
+        fcntl.flock(self._lock_file, fcntl.LOCK_EX)
+        try:
+            if self.stream is not None and self._rotated():
+                self.stream.close()
+                self.stream = None
+            super().emit(record)
+        finally:
+            fcntl.flock(self._lock_file, fcntl.LOCK_UN)
+
+    def _rotated(self):
+        try:
+            return os.stat(self.baseFilename).st_ino != os.fstat(self.stream.fileno()).st_ino
+        except FileNotFoundError:
+            return True
+
+# Statements slower than SLOW_QUERY_THRESHOLD_MS are written as JSON lines to a
+# rotating log, with the plan of the first slow execution of each normalized query
+class SlowQueryLog:
+    MAX_EXPLAINED = 10000
+
+    def __init__(self):
+        self.threshold = Config.SLOW_QUERY_THRESHOLD_MS / 1000
+        self.enabled = Config.SLOW_QUERY_THRESHOLD_MS > 0
+        self.lock = threading.Lock()
+        self.explained = set()
+        self._logger = None
+
+    @property
+    def logger(self):
+        if self._logger is None:
+            with self.lock:
+                if self._logger is None:
+                    logger = logging.getLogger('vehicle_rental.slow_queries')
+                    logger.setLevel(logging.INFO)
+                    logger.propagate = False
+                    handler = SharedRotatingFileHandler(
+                        Config.SLOW_QUERY_LOG_PATH,
+                        maxBytes=Config.SLOW_QUERY_LOG_MAX_BYTES,
+                        backupCount=Config.SLOW_QUERY_LOG_BACKUPS
+                    )
+                    handler.setFormatter(logging.Formatter('%(message)s'))
+                    logger.addHandler(handler)
+                    self._logger = logger
+        return self._logger
+
+    def is_slow(self, elapsed):
+        return self.enabled and elapsed >= self.threshold
+
+    def record(self, backend, connection, query, params, elapsed, rows, batch=None, error=False):
+        # Called after the statement finished, with the connection that ran it, or
+        # None when no plan should be taken (failed statements, executemany batches)
+        sql, fingerprint = normalize(query)
+        entry = {
+            'ts': datetime.now().isoformat(timespec='milliseconds'),
+            'fingerprint': fingerprint,
+            'sql': sql,
+            'params': params_shape(params),
+            'duration_ms': round(elapsed * 1000, 3),
+            'rows': rows
+        }
+        if batch is not None:
+            entry['batch_size'] = batch
+        if error:
+            entry['error'] = True
+
+        if connection is not None and sql.upper().startswith(EXPLAINABLE):
+            with self.lock:
+                first = fingerprint not in self.explained and len(self.explained) < self.MAX_EXPLAINED
+                if first:
+                    self.explained.add(fingerprint)
+            if first:
+                try:
+                    entry['plan'] = backend.explain(connection, query, params)
+                except Exception as e:
+                    entry['plan_error'] = str(e)
+
+        try:
+            self.logger.info(json.dumps(entry, default=_json_default))
+        except Exception as e:
+            print(f"Slow query log error: {e}")
+
+slow_query_log = SlowQueryLog()
+
+# Summary CLI
+
+def read_entries(path):
+    # The current log and its rotated backups, oldest first; other files next to
+    # it, like the handler's .lock, are not log segments
+    suffixes = [log_path[len(path) + 1:] for log_path in glob.glob(glob.escape(path) + '.*')]
+    backups = sorted((int(suffix) for suffix in suffixes if suffix.isdigit()), reverse=True)
+    for log_path in [f'{path}.{backup}' for backup in backups] + [path]:
+        try:
+            with open(log_path) as log_file:
+                for line in log_file:
+                    try:
+                        yield json.loads(line)
+                    except ValueError:
+                        continue
+        except FileNotFoundError:
+            continue
+
+def percentile(sorted_values, fraction):
+    index = min(int(round(fraction * (len(sorted_values) - 1))), len(sorted_values) - 1)
+    return sorted_values[index]
+
+def full_scans(plan):
+    # Tables read without an index: MySQL access type ALL, SQLite "SCAN <table>"
+    scans = []
+    for row in plan or []:
+        if row.get('type') == 'ALL':
+            scans.append(row.get('table'))
+        detail = row.get('detail') or ''
+        if detail.startswith('SCAN ') and detail != 'SCAN CONSTANT ROW':
+            scans.append(detail[5:])
+    return scans
+
+def summarize(path, top):
+    queries = {}
+    for entry in read_entries(path):
+        summary = queries.setdefault(entry['fingerprint'], {'sql': entry['sql'], 'durations': [], 'rows': 0, 'plan': None})
+        summary['durations'].append(entry['duration_ms'])
+        summary['rows'] += entry.get('rows') or 0
+        if entry.get('plan') is not None:
+            summary['plan'] = entry['plan']
+
+    if not queries:
+        print(f"No slow queries in {path}")
+        return
+
+    ranked = []
+    for fingerprint, summary in queries.items():
+        durations = sorted(summary['durations'])
+        ranked.append((percentile(durations, 0.99), fingerprint, summary, durations))
+    ranked.sort(key=lambda item: (item[0], len(item[3])), reverse=True)
+
+    print(f"{'fingerprint':<14}{'count':>8}{'p50 ms':>11}{'p99 ms':>11}{'max ms':>11}{'avg rows':>10}  query")
+    for p99, fingerprint, summary, durations in ranked[:top]:
+        sql = summary['sql'] if len(summary['sql']) <= 100 else summary['sql'][:97] + '...'
+        print(f"{fingerprint:<14}{len(durations):>8}{percentile(durations, 0.5):>11.1f}{p99:>11.1f}"
+              f"{durations[-1]:>11.1f}{summary['rows'] / len(durations):>10.0f}  {sql}")
+
+    print("\nWorst plans:")
+    for p99, fingerprint, summary, durations in ranked[:top]:
+        if summary['plan'] is None:
+            continue
+        scans = full_scans(summary['plan'])
+        print(f"\n{fingerprint}  p99 {p99:.1f} ms" + (f"  FULL SCAN: {', '.join(map(str, scans))}" if scans else ''))
+        print(f"  {summary['sql']}")
+        for row in summary['plan']:
+            print('  ' + json.dumps(row, default=_json_default, sort_keys=True))
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Summarize the slow query log by normalized query')
+    parser.add_argument('path', nargs='?', default=Config.SLOW_QUERY_LOG_PATH, help='Log file (rotated backups are read too)')
+    parser.add_argument('--top', type=int, default=10, help='Number of queries to show, slowest p99 first')
+    args = parser.parse_args()
+    summarize(args.path, args.top)
@@ -16,4 +16,14 @@ def validate_json(*required_fields):
             
             return f(*args, **kwargs)
         return decorated_function
-    return decorator
\ No newline at end of file
+    return decorator
+
+def format_validation_errors(error):
+    error_details = []
+    for err in error.errors():
+        error_details.append({
+            'field': err.get('loc', ['unknown'])[0] if err.get('loc') else 'unknown',
+            'message': err.get('msg', 'Validation error'),
+            'type': err.get('type', 'validation_error')
+        })
+    return error_details
@@ -0,0 +1,137 @@
+import hashlib
+import threading
+import time
+from datetime import date, datetime
+from functools import wraps
+from flask import make_response, request
+from src.catalog import fleet_catalog
+from src.database import DatabaseManager
+from src.occupancy import occupancy_index
+
+# Change counters for the bookings, users and vehicles tables. Every API write
+# bumps the counter of the table it changes, so a response computed from those
+# tables can be identified by the counters it was computed at.
+class TableVersions:
+    def __init__(self):
+        self.db = DatabaseManager()
+        self._watcher = None
+        self._seen = None
+
+        # Called with no arguments when a table's counter moves, e.g. by the fleet catalog
+        self.listeners = {}
+
+    def bump(self, *tables):
+        # Call after the write has committed. Bumping inside the transaction would
+        # hold the counter row's lock until commit, serializing every writer of the table.
+        placeholders = ', '.join(['%s'] * len(tables))
+        query = f"UPDATE table_versions SET version = version + 1 WHERE table_name IN ({placeholders})"
+        return self.db.execute_query(query, sorted(tables))
+
+    def current(self, tables, primary=False):
+        placeholders = ', '.join(['%s'] * len(tables))
+        query = f"SELECT table_name, version FROM table_versions WHERE table_name IN ({placeholders})"
+        rows = self.db.execute_query(query, sorted(tables), fetch=True, primary=primary)
+        if rows is None:
+            return None
+        return {row['table_name']: row['version'] for row in rows}
+
+    def watch(self, table, listener):
+        self.listeners.setdefault(table, []).append(listener)
+
+    def start(self, poll_interval):
+        # Polls the counters of watched tables, so writes made by other processes
+        # reach this one's caches
+        if poll_interval > 0 and self.listeners and self._watcher is None:
+            self._watcher = threading.Thread(
+                target=self._watch_forever, args=(poll_interval,), name='version-watcher', daemon=True)
+            self._watcher.start()
+
+    def _watch_forever(self, interval):
+        while True:
+            time.sleep(interval)
+            try:
+                self.poll()
+            except Exception as e:
+                print(f"Table version poll failed: {e}")
+
+    def poll(self):
+        # Calls the listeners of every watched table whose counter moved since the last poll
+        versions = self.current(list(self.listeners), primary=True)
+        if versions is None:
+            return
+        seen, self._seen = self._seen, versions
+        if seen is None:
+            return
+
+        for table, listeners in self.listeners.items():
+            if versions.get(table) == seen.get(table):
+                continue
+            for listener in listeners:
+                try:
+                    listener()
+                except Exception as e:
+                    print(f"Table version listener failed: {e}")
+
+table_versions = TableVersions()
+
+def _first_day(value):
+    if value is None:
+        return date.today()
+    try:
+        return datetime.strptime(value, '%Y-%m-%d').date()
+    except ValueError:
+        return None
+
+def conditional(*tables, catalog=False, occupancy=None):
+    # Tags 200 responses with an ETag derived from the request and the state the
+    # view reads, and answers a matching If-None-Match with 304 before the view
+    # runs. The state is read first, so a write racing with the view can only
+    # make the tag older than the body, never newer:
+    # - tables: views reading these tables are tagged with their version counters,
+    #   which writers bump after commit
+    # - catalog: views reading the fleet catalog are tagged with the snapshot they
+    #   will use, which also covers vehicle changes made outside the API
+    # - occupancy: the query argument with the first day of the view's date range,
+    #   today when missing. When the occupancy index covers that day the view
+    #   answers from the index, so the index's version stands in for the bookings
+    #   counter and no query is made.
+    def decorator(view):
+        @wraps(view)
+        def wrapper(*args, **kwargs):
+            versions = {}
+            queried = tables
+            if occupancy is not None:
+                first_day = _first_day(request.args.get(occupancy))
+                if first_day is not None and occupancy_index.covers(first_day):
+                    versions['occupancy'] = occupancy_index.version()
+                    queried = [table for table in tables if table != 'bookings']
+
+            if queried:
+                counters = table_versions.current(queried)
+                if counters is None:
+                    return view(*args, **kwargs)
+                versions.update(counters)
+            if catalog:
+                versions['catalog'] = fleet_catalog.snapshot().digest
+
+            key = '|'.join([
+                request.path,
+                '&'.join(f'{k}={v}' for k, v in sorted(request.args.items(multi=True))),
+                ','.join(f'{name}:{version}' for name, version in sorted(versions.items())),
+                # Answers depend on today's date (validation, index window)
+                date.today().isoformat()
+            ])
+            etag = hashlib.sha1(key.encode()).hexdigest()
+
+            if request.if_none_match.contains_weak(etag):
+                response = make_response('', 304)
+            else:
+                response = make_response(view(*args, **kwargs))
+                if response.status_code != 200:
+                    return response
+
+            response.set_etag(etag)
+            response.headers['Cache-Control'] = 'no-cache'
+            return response
+        return wrapper
+    return decorator
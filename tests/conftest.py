@@ -0,0 +1,60 @@
+import os
+import threading
+
+# Tests run against throwaway SQLite files, with no background workers and no
+# slow query log; set before src.config is imported
+os.environ.update({
+    'DB_ENGINE': 'sqlite',
+    'SQLITE_PATH': ':memory:',
+    'DB_REPLICAS': '',
+    'OUTBOX_WORKERS': '0',
+    'INVOICE_WORKER_ENABLED': 'False',
+    'OCCUPANCY_INDEX_ENABLED': 'False',
+    'SLOW_QUERY_THRESHOLD_MS': '0'
+})
+
+import pytest
+from src.catalog import fleet_catalog
+from src.config import Config
+from src.database import DatabaseManager
+
+@pytest.fixture
+def db(tmp_path, monkeypatch):
+    # A fresh database file, with the process-wide pool and catalog reset around the test
+    monkeypatch.setattr(Config, 'SQLITE_PATH', str(tmp_path / 'primary.db'))
+    monkeypatch.setattr(Config, 'DB_REPLICAS', [])
+    monkeypatch.setattr(DatabaseManager, '_backend', None)
+    monkeypatch.setattr(DatabaseManager, '_pool', None)
+    monkeypatch.setattr(DatabaseManager, '_pool_lock', threading.Lock())
+    monkeypatch.setattr(DatabaseManager, '_replicas', [])
+    monkeypatch.setattr(DatabaseManager, '_replica_checker', None)
+    monkeypatch.setattr(DatabaseManager, '_local', threading.local())
+    monkeypatch.setattr(fleet_catalog, '_snapshot', None)
+    monkeypatch.setattr(fleet_catalog, '_expires_at', 0.0)
+
+    manager = DatabaseManager()
+    yield manager
+
+    pools = [DatabaseManager._pool] + [replica.pool for replica in DatabaseManager._replicas]
+    for pool in filter(None, pools):
+        for pooled in pool._idle:
+            pool._close(pooled)
+
+@pytest.fixture
+def app(db):
+    from src.app import create_app
+    app = create_app(services=False)
+    app.config['TESTING'] = True
+    return app
+
+@pytest.fixture
+def client(app):
+    return app.test_client()
+
+@pytest.fixture
+def make_user(db):
+    # Inserts a user and returns its id
+    def make_user(email='test@example.com', name='Test User', phone='5550000000'):
+        db.execute_query("INSERT INTO users (name, email, phone) VALUES (%s, %s, %s)", (name, email, phone))
+        return db.execute_query("SELECT id FROM users WHERE email = %s", (email,), fetch=True)[0]['id']
+    return make_user
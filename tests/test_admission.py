@@ -0,0 +1,87 @@
+import pytest
+from flask import Flask
+from src import admission
+from src.admission import AdmissionControl, TokenBuckets, parse_route_limits
+from src.config import Config
+
+ROUTE = ('GET', '/vehicles/availability')
+
+@pytest.fixture
+def clock(monkeypatch):
+    # Drives time.monotonic as seen by the token buckets
+    now = [1000.0]
+    monkeypatch.setattr(admission.time, 'monotonic', lambda: now[0])
+    return now
+
+def test_bucket_allows_bursts_then_refills(clock):
+    buckets = TokenBuckets(2, 3, {}, 100)
+    assert [buckets.take('a', ROUTE) for _ in range(3)] == [0, 0, 0]
+    assert buckets.take('a', ROUTE) == pytest.approx(0.5)
+
+    # Other clients and routes have buckets of their own
+    assert buckets.take('b', ROUTE) == 0
+    assert buckets.take('a', ('POST', '/bookings')) == 0
+
+    clock[0] += 0.5
+    assert buckets.take('a', ROUTE) == 0
+    assert buckets.take('a', ROUTE) > 0
+
+def test_route_limits_override_the_default(clock):
+    buckets = TokenBuckets(100, 100, parse_route_limits('POST /bookings=1:1, get /vehicles/availability=10'), 100)
+    assert buckets.route_limits == {('POST', '/bookings'): (1.0, 1.0), ROUTE: (10.0, 10.0)}
+    assert buckets.take('a', ('POST', '/bookings')) == 0
+    assert buckets.take('a', ('POST', '/bookings')) == pytest.approx(1.0)
+
+@pytest.mark.parametrize('spec', ['POST /bookings=0', 'POST /bookings=-1:5', 'POST /bookings=1:0.5', 'POST /bookings=nan'])
+def test_unusable_limits_are_rejected(spec):
+    with pytest.raises(ValueError):
+        parse_route_limits(spec)
+
+def test_unusable_default_limits_are_rejected():
+    with pytest.raises(ValueError):
+        TokenBuckets(0, 10, {}, 100)
+
+def test_bucket_count_is_capped(clock):
+    buckets = TokenBuckets(1, 1, {}, 2)
+    buckets.take('a', ROUTE)
+    buckets.take('b', ROUTE)
+    buckets.take('a', ROUTE)
+    buckets.take('c', ROUTE)
+    assert [client for client, _ in buckets.buckets] == ['a', 'c']
+    assert buckets.evictions == 1
+
+    # A dropped bucket starts full again
+    assert buckets.take('b', ROUTE) == 0
+
+def test_sweep_drops_refilled_buckets(clock):
+    buckets = TokenBuckets(1, 2, {}, 100)
+    buckets.take('a', ROUTE)
+    clock[0] += 61
+    buckets.take('b', ROUTE)
+    assert [client for client, _ in buckets.buckets] == ['b']
+
+def test_rate_limiting_is_off_by_default():
+    assert Config.RATE_LIMIT_ENABLED is False
+
+def test_clients_over_their_rate_get_429(monkeypatch):
+    monkeypatch.setattr(Config, 'RATE_LIMIT_ENABLED', True)
+    monkeypatch.setattr(Config, 'RATE_LIMIT_RATE', 1)
+    monkeypatch.setattr(Config, 'RATE_LIMIT_BURST', 1)
+    monkeypatch.setattr(Config, 'RATE_LIMIT_CLIENT_HEADER', 'X-Forwarded-For')
+    monkeypatch.setattr(Config, 'ADMISSION_MAX_CONCURRENCY', 4)
+
+    app = Flask(__name__)
+    control = AdmissionControl()
+    control.enabled = True
+    control.init_app(app)
+    app.add_url_rule('/ping', 'ping', lambda: 'pong')
+    client = app.test_client()
+
+    assert client.get('/ping', headers={'X-Forwarded-For': '10.0.0.1, 10.0.0.9'}).status_code == 200
+    response = client.get('/ping', headers={'X-Forwarded-For': '10.0.0.1'})
+    assert response.status_code == 429
+    assert response.headers['Retry-After'] == '1'
+
+    # Clients behind the same proxy are told apart by the header
+    assert client.get('/ping', headers={'X-Forwarded-For': '10.0.0.2'}).status_code == 200
+    assert control.stats()['rate_limited'] == 1
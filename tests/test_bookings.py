@@ -0,0 +1,65 @@
+import threading
+from datetime import date, timedelta
+
+def day(offset):
+    return (date.today() + timedelta(days=offset)).isoformat()
+
+def booking(user_id, vehicle_id, pickup, ret):
+    return {'user_id': user_id, 'vehicle_id': vehicle_id, 'pickup_date': day(pickup), 'return_date': day(ret)}
+
+def outbox(db):
+    return db.execute_query("SELECT recipient, body FROM email_outbox ORDER BY id", fetch=True)
+
+def test_concurrent_bookings_of_one_vehicle_admit_exactly_one(app, db, make_user):
+    user_id = make_user()
+    start = threading.Barrier(8)
+    statuses = []
+
+    def book():
+        client = app.test_client()
+        start.wait()
+        response = client.post('/bookings', json=booking(user_id, 1, 1, 3))
+        statuses.append(response.status_code)
+
+    threads = [threading.Thread(target=book) for _ in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert statuses.count(201) == 1
+    assert all(status in (400, 409) for status in statuses if status != 201)
+    count = db.execute_query("SELECT COUNT(*) as count FROM bookings WHERE vehicle_id = 1", fetch=True)[0]['count']
+    assert count == 1
+
+def test_overlapping_booking_is_rejected(client, make_user):
+    user_id = make_user()
+    assert client.post('/bookings', json=booking(user_id, 1, 1, 3)).status_code == 201
+    response = client.post('/bookings', json=booking(user_id, 1, 3, 4))
+    assert response.status_code == 400
+    assert client.post('/bookings', json=booking(user_id, 1, 4, 5)).status_code == 201
+
+def test_same_day_bookings_get_no_confirmation(client, db, make_user):
+    user_id = make_user()
+    assert client.post('/bookings', json=booking(user_id, 1, 0, 1)).status_code == 201
+    assert outbox(db) == []
+    assert client.post('/bookings', json=booking(user_id, 2, 1, 2)).status_code == 201
+    assert len(outbox(db)) == 1
+
+def test_batch_summaries_follow_the_same_email_rule(client, db, make_user):
+    first = make_user('first@example.com')
+    second = make_user('second@example.com')
+    response = client.post('/bookings/batch', json={'bookings': [
+        booking(first, 1, 0, 1),
+        booking(first, 2, 2, 3),
+        booking(second, 3, 0, 2)
+    ]})
+    assert response.status_code == 201
+
+    # The same-day booking is left out of the first summary, and the second
+    # customer, with only a same-day booking, gets none
+    emails = outbox(db)
+    assert [email['recipient'] for email in emails] == ['first@example.com']
+    booking_ids = [result['booking_id'] for result in response.get_json()['results']]
+    assert booking_ids[1] in emails[0]['body']
+    assert booking_ids[0] not in emails[0]['body']
@@ -0,0 +1,77 @@
+from datetime import date, timedelta
+import pytest
+from src.occupancy import OccupancyIndex, occupancy_index
+from src.routes.vehicles import encode_bitmap, encode_runs
+
+TODAY = date.today()
+
+def day(offset):
+    return TODAY + timedelta(days=offset)
+
+@pytest.fixture
+def bookings(db, make_user):
+    # Vehicle 1 is booked on days 1-2 and 4-6, vehicle 2 from before today to day 1;
+    # the cancelled booking of vehicle 3 does not count
+    user_id = make_user()
+    for booking_id, vehicle_id, first, last, status in (
+            ('b1', 1, 1, 2, 'confirmed'), ('b2', 1, 4, 6, 'confirmed'),
+            ('b3', 2, -2, 1, 'confirmed'), ('b4', 3, 0, 3, 'cancelled')):
+        db.execute_query(
+            "INSERT INTO bookings (id, user_id, vehicle_id, pickup_date, return_date, total_amount, status) "
+            "VALUES (%s, %s, %s, %s, %s, %s, %s)",
+            (booking_id, user_id, vehicle_id, day(first), day(last), 100, status))
+
+@pytest.fixture
+def index(db, monkeypatch):
+    # The process-wide index, fresh for the test
+    for name, value in vars(OccupancyIndex()).items():
+        monkeypatch.setattr(occupancy_index, name, value)
+    return occupancy_index
+
+def calendar(client, **params):
+    response = client.get('/vehicles/calendar', query_string={'type': 'small_car', **params})
+    assert response.status_code == 200
+    return {vehicle['id']: vehicle['booked'] for vehicle in response.get_json()['vehicles']}
+
+def test_encodings():
+    assert encode_bitmap(0b1110110, 8) == '01101110'
+    assert encode_bitmap(0, 3) == '000'
+    assert encode_runs(0b1110110) == [[1, 2], [4, 3]]
+    assert encode_runs(0b1) == [[0, 1]]
+    assert encode_runs(0) == []
+
+def test_calendar_from_the_database(client, bookings, index):
+    assert not index.ready
+    booked = calendar(client, days=8)
+    assert (booked[1], booked[2], booked[3], booked[4]) == ('01101110', '11000000', '00000000', '00000000')
+    booked = calendar(client, days=8, encoding='runs')
+    assert (booked[1], booked[2], booked[3]) == ([[1, 2], [4, 3]], [[0, 2]], [])
+
+    # Ranges are clipped to the requested days
+    booked = calendar(client, **{'from': day(2).isoformat(), 'days': 3})
+    assert (booked[1], booked[2]) == ('101', '000')
+
+def test_calendar_from_the_index_matches_the_database(client, bookings, index):
+    expected = [calendar(client, days=8), calendar(client, days=8, encoding='runs'),
+                calendar(client, **{'from': day(2).isoformat(), 'days': 3})]
+    index.reconcile()
+    hits = index.hits
+    assert [calendar(client, days=8), calendar(client, days=8, encoding='runs'),
+            calendar(client, **{'from': day(2).isoformat(), 'days': 3})] == expected
+    assert index.hits == hits + 3
+
+def test_calendar_query_is_validated(client, db):
+    for params in ({'days': 0}, {'days': 16}, {'from': day(10).isoformat(), 'days': 6},
+                   {'encoding': 'bytes'}, {'type': 'boat'},
+                   {'from': day(-1).isoformat()}, {'from': day(15).isoformat()}):
+        response = client.get('/vehicles/calendar', query_string=params)
+        assert response.status_code == 400
+        assert response.get_json()['error'] == 'Validation error'
+
+    response = client.get('/vehicles/calendar?from=tomorrow')
+    assert response.status_code == 400
+    assert response.get_json() == {'error': 'Invalid date format. Use YYYY-MM-DD'}
+
+    # Up to the end of the booking horizon by default
+    response = client.get('/vehicles/calendar', query_string={'from': day(10).isoformat()})
+    assert response.get_json()['days'] == 5
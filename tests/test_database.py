@@ -0,0 +1,128 @@
+import pytest
+from src.database import ConnectionPool, PoolTimeoutError, StatementCache, in_list
+
+class FakeCursor:
+    def __init__(self):
+        self.closed = False
+
+    def close(self):
+        self.closed = True
+
+class FakeBackend:
+    def prepared_cursor(self, connection):
+        return FakeCursor()
+
+class FakeConnection:
+    def __init__(self):
+        self.in_transaction = False
+        self.rolled_back = False
+        self.closed = False
+
+    def rollback(self):
+        self.rolled_back = True
+        self.in_transaction = False
+
+    def close(self):
+        self.closed = True
+
+def make_pool(size=2, timeout=0.05, recycle=3600, ping_interval=60, healthy=True):
+    opened = []
+
+    def connect():
+        connection = FakeConnection()
+        opened.append(connection)
+        return connection
+
+    pool = ConnectionPool(connect, lambda connection: healthy, size=size, timeout=timeout,
+                          recycle=recycle, ping_interval=ping_interval)
+    return pool, opened
+
+def test_in_list_pads_to_a_power_of_two():
+    assert in_list([1]) == ('%s', [1])
+    assert in_list([1, 2, 3]) == ('%s, %s, %s, %s', [1, 2, 3, 3])
+    assert in_list(range(5))[0].count('%s') == 8
+
+def test_statement_cache_evicts_least_recently_used():
+    cache = StatementCache(2)
+    backend = FakeBackend()
+    first = cache.get(backend, None, 'SELECT 1')
+    second = cache.get(backend, None, 'SELECT 2')
+
+    # A hit returns the cached string object, so the driver does not re-prepare
+    query = ' '.join(['SELECT', '1'])
+    assert cache.get(backend, None, query) is first
+    assert first[0] is not query
+
+    cache.get(backend, None, 'SELECT 3')
+    assert list(cache.statements) == ['SELECT 1', 'SELECT 3']
+    assert second[1].closed and not first[1].closed
+    assert (cache.hits, cache.misses, cache.evictions) == (1, 3, 1)
+
+def test_statement_cache_discard_closes_the_cursor():
+    cache = StatementCache(4)
+    _, cursor = cache.get(FakeBackend(), None, 'SELECT 1')
+    cache.discard('SELECT 1')
+    assert cursor.closed and not cache.statements
+
+def test_pool_reuses_released_connections():
+    pool, opened = make_pool()
+    pooled = pool.acquire()
+    pool.release(pooled)
+    assert pool.acquire() is pooled
+    assert len(opened) == 1
+
+def test_pool_times_out_when_exhausted():
+    pool, _ = make_pool(size=1)
+    pool.acquire()
+    with pytest.raises(PoolTimeoutError):
+        pool.acquire()
+    assert pool.stats()['checkout_failures'] == 1
+
+def test_pool_rolls_back_open_transactions_on_release():
+    pool, _ = make_pool()
+    pooled = pool.acquire()
+    pooled.connection.in_transaction = True
+    pool.release(pooled)
+    assert pooled.connection.rolled_back
+
+def test_pool_discards_and_replaces_connections():
+    pool, opened = make_pool(size=1)
+    pool.release(pool.acquire(), discard=True)
+    assert opened[0].closed
+    assert pool.stats()['open'] == 0
+    assert pool.acquire().connection is opened[1]
+
+def test_pool_recycles_old_connections():
+    pool, opened = make_pool(recycle=-1)
+    pool.release(pool.acquire())
+    pool.acquire()
+    assert opened[0].closed and len(opened) == 2
+    assert pool.stats()['recycled'] == 1
+
+def test_pool_replaces_unhealthy_idle_connections():
+    pool, opened = make_pool(ping_interval=-1, healthy=False)
+    pool.release(pool.acquire())
+    pool.acquire()
+    assert opened[0].closed and len(opened) == 2
+    assert pool.stats()['health_check_failures'] == 1
+
+def test_pool_warm_opens_connections_up_front():
+    pool, opened = make_pool(size=3)
+    assert pool.warm(5) == 3
+    assert len(opened) == 3
+    assert pool.stats()['idle'] == 3
+
+def test_request_shares_one_connection(app, db):
+    with app.test_request_context('/'):
+        db.execute_query("SELECT 1 as one", fetch=True)
+        db.execute_query("SELECT 2 as two", fetch=True)
+        assert db.pool_stats()['in_use'] == 1
+    assert db.pool_stats()['checkouts'] == 1
+    assert db.pool_stats()['in_use'] == 0
+
+def test_repeated_statements_hit_the_cache(db):
+    for _ in range(3):
+        assert db.execute_query("SELECT id FROM vehicle_types WHERE name = %s", ('suv',), fetch=True)
+    statements = db.pool_stats()['statement_cache']
+    assert statements['misses'] == 1
+    assert statements['hits'] == 2
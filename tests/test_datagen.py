@@ -0,0 +1,47 @@
+from contextlib import contextmanager
+from datetime import date
+import pytest
+from benchmarks import datagen
+
+class RecordingTransaction:
+    def __init__(self, statements, fail):
+        self.statements = statements
+        self.fail = fail
+
+    def execute(self, query, params=None, fetch=False, prepare=True):
+        self.statements.append(query)
+
+    def executemany(self, query, seq_params):
+        self.statements.append(f'executemany {len(seq_params)}')
+        if self.fail:
+            raise RuntimeError('insert failed')
+
+class RecordingDatabase:
+    def __init__(self, fail=False):
+        self.statements = []
+        self.fail = fail
+
+    @contextmanager
+    def transaction(self):
+        yield RecordingTransaction(self.statements, self.fail)
+
+def test_booking_rules_are_bypassed_for_the_chunk_only():
+    db = RecordingDatabase()
+    datagen.insert_chunk(db, datagen.BOOKING_QUERY, [()] * 3, skip_booking_rules=True)
+    assert db.statements == ['SET @skip_booking_rules = 1', 'executemany 3', 'SET @skip_booking_rules = NULL']
+
+    # The variable is cleared even when the insert fails
+    db = RecordingDatabase(fail=True)
+    with pytest.raises(RuntimeError):
+        datagen.insert_chunk(db, datagen.BOOKING_QUERY, [()], skip_booking_rules=True)
+    assert db.statements[-1] == 'SET @skip_booking_rules = NULL'
+
+def test_generated_rows_depend_only_on_the_seed():
+    generate = lambda: list(datagen.generate_bookings(datagen.random.Random(7), 50, [(1, 50), (2, 80)], 10, date(2024, 6, 1)))
+    assert generate() == generate()
+
+def test_seed_loads_the_history(db):
+    summary = datagen.seed(2000, anchor=date.today(), log=lambda message: None)
+    assert (summary['users'], summary['vehicles']) == (200, 62)
+    past = db.execute_query("SELECT COUNT(*) as count FROM bookings WHERE pickup_date < %s", (date.today(),), fetch=True)
+    assert past[0]['count'] >= 2000
@@ -0,0 +1,101 @@
+import json
+from datetime import date, timedelta
+import pytest
+from src.config import Config
+from src.feed import AvailabilityFeed, availability_feed
+from src.occupancy import OccupancyIndex, occupancy_index
+
+TODAY = date.today()
+
+def day(offset):
+    return TODAY + timedelta(days=offset)
+
+@pytest.fixture
+def feed(db, monkeypatch):
+    # The process-wide index and feed, fresh for the test; changes are fanned out
+    # by hand instead of by the publisher thread
+    for name, value in vars(OccupancyIndex()).items():
+        monkeypatch.setattr(occupancy_index, name, value)
+    for name, value in vars(AvailabilityFeed()).items():
+        monkeypatch.setattr(availability_feed, name, value)
+    occupancy_index.reconcile()
+    occupancy_index.listeners.append(availability_feed.publish)
+    return availability_feed
+
+def event(stream):
+    # The next event as (name, data), skipping the retry line
+    chunk = next(stream)
+    if chunk.startswith('retry:'):
+        chunk = next(stream)
+    name, data = chunk.strip().split('\n')
+    return name[len('event: '):], json.loads(data[len('data: '):])
+
+def fan_out(feed):
+    changed, feed.changed = feed.changed, set()
+    feed._fan_out(changed)
+
+def test_stream_sends_a_snapshot_then_deltas(feed):
+    subscription = feed.subscribe(day(1), day(2), vehicle_type='small_car')
+    stream = feed.stream(subscription)
+    name, data = event(stream)
+    assert name == 'snapshot'
+    assert 1 in data['available'] and data['vehicle_type'] == 'small_car'
+
+    occupancy_index.add_booking('b1', 1, day(2), day(3))
+    fan_out(feed)
+    assert event(stream) == ('delta', {'available': [], 'unavailable': [1]})
+
+    # Bookings outside the subscription's dates or type send nothing
+    occupancy_index.add_booking('b2', 2, day(5), day(6))
+    occupancy_index.add_booking('b3', 5, day(1), day(2))
+    fan_out(feed)
+    assert not subscription.events
+
+    stream.close()
+    assert not feed.subscribers
+
+def test_subscriber_that_falls_behind_gets_a_new_snapshot(feed, monkeypatch):
+    monkeypatch.setattr(Config, 'AVAILABILITY_STREAM_QUEUE_SIZE', 1)
+    subscription = feed.subscribe(day(1), day(2), vehicle_type='small_car')
+    stream = feed.stream(subscription)
+    assert event(stream)[0] == 'snapshot'
+
+    occupancy_index.add_booking('b1', 1, day(1), day(1))
+    fan_out(feed)
+    occupancy_index.add_booking('b2', 2, day(1), day(1))
+    fan_out(feed)
+    assert feed.overflows == 1
+
+    # The backlog is dropped for a snapshot that includes both bookings
+    name, data = event(stream)
+    assert name == 'snapshot'
+    assert not {1, 2} & set(data['available'])
+    stream.close()
+
+def test_subscribers_over_the_cap_are_turned_away(feed, client, monkeypatch):
+    monkeypatch.setattr(Config, 'AVAILABILITY_STREAM_MAX_SUBSCRIBERS', 1)
+    url = f'/vehicles/availability/stream?pickup_date={day(1)}&return_date={day(2)}'
+    first = client.get(url)
+    assert first.status_code == 200 and first.mimetype == 'text/event-stream'
+
+    second = client.get(url)
+    assert second.status_code == 503
+    assert second.headers['Retry-After'] == str(int(Config.AVAILABILITY_STREAM_RETRY))
+    assert feed.rejected == 1
+
+    # Closing the first stream makes room
+    first.close()
+    assert not feed.subscribers
+    third = client.get(url)
+    assert third.status_code == 200
+    third.close()
+
+def test_streams_that_never_start_are_unsubscribed(feed, client):
+    url = f'/vehicles/availability/stream?pickup_date={day(1)}&return_date={day(2)}'
+    for _ in range(3):
+        response = client.head(url)
+        assert response.status_code == 200
+        response.close()
+    # A client gone before the first chunk
+    client.get(url).close()
+    assert not feed.subscribers
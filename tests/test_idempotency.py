@@ -0,0 +1,96 @@
+import threading
+import time
+from datetime import datetime, timedelta
+import pytest
+from src import idempotency
+from src.config import Config
+from src.idempotency import IdempotencyStore
+
+USER = {'name': 'Retry User', 'email': 'retry@example.com', 'phone': '5550000000'}
+
+@pytest.fixture
+def store(db, monkeypatch):
+    store = IdempotencyStore()
+    store.shared = False
+    monkeypatch.setattr(idempotency, 'idempotency_store', store)
+    return store
+
+def post_user(client, key, body=USER):
+    return client.post('/users', json=body, headers={'Idempotency-Key': key})
+
+def user_count(db):
+    return db.execute_query("SELECT COUNT(*) as count FROM users", fetch=True)[0]['count']
+
+def test_retry_replays_the_first_response(client, db, store):
+    first = post_user(client, 'key-1')
+    retry = post_user(client, 'key-1')
+    assert first.status_code == retry.status_code == 201
+    assert retry.headers['Idempotent-Replayed'] == 'true'
+    assert retry.get_json() == first.get_json()
+    assert user_count(db) == 1
+
+    # Another key runs the request again, which now fails on the duplicate email
+    assert post_user(client, 'key-2').status_code == 400
+
+def test_key_reused_for_a_different_body_is_rejected(client, db, store):
+    post_user(client, 'key-1')
+    response = post_user(client, 'key-1', dict(USER, email='other@example.com'))
+    assert response.status_code == 422
+    assert user_count(db) == 1
+
+def test_invalid_keys_are_rejected(client, store):
+    assert post_user(client, '').status_code == 400
+    assert post_user(client, 'k' * 256).status_code == 400
+
+def test_duplicate_in_flight_gets_409(client, store, monkeypatch):
+    monkeypatch.setattr(Config, 'IDEMPOTENCY_WAIT_TIMEOUT', 0.05)
+    store.in_flight['POST /users key-1'] = threading.Event()
+    response = post_user(client, 'key-1')
+    assert response.status_code == 409
+    assert response.headers['Retry-After'] == '1'
+    assert store.conflicts == 1
+
+def test_duplicate_waits_for_the_first_request(client, db, store):
+    # The retry arrives while the first request is running and gets its response
+    event = store.in_flight['POST /users key-1'] = threading.Event()
+    responses = []
+    waiting = threading.Thread(target=lambda: responses.append(post_user(client, 'key-1')))
+    waiting.start()
+    while store.waits == 0:
+        time.sleep(0.001)
+
+    store.in_flight.pop('POST /users key-1')
+    post_user(client, 'key-1')
+    event.set()
+    waiting.join()
+    assert responses[0].headers['Idempotent-Replayed'] == 'true'
+    assert user_count(db) == 1
+
+def test_shared_keys_are_answered_by_other_processes(client, db, store):
+    store.shared = True
+    assert post_user(client, 'key-1').status_code == 201
+
+    # A second store stands in for another worker process, with an empty LRU
+    other = IdempotencyStore()
+    other.shared = True
+    entry = other.begin('POST /users key-1', store.entries['POST /users key-1'].fingerprint)
+    assert entry.status_code == 201
+    assert entry.body == store.entries['POST /users key-1'].body
+
+def test_shared_key_in_flight_elsewhere_is_busy(db, store, monkeypatch):
+    monkeypatch.setattr(Config, 'IDEMPOTENCY_WAIT_TIMEOUT', 0.1)
+    db.execute_query("INSERT INTO idempotency_keys (idempotency_key, request_hash, expires_at, created_at) VALUES (%s, %s, %s, %s)",
+                     ('POST /users key-1', 'hash', datetime.now() + timedelta(minutes=1), datetime.now()))
+    store.shared = True
+    assert store.begin('POST /users key-1', 'hash') is idempotency.BUSY
+    assert not store.in_flight
+
+def test_keys_are_shared_by_default():
+    assert Config.IDEMPOTENCY_SHARED is True
+
+def test_server_errors_are_not_stored(client, store):
+    # A 5xx releases the key, so a retry runs the request again
+    response = client.post('/users', data='not json', headers={'Idempotency-Key': 'key-1'})
+    assert response.status_code == 500
+    assert 'POST /users key-1' not in store.entries
+    assert not store.in_flight
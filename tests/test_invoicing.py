@@ -0,0 +1,117 @@
+import os
+import subprocess
+import sys
+from datetime import date, datetime, timedelta
+from decimal import Decimal
+import pytest
+from src.config import Config
+from src.invoicing import InvoicePipeline, split_tax
+
+RATE = Decimal('0.10')
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+@pytest.fixture
+def pipeline(db):
+    return InvoicePipeline()
+
+@pytest.fixture
+def add_booking(db, make_user):
+    user_id = make_user(email='renter@example.com', name='Ann Renter')
+
+    # Inserts a booking created hours_ago and returns its id
+    def add_booking(booking_id, total_amount=100, hours_ago=1, status='confirmed', payment_status='paid'):
+        db.execute_query(
+            "INSERT INTO bookings (id, user_id, vehicle_id, pickup_date, return_date, total_amount, status, payment_status, created_at) "
+            "VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s)",
+            (booking_id, user_id, 1, date.today(), date.today() + timedelta(days=2), total_amount, status, payment_status,
+             datetime.now() - timedelta(hours=hours_ago)))
+        return booking_id
+    return add_booking
+
+def invoices(db):
+    return db.execute_query("SELECT * FROM invoices ORDER BY invoice_number", fetch=True)
+
+def emails(db):
+    return db.execute_query("SELECT recipient, subject FROM email_outbox", fetch=True)
+
+def sequence(db):
+    return db.execute_query("SELECT next_value FROM invoice_sequences WHERE name = 'invoice'", fetch=True)[0]['next_value']
+
+def test_tax_is_split_out_of_the_total():
+    assert split_tax(100, RATE) == (Decimal('90.91'), Decimal('9.09'))
+    assert split_tax('0.11', RATE) == (Decimal('0.10'), Decimal('0.01'))
+    # The parts always add up to the total, rounded to the cent
+    for cents in range(1, 2000, 7):
+        total = Decimal(cents) / 100
+        amount, tax_amount = split_tax(total, RATE)
+        assert amount + tax_amount == total
+    assert split_tax(19.999, RATE) == (Decimal('18.18'), Decimal('1.82'))
+
+def test_numbers_come_from_reserved_blocks(db, pipeline, monkeypatch):
+    monkeypatch.setattr(Config, 'INVOICE_NUMBER_BLOCK_SIZE', 5)
+    start = sequence(db)
+    assert pipeline.take_numbers(3) == [start, start + 1, start + 2]
+    assert sequence(db) == start + 5
+
+    # Returned numbers are handed out again first, in order
+    pipeline.return_numbers([start + 1, start + 2])
+    assert pipeline.take_numbers(4) == [start + 1, start + 2, start + 3, start + 4]
+    assert pipeline.blocks_reserved == 1
+
+    # Requests larger than a block reserve one of their own size
+    assert pipeline.take_numbers(7) == list(range(start + 5, start + 12))
+    assert (pipeline.blocks_reserved, sequence(db)) == (2, start + 12)
+
+def test_batches_skip_invoiced_bookings(db, pipeline, add_booking, monkeypatch):
+    monkeypatch.setattr(Config, 'INVOICE_BATCH_SIZE', 2)
+    for booking_id in ('b1', 'b2', 'b3'):
+        add_booking(booking_id)
+    add_booking('cancelled', status='cancelled')
+    add_booking('unpaid', payment_status='pending')
+    add_booking('old', hours_ago=Config.INVOICE_LOOKBACK_HOURS + 1)
+
+    assert pipeline.run() == 3
+    rows = invoices(db)
+    assert sorted(row['booking_id'] for row in rows) == ['b1', 'b2', 'b3']
+    assert len({row['invoice_number'] for row in rows}) == 3
+    assert all(row['invoice_number'].startswith(Config.INVOICE_NUMBER_PREFIX + '-') for row in rows)
+    amounts = {(str(row['amount']), str(row['tax_amount']), str(row['total_amount'])) for row in rows}
+    assert amounts == {('90.91', '9.09', '100')}
+    assert pipeline.batches == 2
+
+    # Numbers reserved for the empty rest of the last batch are kept for the next one
+    left = pipeline.stats()['numbers_left']
+    assert pipeline.run() == 0
+    assert len(invoices(db)) == 3
+    assert pipeline.stats()['numbers_left'] == left
+
+def test_invoice_emails_are_queued_in_the_outbox(db, pipeline, add_booking):
+    add_booking('b1', total_amount=55)
+    assert pipeline.run() == 1
+
+    invoice_number = invoices(db)[0]['invoice_number']
+    assert [(row['recipient'], row['subject']) for row in emails(db)] == [
+        ('renter@example.com', f'Invoice #{invoice_number} - Vehicle Rental')
+    ]
+    assert pipeline.emails_queued == 1
+
+def test_backfill_invoices_older_bookings_without_emails(db, pipeline, add_booking):
+    add_booking('recent')
+    add_booking('old', hours_ago=24 * 30)
+    created_from = datetime.now() - timedelta(days=31)
+    assert pipeline.backfill(created_from, datetime.now() - timedelta(days=29)) == 1
+    assert [row['booking_id'] for row in invoices(db)] == ['old']
+    assert emails(db) == []
+
+def test_backfill_from_the_command_line(db, add_booking):
+    add_booking('old', hours_ago=24 * 30)
+    add_booking('recent')
+    day = (datetime.now() - timedelta(days=30)).date()
+    env = dict(os.environ, SQLITE_PATH=Config.SQLITE_PATH)
+    result = subprocess.run(
+        [sys.executable, '-m', 'src.invoicing', '--backfill', '--from', str(day - timedelta(days=1)), '--to', str(day)],
+        cwd=ROOT, env=env, capture_output=True, text=True, timeout=60)
+    assert result.returncode == 0, result.stderr
+    assert result.stdout.startswith('Invoiced 1 bookings created from')
+    assert [row['booking_id'] for row in invoices(db)] == ['old']
+    assert emails(db) == []
@@ -0,0 +1,71 @@
+import os
+import subprocess
+import sys
+from src.metrics import Metrics, archive_exited_workers, archive_worker
+
+GAUGES = [('db_pool_size', 'Maximum pooled connections', 'gauge', 10),
+          ('db_pool_checkout_failures_total', 'Checkouts that timed out or failed to connect', 'counter', 2)]
+
+def worker(directory):
+    metrics = Metrics()
+    metrics.enabled = True
+    metrics.directory = directory
+    metrics.gauges = lambda: GAUGES
+    return metrics
+
+def exited_pid():
+    process = subprocess.Popen([sys.executable, '-c', 'pass'])
+    process.wait()
+    return process.pid
+
+def record(metrics):
+    metrics.record_query(0.01, rows=3)
+    metrics.record_admission('admitted')
+
+def sample(text, name):
+    return [line for line in text.splitlines() if line.startswith(name + ' ') or line.startswith(name + '{')]
+
+def test_workers_render_the_sum_of_every_snapshot(tmp_path):
+    directory = str(tmp_path)
+    other, this = worker(directory), worker(directory)
+
+    # Another worker's snapshot, written under its own pid
+    record(other)
+    other.write()
+    pid = exited_pid()
+    os.replace(os.path.join(directory, f'worker-{os.getpid()}.json'), os.path.join(directory, f'worker-{pid}.json'))
+
+    record(this)
+    text = this.render()
+    assert sample(text, 'db_rows_fetched_total') == ['db_rows_fetched_total 6']
+    assert sample(text, 'http_admission_total') == ['http_admission_total{outcome="admitted"} 2']
+    assert sample(text, 'db_query_duration_seconds_count') == ['db_query_duration_seconds_count 2']
+    assert sample(text, 'db_pool_size') == ['db_pool_size 20']
+
+    # Once the other worker exits its counts stay, its gauges go
+    archive_worker(directory, pid)
+    text = this.render()
+    assert sample(text, 'db_rows_fetched_total') == ['db_rows_fetched_total 6']
+    assert sample(text, 'db_pool_checkout_failures_total') == ['db_pool_checkout_failures_total 4']
+    assert sample(text, 'db_pool_size') == ['db_pool_size 10']
+    assert not os.path.exists(os.path.join(directory, f'worker-{pid}.json'))
+
+def test_a_new_server_archives_workers_of_the_last_one(tmp_path):
+    directory = str(tmp_path)
+    metrics = worker(directory)
+    record(metrics)
+    metrics.write()
+    pid = exited_pid()
+    os.replace(os.path.join(directory, f'worker-{os.getpid()}.json'), os.path.join(directory, f'worker-{pid}.json'))
+    metrics.write()
+
+    archive_exited_workers(directory)
+    assert sorted(os.listdir(directory)) == ['archive.json', 'metrics.lock', f'worker-{os.getpid()}.json']
+
+def test_single_process_renders_its_own_metrics():
+    metrics = Metrics()
+    metrics.enabled = True
+    record(metrics)
+    text = metrics.render(GAUGES)
+    assert sample(text, 'db_rows_fetched_total') == ['db_rows_fetched_total 3']
+    assert sample(text, 'db_pool_size') == ['db_pool_size 10']
@@ -0,0 +1,138 @@
+import time
+from datetime import date, timedelta
+import pytest
+from src.occupancy import OccupancyIndex
+from src.versions import TableVersions, table_versions
+
+TODAY = date.today()
+
+def day(offset):
+    return TODAY + timedelta(days=offset)
+
+@pytest.fixture
+def add_booking(db, make_user):
+    user_id = make_user()
+
+    # Inserts a booking behind the index's back and returns its id
+    def add_booking(booking_id, vehicle_id, first, last, status='confirmed'):
+        db.execute_query(
+            "INSERT INTO bookings (id, user_id, vehicle_id, pickup_date, return_date, total_amount, status) "
+            "VALUES (%s, %s, %s, %s, %s, %s, %s)",
+            (booking_id, user_id, vehicle_id, day(first), day(last), 100, status))
+        return booking_id
+    return add_booking
+
+@pytest.fixture
+def index(db):
+    index = OccupancyIndex()
+    index.reconcile()
+    return index
+
+def test_bitmap_marks_inclusive_ranges(index):
+    index.add_booking('b1', 1, day(2), day(4))
+    assert index.occupancy[1] == 0b11100
+
+    # Days before the window are clipped, not indexed
+    index.add_booking('b2', 2, day(-3), day(1))
+    assert index.occupancy[2] == 0b11
+
+def test_availability_excludes_overlapping_bookings(index):
+    index.add_booking('b1', 1, day(2), day(4))
+
+    ids = lambda vehicles: {vehicle.id for vehicle in vehicles}
+    assert 1 not in ids(index.available_vehicles(day(4), day(6)))
+    assert 1 in ids(index.available_vehicles(day(5), day(6)))
+    assert 1 in ids(index.available_vehicles(day(0), day(1)))
+    assert [vehicle.id for vehicle in index.available_vehicles(day(0), day(1), vehicle_id=1)] == [1]
+
+def test_counts_and_calendar(index):
+    index.add_booking('b1', 1, day(1), day(2))
+    counts = index.available_counts(day(0), day(1))
+    assert counts == {'small_car': 3, 'suv': 4, 'van': 4}
+
+    calendar = dict((vehicle.id, booked) for vehicle, booked in index.booked_days(day(0), 4, 'small_car'))
+    assert calendar[1] == 0b0110
+    assert calendar[2] == 0
+
+def test_dates_before_the_window_are_not_covered(index):
+    assert index.available_vehicles(day(-1), day(1)) is None
+    assert index.available_counts(day(-1), day(1)) is None
+    assert index.stats()['misses'] == 2
+
+def test_booking_added_again_replaces_its_old_entry(index):
+    index.add_booking('b1', 1, day(2), day(4))
+    index.add_booking('b2', 1, day(4), day(5))
+    changed = []
+    index.listeners.append(changed.append)
+
+    # Day 4 stays booked by b2
+    index.add_booking('b1', 1, day(7), day(7))
+    assert index.occupancy[1] == 0b10110000
+    index.add_booking('b2', 2, day(1), day(1))
+    assert (index.occupancy[1], index.occupancy[2]) == (0b10000000, 0b10)
+    assert changed == [{1}, {1, 2}]
+
+    # Same contents as an index that only ever saw the final bookings
+    fresh = OccupancyIndex()
+    fresh.reconcile()
+    fresh.add_booking('b1', 1, day(7), day(7))
+    fresh.add_booking('b2', 2, day(1), day(1))
+    assert fresh.version() == index.version()
+
+def test_reconcile_loads_bookings_and_corrects_drift(index, add_booking):
+    add_booking('b1', 3, 1, 2)
+    add_booking('b2', 4, 1, 2, status='cancelled')
+    add_booking('b3', 5, -5, -1)
+
+    changed = []
+    index.listeners.append(changed.append)
+    index.reconcile()
+
+    # Only the confirmed booking that is still current is indexed
+    assert set(index.bookings) == {'b1'}
+    assert index.occupancy[3] == 0b110
+    assert index.stats()['drift_corrections'] == 1
+    assert changed == [{3}]
+
+def test_reconcile_drops_bookings_cancelled_outside_the_api(db, index, add_booking):
+    add_booking('b1', 3, 1, 2)
+    index.reconcile()
+
+    db.execute_query("UPDATE bookings SET status = 'cancelled' WHERE id = %s", ('b1',))
+    changed = []
+    index.listeners.append(changed.append)
+    index.reconcile()
+
+    assert 'b1' not in index.bookings
+    assert not index.occupancy.get(3, 0)
+    assert changed == [{3}]
+
+def test_reconcile_keeps_writes_that_race_with_it(db, index, monkeypatch):
+    # A booking added while the reconciler is reading the database survives the swap
+    query = index.db.execute_query
+
+    def execute_query(*args, **kwargs):
+        rows = query(*args, **kwargs)
+        index.add_booking('b1', 6, day(0), day(0))
+        return rows
+
+    monkeypatch.setattr(index.db, 'execute_query', execute_query)
+    index.reconcile()
+    assert index.occupancy[6] == 1
+
+def test_bookings_counter_moves_trigger_a_resync(db, add_booking):
+    index = OccupancyIndex()
+    index.start(0)
+    watcher = TableVersions()
+    watcher.watch('bookings', index.resync)
+    watcher.poll()
+
+    # Another process books and bumps the counter
+    reconciliations = index.reconciliations
+    add_booking('b1', 1, 2, 3)
+    table_versions.bump('bookings')
+    watcher.poll()
+    deadline = time.monotonic() + 5
+    while index.reconciliations == reconciliations and time.monotonic() < deadline:
+        time.sleep(0.01)
+    assert 'b1' in index.bookings
@@ -0,0 +1,160 @@
+import smtplib
+import socketserver
+import threading
+import time
+from datetime import datetime, timedelta
+import pytest
+from src.config import Config
+from src.email_service import EmailService
+from src.outbox import EmailOutbox
+
+class SMTPStub(socketserver.ThreadingTCPServer):
+    # Accepts every message, except to recipients starting with "reject"; those
+    # starting with "slow" are accepted too late
+    daemon_threads = True
+    allow_reuse_address = True
+
+    def __init__(self):
+        super().__init__(('127.0.0.1', 0), SMTPStubHandler)
+        self.messages = []
+
+class SMTPStubHandler(socketserver.StreamRequestHandler):
+    def reply(self, line):
+        self.wfile.write(line.encode() + b'\r\n')
+
+    def handle(self):
+        self.reply('220 stub')
+        data = None
+        while True:
+            line = self.rfile.readline()
+            if not line:
+                return
+            if data is not None:
+                if line == b'.\r\n':
+                    self.server.messages.append(b''.join(data).decode())
+                    data = None
+                    self.reply('250 queued')
+                else:
+                    data.append(line)
+                continue
+
+            command = line.strip().upper()
+            if command.startswith((b'EHLO', b'HELO')):
+                self.reply('250 stub')
+            elif command.startswith(b'RCPT') and b'<REJECT' in command:
+                self.reply('550 no such user')
+            elif command.startswith(b'RCPT') and b'<SLOW' in command:
+                # Answers after the client has timed out
+                time.sleep(0.5)
+                self.reply('250 ok')
+            elif command == b'DATA':
+                data = []
+                self.reply('354 go ahead')
+            elif command == b'QUIT':
+                self.reply('221 bye')
+                return
+            else:
+                self.reply('250 ok')
+
+@pytest.fixture
+def smtp(monkeypatch):
+    server = SMTPStub()
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    monkeypatch.setitem(Config.EMAIL_CONFIG, 'smtp_server', '127.0.0.1')
+    monkeypatch.setitem(Config.EMAIL_CONFIG, 'smtp_port', server.server_address[1])
+    monkeypatch.setitem(Config.EMAIL_CONFIG, 'use_tls', False)
+    monkeypatch.setitem(Config.EMAIL_CONFIG, 'email', 'rentals@example.com')
+    monkeypatch.setitem(Config.EMAIL_CONFIG, 'password', '')
+    yield server
+    server.shutdown()
+    server.server_close()
+
+@pytest.fixture
+def outbox(db):
+    outbox = EmailOutbox()
+    yield outbox
+    outbox.stop(timeout=5)
+
+@pytest.fixture
+def email_service(smtp):
+    email_service = EmailService()
+    yield email_service
+    email_service.close()
+
+def message_row(db):
+    return db.execute_query("SELECT * FROM email_outbox", fetch=True)[0]
+
+def test_claim_leases_messages(outbox, db):
+    outbox.enqueue('a@example.com', 'Subject', 'Body')
+    messages = outbox.claim(10)
+    assert [message['recipient'] for message in messages] == ['a@example.com']
+
+    row = message_row(db)
+    assert row['status'] == 'sending'
+    assert row['locked_until'] > datetime.now()
+
+    # Leased messages are skipped until the lease runs out
+    assert outbox.claim(10) == []
+    db.execute_query("UPDATE email_outbox SET locked_until = %s", (datetime.now() - timedelta(seconds=1),))
+    assert len(outbox.claim(10)) == 1
+
+def test_claim_waits_for_the_next_attempt(outbox, db):
+    outbox.enqueue('a@example.com', 'Subject', 'Body')
+    db.execute_query("UPDATE email_outbox SET next_attempt_at = %s", (datetime.now() + timedelta(minutes=1),))
+    assert outbox.claim(10) == []
+
+def test_send_marks_the_message_sent(outbox, db, smtp, email_service):
+    outbox.enqueue('a@example.com', 'Welcome', 'Body')
+    outbox._send(email_service, outbox.claim(10)[0])
+
+    row = message_row(db)
+    assert (row['status'], row['attempts'], row['locked_until']) == ('sent', 1, None)
+    assert len(smtp.messages) == 1
+    assert 'Subject: Welcome' in smtp.messages[0]
+
+def test_failed_send_is_retried_with_backoff(outbox, db, smtp, email_service, monkeypatch):
+    monkeypatch.setattr(Config, 'OUTBOX_RETRY_BACKOFF', 30)
+    outbox.enqueue('reject@example.com', 'Subject', 'Body')
+    outbox._send(email_service, outbox.claim(10)[0])
+
+    row = message_row(db)
+    assert (row['status'], row['attempts'], row['locked_until']) == ('pending', 1, None)
+    assert row['next_attempt_at'] > datetime.now() + timedelta(seconds=20)
+    assert 'no such user' in row['last_error']
+    assert outbox.claim(10) == []
+    assert outbox.retried == 1
+
+def test_failed_sends_do_not_reuse_the_session(smtp, email_service, monkeypatch):
+    monkeypatch.setitem(email_service.config, 'timeout', 0.1)
+    with pytest.raises(OSError):
+        email_service.deliver('slow@example.com', 'Subject', 'Body')
+    assert email_service._server is None
+
+    # The next message gets a new session, not the late reply of the last one
+    email_service.deliver('a@example.com', 'Subject', 'Body')
+    with pytest.raises(smtplib.SMTPRecipientsRefused):
+        email_service.deliver('reject@example.com', 'Subject', 'Body')
+    assert email_service._server is None
+    email_service.deliver('b@example.com', 'Subject', 'Body')
+    assert len(smtp.messages) == 2
+    assert 'To: a@example.com' in smtp.messages[0] and 'To: b@example.com' in smtp.messages[1]
+
+def test_message_fails_after_max_attempts(outbox, db, smtp, email_service, monkeypatch):
+    monkeypatch.setattr(Config, 'OUTBOX_MAX_ATTEMPTS', 2)
+    outbox.enqueue('reject@example.com', 'Subject', 'Body')
+    db.execute_query("UPDATE email_outbox SET attempts = 1")
+    outbox._send(email_service, outbox.claim(10)[0])
+
+    row = message_row(db)
+    assert (row['status'], row['attempts']) == ('failed', 2)
+    assert outbox.failed == 1
+
+def test_workers_deliver_queued_messages(outbox, db, smtp):
+    outbox.start(1)
+    outbox.enqueue('a@example.com', 'Subject', 'Body')
+
+    deadline = time.monotonic() + 5
+    while message_row(db)['status'] != 'sent' and time.monotonic() < deadline:
+        time.sleep(0.01)
+    assert message_row(db)['status'] == 'sent'
+    assert len(smtp.messages) == 1
@@ -0,0 +1,94 @@
+import json
+import time
+import pytest
+from src.config import Config
+from src.database import DatabaseManager
+from src.metrics import metrics
+
+USER = {'name': 'Replica User', 'email': 'replica@example.com', 'phone': '5550000000'}
+
+@pytest.fixture
+def replica(db, tmp_path, monkeypatch):
+    # A second SQLite file stands in for a replica that has not caught up: rows
+    # written through the API land in the primary only
+    monkeypatch.setattr(Config, 'DB_REPLICAS', [str(tmp_path / 'replica.db')])
+    monkeypatch.setattr(Config, 'DB_REPLICA_CHECK_INTERVAL', 0)
+    monkeypatch.setattr(metrics, 'enabled', True)
+    replica, = db.replicas
+    return replica
+
+def events(replica, event):
+    return metrics.replica_events.series.get((replica.name, event), 0)
+
+def emails(response):
+    return [user['email'] for user in response.get_json()]
+
+def test_reads_go_to_the_replica_until_the_client_writes(replica, app):
+    client = app.test_client()
+    assert client.post('/users', json=USER).status_code == 201
+
+    # The client that wrote keeps reading from the primary through the cookie
+    assert emails(client.get('/users')) == [USER['email']]
+    assert replica.reads == 0
+
+    # Everyone else reads from the replica, which does not have the row yet
+    assert emails(app.test_client().get('/users')) == []
+    assert replica.reads > 0
+
+def test_failed_replica_reads_fail_over_to_the_primary(db, replica, make_user):
+    make_user(email=USER['email'])
+    # As if this thread's last write were older than DB_STICKY_PRIMARY_SECONDS
+    DatabaseManager._local.primary_until = 0
+    failovers = events(replica, 'failover')
+    pooled = replica.pool.acquire()
+    pooled.connection.execute('DROP TABLE users')
+    replica.pool.release(pooled)
+
+    # The replica is reachable, so it stays in rotation, but the read is answered by the primary
+    rows = db.execute_query("SELECT email FROM users", fetch=True)
+    assert [row['email'] for row in rows] == [USER['email']]
+    assert replica.healthy
+    assert (replica.failovers, events(replica, 'failover')) == (1, failovers + 1)
+
+def test_lagging_replica_is_taken_out_and_put_back(db, replica, monkeypatch):
+    assert db.read_replica("SELECT email FROM users") is replica
+    down, up = events(replica, 'down'), events(replica, 'up')
+
+    monkeypatch.setattr(replica.backend, 'replication_lag', lambda connection: None)
+    DatabaseManager.check_replicas()
+    DatabaseManager.check_replicas()
+    assert not replica.healthy
+    assert events(replica, 'down') == down + 1
+    assert db.read_replica("SELECT email FROM users") is None
+
+    monkeypatch.setattr(replica.backend, 'replication_lag', lambda connection: 0.0)
+    DatabaseManager.check_replicas()
+    assert replica.healthy
+    assert events(replica, 'up') == up + 1
+    assert db.read_replica("SELECT email FROM users") is replica
+
+def test_workers_follow_the_checks_of_the_one_that_runs_them(db, replica, tmp_path, monkeypatch):
+    path = str(tmp_path / 'replicas.json')
+    monkeypatch.setattr(DatabaseManager, '_replica_state_path', path)
+    monkeypatch.setattr(replica.backend, 'replication_lag', lambda connection: None)
+    DatabaseManager.check_replicas()
+    with open(path) as state_file:
+        state = json.load(state_file)[replica.name]
+    assert state['healthy'] is False and state['reason'] == 'replication stopped'
+
+    # Another worker's copy of the replica, which has not been checked here
+    def publish(healthy):
+        with open(path, 'w') as state_file:
+            json.dump({replica.name: dict(state, healthy=healthy, checked_at=time.time())}, state_file)
+        monkeypatch.setattr(DatabaseManager, '_replica_state_due', 0.0)
+
+    replica.put_back()
+    publish(False)
+    assert db.read_replica("SELECT email FROM users") is None
+    publish(True)
+    assert db.read_replica("SELECT email FROM users") is replica
+
+    # A failure seen here stands until the next check
+    replica.mark_down('connection lost')
+    monkeypatch.setattr(DatabaseManager, '_replica_state_due', 0.0)
+    assert db.read_replica("SELECT email FROM users") is None
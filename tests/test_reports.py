@@ -0,0 +1,114 @@
+import json
+from datetime import date, timedelta
+from decimal import Decimal
+import pytest
+from src.catalog import fleet_catalog
+from src.config import Config
+from src.database import DatabaseManager
+from src.schemas import VehicleTypeEnum
+
+@pytest.fixture
+def memory_db(db, monkeypatch):
+    # SQLite :memory: pools a single connection, which the stream holds
+    monkeypatch.setattr(Config, 'SQLITE_PATH', ':memory:')
+    monkeypatch.setattr(Config, 'DB_POOL_TIMEOUT', 0.2)
+    assert DatabaseManager._pool is None
+    assert db.pool_stats()['size'] == 1
+    return db
+
+def test_stream_reports_vehicles_added_after_the_catalog_loaded(memory_db, make_user):
+    from src.app import create_app
+    client = create_app(services=False).test_client()
+    fleet_catalog.snapshot()
+
+    user_id = make_user()
+    memory_db.execute_query("INSERT INTO vehicles (type_id, model, year, license_plate, color) VALUES (2, 'Kia Sorento', 2024, 'NEW001', 'Green')")
+    vehicle_id = memory_db.execute_query("SELECT id FROM vehicles WHERE license_plate = 'NEW001'", fetch=True)[0]['id']
+    memory_db.execute_query(
+        "INSERT INTO bookings (id, user_id, vehicle_id, pickup_date, return_date, total_amount) VALUES (%s, %s, %s, %s, %s, %s)",
+        ('b1', user_id, vehicle_id, date.today(), date.today() + timedelta(days=1), 80))
+
+    response = client.get(f'/reports/daily?date={date.today().isoformat()}&stream=ndjson')
+    rows = [json.loads(line) for line in response.get_data(as_text=True).splitlines()]
+    assert [(row['booking_id'], row['vehicle_model'], row['vehicle_type']) for row in rows] == [('b1', 'Kia Sorento', 'suv')]
+    assert memory_db.pool_stats()['checkout_failures'] == 0
+
+def day(offset):
+    return date.today() + timedelta(days=offset)
+
+def booking(user_id, vehicle_id, pickup, ret):
+    return {'user_id': user_id, 'vehicle_id': vehicle_id, 'pickup_date': day(pickup).isoformat(), 'return_date': day(ret).isoformat()}
+
+def rollups(db):
+    # Non-empty rollup rows as {(day, vehicle type): (booking, pickup, return, revenue, in use)}
+    rows = db.execute_query("SELECT * FROM daily_booking_rollups", fetch=True)
+    return {
+        (row['rollup_date'], row['vehicle_type']): (row['booking_count'], row['pickup_count'], row['return_count'],
+                                                     Decimal(str(row['revenue'])), row['vehicles_in_use'])
+        for row in rows if row['booking_count'] or row['vehicles_in_use']
+    }
+
+def amounts(db):
+    rows = db.execute_query("SELECT vehicle_id, total_amount FROM bookings", fetch=True)
+    return {row['vehicle_id']: Decimal(str(row['total_amount'])) for row in rows}
+
+@pytest.fixture
+def booked(client, db, make_user):
+    # Vehicles 1 and 2 are small cars, 5 is an SUV
+    user_id = make_user()
+    assert client.post('/bookings', json=booking(user_id, 1, 1, 3)).status_code == 201
+    response = client.post('/bookings/batch', json={'bookings': [booking(user_id, 2, 3, 4), booking(user_id, 5, 2, 3)]})
+    assert response.status_code == 201
+    return amounts(db)
+
+def test_bookings_roll_up_by_day_and_type(db, booked):
+    assert rollups(db) == {
+        (day(1), 'small_car'): (1, 1, 0, booked[1], 1),
+        (day(2), 'small_car'): (0, 0, 0, 0, 1),
+        (day(3), 'small_car'): (2, 1, 1, booked[2], 2),
+        (day(4), 'small_car'): (1, 0, 1, 0, 1),
+        (day(2), 'suv'): (1, 1, 0, booked[5], 1),
+        (day(3), 'suv'): (1, 0, 1, 0, 1)
+    }
+
+def test_rebuild_matches_the_incremental_rollups(db, booked):
+    from src.rollups import daily_rollups
+    incremental = rollups(db)
+    db.execute_query("DELETE FROM daily_booking_rollups")
+    assert daily_rollups.rebuild(day(0), day(5)) == 6 * len(VehicleTypeEnum)
+    assert rollups(db) == incremental
+
+    # Cancelled bookings drop out of a rebuild
+    db.execute_query("UPDATE bookings SET status = 'cancelled' WHERE vehicle_id = 5")
+    daily_rollups.rebuild(day(0), day(5))
+    assert not {key for key in rollups(db) if key[1] == 'suv'}
+
+def test_summary_totals_and_utilization(client, booked):
+    fleet_size = len(fleet_catalog.snapshot().by_type['small_car'])
+    response = client.get(f'/reports/summary?from={day(1)}&to={day(4)}&vehicle_type=small_car')
+    assert response.status_code == 200
+    report = response.get_json()
+    assert [(row['date'], row['vehicles_in_use']) for row in report['days']] == [
+        (day(1).isoformat(), 1), (day(2).isoformat(), 1), (day(3).isoformat(), 2), (day(4).isoformat(), 1)
+    ]
+    assert report['days'][2]['utilization'] == round(2 / fleet_size, 4)
+
+    totals = report['totals']
+    assert (totals['booking_count'], totals['pickup_count'], totals['return_count']) == (4, 2, 2)
+    assert totals['revenue'] == float(booked[1] + booked[2])
+    assert (totals['vehicle_days'], totals['fleet_size']) == (5, fleet_size)
+    assert totals['utilization'] == round(5 / (fleet_size * 4), 4)
+
+    # Without a type, every type's rows and the whole fleet
+    totals = client.get(f'/reports/summary?from={day(1)}&to={day(4)}').get_json()['totals']
+    assert (totals['booking_count'], totals['vehicle_days']) == (6, 7)
+    assert totals['fleet_size'] == sum(len(vehicles) for vehicles in fleet_catalog.snapshot().by_type.values())
+
+def test_summary_rejects_bad_ranges(client, db):
+    for query in (f'from={day(2)}&to={day(1)}', f'from={day(0)}&to={day(366)}', f'from={day(0)}'):
+        response = client.get(f'/reports/summary?{query}')
+        assert response.status_code == 400
+        assert response.get_json()['error'] == 'Validation error'
+    response = client.get(f'/reports/summary?from=2024-13-01&to={day(1)}')
+    assert response.get_json() == {'error': 'Invalid date format. Use YYYY-MM-DD'}
+    assert client.get(f'/reports/summary?from={day(0)}&to={day(365)}').status_code == 200
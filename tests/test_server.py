@@ -0,0 +1,63 @@
+import os
+import selectors
+import socket
+import time
+from types import SimpleNamespace
+from gunicorn.glogging import Logger
+from gunicorn.workers.gthread import TConn
+from src import server
+from src.config import Config
+from src.feed import availability_feed
+from src.server import Server, Worker, elect_leader, server_options
+
+def test_options_are_accepted_by_gunicorn():
+    cfg = Server(server_options('::1', 8000, 3, reuse_port=True)).cfg
+    assert cfg.bind == ['[::1]:8000']
+    assert (cfg.workers, cfg.threads, cfg.worker_class) == (3, Config.SERVER_THREADS, Worker)
+    assert cfg.preload_app and cfg.reuse_port
+
+def test_draining_closes_idle_connections_and_streams(monkeypatch):
+    monkeypatch.setattr(availability_feed, 'closing', False)
+    cfg = Server(server_options('127.0.0.1', 8000, 1)).cfg
+    worker = Worker(1, os.getppid(), [], None, 30, cfg, Logger(cfg))
+    worker.poller = selectors.DefaultSelector()
+
+    # Two clients waiting between requests, one that has not sent its first one yet
+    clients = []
+    for conns in (worker.keepalived_conns, worker.keepalived_conns, worker.pending_conns):
+        server_side, client_side = socket.socketpair()
+        conn = TConn(cfg, server_side, ('127.0.0.1', 0), ('127.0.0.1', 8000))
+        worker.poller.register(conn.sock, selectors.EVENT_READ)
+        conns.append(conn)
+        clients.append(client_side)
+    worker.nr_conns = 4
+
+    worker.close_idle()
+    assert not worker.keepalived_conns and not worker.pending_conns
+    assert worker.nr_conns == 1
+    assert not worker.poller.get_map()
+    assert all(client.recv(1) == b'' for client in clients)
+    assert availability_feed.closing
+    worker.tmp.close()
+
+def test_one_worker_at_a_time_runs_the_singleton_services(tmp_path, monkeypatch):
+    started = []
+    monkeypatch.setattr(server, 'start_singleton_services', lambda: started.append(time.monotonic()))
+    path = str(tmp_path / 'leader.lock')
+    first, second = SimpleNamespace(), SimpleNamespace()
+
+    elect_leader(first, path)
+    while not started:
+        time.sleep(0.01)
+    elect_leader(second, path)
+    time.sleep(0.2)
+    assert len(started) == 1 and first.leader_lock is not None
+    assert not hasattr(second, 'leader_lock')
+
+    # The leader exits and the waiting worker takes over
+    first.leader_lock.close()
+    deadline = time.monotonic() + 5
+    while len(started) == 1 and time.monotonic() < deadline:
+        time.sleep(0.01)
+    assert len(started) == 2
+    second.leader_lock.close()
@@ -0,0 +1,36 @@
+import json
+import logging
+import multiprocessing
+from src.slowlog import SharedRotatingFileHandler, read_entries
+
+def write_lines(path, worker, count):
+    logger = logging.getLogger(f'test_slowlog.{worker}')
+    logger.propagate = False
+    handler = SharedRotatingFileHandler(path, maxBytes=2000, backupCount=100)
+    logger.addHandler(handler)
+    for line in range(count):
+        logger.warning(json.dumps({'worker': worker, 'line': line, 'padding': 'x' * 40}))
+    handler.close()
+
+def test_processes_share_the_rotating_log(tmp_path):
+    # Rotations by one process must not lose or split the lines of another
+    path = str(tmp_path / 'slow_queries.log')
+    context = multiprocessing.get_context('fork')
+    processes = [context.Process(target=write_lines, args=(path, worker, 200)) for worker in range(4)]
+    for process in processes:
+        process.start()
+    for process in processes:
+        process.join()
+
+    entries = list(read_entries(path))
+    assert len(entries) == 800
+    for worker in range(4):
+        assert [entry['line'] for entry in entries if entry['worker'] == worker] == list(range(200))
+    assert len(list(tmp_path.glob('slow_queries.log.*'))) > 10
+
+def test_entries_come_from_the_rotated_segments_only(tmp_path):
+    path = tmp_path / 'slow_queries.log'
+    for name, line in (('slow_queries.log', 0), ('slow_queries.log.1', 1), ('slow_queries.log.2', 2),
+                       ('slow_queries.log.10', 10), ('slow_queries.log.lock', 'lock'), ('slow_queries.log.bak', 'bak')):
+        (tmp_path / name).write_text(json.dumps({'line': line}) + '\n')
+    assert [entry['line'] for entry in read_entries(str(path))] == [10, 2, 1, 0]
@@ -0,0 +1,65 @@
+from datetime import date, datetime
+from textwrap import dedent
+from decimal import Decimal
+from src.backends.sqlite import translate_query, translate_schema
+
+def test_placeholders_and_insert_ignore():
+    assert translate_query("INSERT IGNORE INTO users (name) VALUES (%s)") == "INSERT OR IGNORE INTO users (name) VALUES (?)"
+
+def test_locking_clauses_are_dropped():
+    assert translate_query("SELECT id FROM vehicles WHERE id = %s FOR UPDATE") == "SELECT id FROM vehicles WHERE id = ?"
+    assert translate_query("SELECT 1 FROM users u FOR UPDATE OF v NOWAIT") == "SELECT 1 FROM users u"
+    assert translate_query("SELECT id FROM email_outbox LIMIT %s FOR UPDATE SKIP LOCKED") == \
+        "SELECT id FROM email_outbox LIMIT ?"
+
+def test_from_dual_and_date_functions():
+    assert translate_query("SELECT %s FROM DUAL WHERE NOT EXISTS (SELECT 1)") == "SELECT ? WHERE NOT EXISTS (SELECT 1)"
+    assert translate_query("SELECT CURDATE(), NOW()") == "SELECT DATE('now'), CURRENT_TIMESTAMP"
+
+def test_upserts():
+    query = "INSERT INTO t (k, n) VALUES (%s, %s) ON DUPLICATE KEY UPDATE n = n + VALUES(n)"
+    assert translate_query(query) == "INSERT INTO t (k, n) VALUES (?, ?) ON CONFLICT DO UPDATE SET n = n + excluded.n"
+
+def test_schema_translation():
+    statements = translate_schema(dedent("""
+    CREATE DATABASE IF NOT EXISTS x;
+    USE x;
+    CREATE TABLE t (
+        id INT PRIMARY KEY AUTO_INCREMENT,
+        status ENUM('a', 'b') DEFAULT 'a', -- comment; with a semicolon
+        updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP ON UPDATE CURRENT_TIMESTAMP
+    );
+    CREATE INDEX idx_t_status ON t(status);
+    DROP TRIGGER IF EXISTS tr;
+    DELIMITER //
+    CREATE TRIGGER tr BEFORE INSERT ON t FOR EACH ROW BEGIN SET NEW.status = 'a'; END //
+    DELIMITER ;
+    """))
+    assert len(statements) == 2
+    table, index = statements
+    assert 'INTEGER PRIMARY KEY AUTOINCREMENT' in table
+    assert "status TEXT CHECK (status IN ('a', 'b'))" in table
+    assert 'ON UPDATE' not in table
+    assert index == 'CREATE INDEX IF NOT EXISTS idx_t_status ON t(status)'
+
+def test_schema_loads_and_values_round_trip(db):
+    # Dates, timestamps and decimals come back as the MySQL driver returns them
+    db.execute_query("INSERT INTO users (name, email, phone, created_at) VALUES (%s, %s, %s, %s)",
+                     ('Round Trip', 'trip@example.com', '5550000000', datetime(2024, 5, 1, 12, 30)))
+    user = db.execute_query("SELECT * FROM users WHERE email = %s", ('trip@example.com',), fetch=True)[0]
+    assert user['created_at'] == datetime(2024, 5, 1, 12, 30)
+
+    vehicle_type = db.execute_query("SELECT daily_rate FROM vehicle_types WHERE name = 'suv'", fetch=True)[0]
+    assert vehicle_type['daily_rate'] == Decimal('80.00')
+
+    db.execute_query(
+        "INSERT INTO bookings (id, user_id, vehicle_id, pickup_date, return_date, total_amount) VALUES (%s, %s, %s, %s, %s, %s)",
+        ('b1', user['id'], 1, date(2024, 5, 2), date(2024, 5, 4), Decimal('100.00')))
+    booking = db.execute_query("SELECT pickup_date, total_amount, status FROM bookings", fetch=True)[0]
+    assert booking == {'pickup_date': date(2024, 5, 2), 'total_amount': Decimal('100.00'), 'status': 'confirmed'}
+
+def test_check_constraints_are_enforced(db):
+    # The CHECK constraints of the MySQL schema carry over, REGEXP included
+    assert db.execute_query("INSERT INTO users (name, email, phone) VALUES (%s, %s, %s)",
+                            ('Bad Email', 'not-an-email', '5550000000')) is None
+    assert db.execute_query("SELECT COUNT(*) as count FROM users", fetch=True)[0]['count'] == 0
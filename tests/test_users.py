@@ -0,0 +1,111 @@
+import json
+from datetime import datetime
+from src.routes import users
+
+def ndjson(*rows):
+    return '\n'.join(json.dumps(row) for row in rows)
+
+def user(email, name='Imported User', phone='5550000000'):
+    return {'name': name, 'email': email, 'phone': phone}
+
+def import_users(client, body):
+    response = client.post('/users/import', data=body, content_type='application/x-ndjson')
+    assert response.status_code == 200
+    return response.get_json()
+
+def test_import_reports_duplicates_per_line(client, make_user):
+    make_user('taken@example.com')
+    report = import_users(client, ndjson(
+        user('a@example.com'),
+        user('taken@example.com'),
+        user('A@example.com'),
+        {'name': 'x'}
+    ))
+    assert (report['processed'], report['created'], report['duplicates'], report['failed']) == (4, 1, 2, 1)
+    assert [(error['line'], error['error']) for error in report['errors']] == [
+        (4, 'Validation error'),
+        (3, 'Duplicate email in import'),
+        (2, 'Email already exists')
+    ]
+
+def test_rows_rejected_by_the_database_are_reported_per_line(client, db):
+    # The schema's email CHECK is stricter than the API's validation
+    report = import_users(client, ndjson(
+        user('a@example.com'),
+        user('josé@example.com'),
+        user('b@example.com')
+    ))
+    assert (report['created'], report['duplicates'], report['failed']) == (2, 0, 1)
+    assert report['errors'] == [{'line': 2, 'error': 'Failed to create user'}]
+    emails = db.execute_query("SELECT email FROM users ORDER BY email", fetch=True)
+    assert [row['email'] for row in emails] == ['a@example.com', 'b@example.com']
+
+def test_emails_inserted_concurrently_count_as_duplicates(client, db, make_user, monkeypatch):
+    # Another import commits the email between the existence check and the insert
+    execute_query = users.db.execute_query
+
+    def racing_execute_query(query, *args, **kwargs):
+        rows = execute_query(query, *args, **kwargs)
+        if query.startswith('SELECT email FROM users'):
+            make_user('raced@example.com')
+        return rows
+
+    monkeypatch.setattr(users.db, 'execute_query', racing_execute_query)
+    report = import_users(client, ndjson(user('raced@example.com'), user('a@example.com')))
+    assert (report['created'], report['duplicates'], report['failed']) == (1, 1, 0)
+    assert report['errors'] == [{'line': 1, 'error': 'Email already exists'}]
+
+def test_csv_lines_with_extra_fields_are_reported_per_line(client, db):
+    body = 'name,email,phone\nAnn Lee,ann@example.com,5551234567\nBob Roe,bob@example.com,5551234568,extra\n'
+    response = client.post('/users/import', data=body, content_type='text/csv')
+    assert response.status_code == 200
+    report = response.get_json()
+    assert (report['processed'], report['created'], report['failed']) == (2, 1, 1)
+    assert report['errors'] == [{'line': 3, 'error': 'Line has more fields than the header'}]
+    emails = db.execute_query("SELECT email FROM users", fetch=True)
+    assert [row['email'] for row in emails] == ['ann@example.com']
+
+def add_users(db, count):
+    # Pairs of users share a created_at, so pages must break ties on id
+    for i in range(count):
+        db.execute_query("INSERT INTO users (name, email, phone, created_at) VALUES (%s, %s, %s, %s)",
+                         (f'User {i}', f'user{i}@example.com', '5550000000', datetime(2024, 1, 1 + i // 2)))
+
+def test_cursor_round_trips():
+    row = {'created_at': datetime(2024, 1, 2, 3, 4, 5), 'id': 42}
+    assert users.decode_cursor(users.encode_cursor(row)) == (row['created_at'], 42)
+
+def test_keyset_pages_cover_every_user_once(client, db):
+    add_users(db, 7)
+    seen = []
+    response = client.get('/users?limit=3')
+    while True:
+        assert response.status_code == 200
+        seen.extend(user['id'] for user in response.get_json())
+        if 'X-Next-Cursor' not in response.headers:
+            break
+        assert response.headers['Link'].endswith('>; rel="next"')
+        response = client.get('/users', query_string={'limit': 3, 'cursor': response.headers['X-Next-Cursor']})
+
+    rows = db.execute_query("SELECT id FROM users ORDER BY created_at DESC, id DESC", fetch=True)
+    assert seen == [row['id'] for row in rows]
+
+def test_filters_combine_with_the_cursor(client, db):
+    add_users(db, 4)
+    response = client.get('/users?name=User&created_from=2024-01-02&limit=1')
+    assert [user['email'] for user in response.get_json()] == ['user3@example.com']
+    response = client.get('/users', query_string={'name': 'User', 'created_from': '2024-01-02', 'limit': 1,
+                                                  'cursor': response.headers['X-Next-Cursor']})
+    assert [user['email'] for user in response.get_json()] == ['user2@example.com']
+    assert 'X-Next-Cursor' not in response.headers
+
+def test_invalid_cursor_is_rejected(client, db):
+    response = client.get('/users?cursor=not-a-cursor')
+    assert response.status_code == 400
+    assert response.get_json() == {'error': 'Invalid cursor'}
+
+def test_database_failure_is_not_an_empty_page(client, monkeypatch):
+    monkeypatch.setattr(users.db, 'execute_query', lambda *args, **kwargs: None)
+    response = client.get('/users')
+    assert response.status_code == 500
+    assert 'ETag' not in response.headers
@@ -0,0 +1,94 @@
+from datetime import date, timedelta
+import pytest
+from src.catalog import fleet_catalog
+from src.occupancy import occupancy_index
+from src.versions import TableVersions, table_versions
+
+def day(offset):
+    return (date.today() + timedelta(days=offset)).isoformat()
+
+AVAILABILITY = f'/vehicles/availability?pickup_date={day(1)}&return_date={day(2)}'
+
+def booking(user_id, vehicle_id, pickup, ret):
+    return {'user_id': user_id, 'vehicle_id': vehicle_id, 'pickup_date': day(pickup), 'return_date': day(ret)}
+
+@pytest.fixture
+def index(db, monkeypatch):
+    # The routes read the process-wide index; warm it for the test and put it back after
+    for name in ('ready', 'window_start', 'bookings', 'vehicle_bookings', 'occupancy', 'digest', 'listeners'):
+        monkeypatch.setattr(occupancy_index, name, getattr(occupancy_index, name))
+    occupancy_index.listeners = []
+    occupancy_index.reconcile()
+    return occupancy_index
+
+def versions(db):
+    return table_versions.current(['bookings', 'users', 'vehicles'], primary=True)
+
+def test_revalidation_answers_304_until_a_booking_commits(client, db, make_user):
+    user_id = make_user()
+    etag = client.get(AVAILABILITY).headers['ETag']
+    assert client.get(AVAILABILITY, headers={'If-None-Match': etag}).status_code == 304
+
+    assert client.post('/bookings', json=booking(user_id, 1, 1, 2)).status_code == 201
+    response = client.get(AVAILABILITY, headers={'If-None-Match': etag})
+    assert response.status_code == 200
+    assert 1 not in [vehicle['id'] for vehicle in response.get_json()]
+
+def test_bookings_bump_versions_after_commit(client, db, make_user):
+    user_id = make_user()
+    before = versions(db)
+    assert client.post('/bookings', json=booking(user_id, 1, 1, 2)).status_code == 201
+    assert client.post('/bookings', json=booking(user_id, 1, 1, 2)).status_code == 400
+    after = versions(db)
+    assert after['bookings'] == before['bookings'] + 1
+    assert after['vehicles'] == before['vehicles']
+
+    # Same-day pickups change the vehicle's status too
+    assert client.post('/bookings', json=booking(user_id, 2, 0, 1)).status_code == 201
+    assert versions(db)['vehicles'] == before['vehicles'] + 1
+
+def test_index_backed_availability_is_tagged_without_a_query(client, index, make_user, monkeypatch):
+    user_id = make_user()
+    etag = client.get(AVAILABILITY).headers['ETag']
+
+    # The tag comes from the index, so it moves with the availability it serves
+    assert client.post('/bookings', json=booking(user_id, 1, 1, 2)).status_code == 201
+    monkeypatch.setattr(table_versions, 'current', lambda *args, **kwargs: pytest.fail('queried table_versions'))
+    response = client.get(AVAILABILITY, headers={'If-None-Match': etag})
+    assert response.status_code == 200
+    assert 1 not in [vehicle['id'] for vehicle in response.get_json()]
+    assert client.get(AVAILABILITY, headers={'If-None-Match': response.headers['ETag']}).status_code == 304
+
+def test_index_version_follows_its_contents(index):
+    empty = index.version()
+    index.add_booking('b1', 1, date.today(), date.today())
+    booked = index.version()
+    assert booked != empty
+
+    # Re-adding is a no-op, and a rebuild from the same bookings gives the same version
+    index.add_booking('b1', 1, date.today(), date.today())
+    assert index.version() == booked
+    index.reconcile()
+    assert index.version() == empty
+
+def test_catalog_changes_move_the_tag(client, db):
+    etag = client.get(AVAILABILITY).headers['ETag']
+    db.execute_query("UPDATE vehicles SET status = 'maintenance' WHERE id = 1")
+    assert client.get(AVAILABILITY, headers={'If-None-Match': etag}).status_code == 304
+
+    fleet_catalog.invalidate()
+    response = client.get(AVAILABILITY, headers={'If-None-Match': etag})
+    assert response.status_code == 200
+
+def test_watcher_calls_listeners_when_a_counter_moves(db):
+    calls = []
+    watcher = TableVersions()
+    watcher.watch('vehicles', lambda: calls.append('vehicles'))
+    watcher.watch('bookings', lambda: calls.append('bookings'))
+
+    watcher.poll()
+    watcher.poll()
+    assert calls == []
+    table_versions.bump('vehicles')
+    watcher.poll()
+    assert calls == ['vehicles']